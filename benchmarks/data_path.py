@@ -0,0 +1,151 @@
+"""Benchmarks of the query data path against a fake connection, no MySQL server needed.
+
+    python -m benchmarks.data_path [--scale full] [-k send_results] [--save]
+"""
+from typing import Any, Callable, List
+import sys
+
+from benchmarks.fake import FakeConnection, PROFILES
+from benchmarks.harness import Case, main
+from dibi import lexer
+from dibi.completion import CompletionIndex, SchemaNames
+from dibi.db import DbThread, SQLParser
+from dibi.schema import TableInfo
+
+
+def _size(rows: int) -> str:
+    if rows >= 1000000:
+        return '{}M'.format(rows // 1000000)
+    return '{}k'.format(rows // 1000)
+
+
+def _db_thread(profile: str = 'narrow-numeric', rows: int = 0) -> DbThread:
+    t = DbThread()
+    t.c = FakeConnection(profile, rows)
+    t.current_db = 'bench'
+    return t
+
+
+def send_results(profile: str, rows: int) -> Callable[[], Any]:
+    """Stream a whole result into a ResultSet, the way the grid receives it."""
+    t = _db_thread(profile, rows)
+    results: List[Any] = []
+    t.query_result.connect(results.append)
+
+    def run():
+        results.clear()
+        # LIMIT keeps the query from being paged, so every row is fetched
+        t.send_results('select * from bench limit {}'.format(rows))
+        assert len(results[-1]) == rows
+    return run
+
+
+STATEMENTS = (
+    "INSERT INTO bench (id, name, body) VALUES ({i}, 'name {i}', 'text; with -- a delimiter');",
+    "UPDATE bench SET name = \"quoted {i}\" WHERE id = {i}; -- trailing comment",
+    "/* block; comment */ SELECT * FROM `bench` WHERE id IN ({i}, {i} + 1);",
+    "DELETE FROM bench WHERE name = 'it''s {i}';",
+)
+
+
+def split_queries(statements: int) -> Callable[[], Any]:
+    t = _db_thread()
+    text = '\n'.join(STATEMENTS[i % len(STATEMENTS)].format(i=i) for i in range(statements))
+
+    def run():
+        lexer.split.cache_clear()
+        lexer.tokenize.cache_clear()
+        assert sum(1 for _ in t._split_queries(text)) == statements
+    return run
+
+
+def handle_placeholders(values: int) -> Callable[[], Any]:
+    parser = SQLParser()
+    list(parser.handle_placeholders('ids := select id from bench where created > now() - interval 1 day'))
+    query = "select * from bench_log where bench_id > $ids and kind = 'insert' -- last day"
+
+    def run():
+        queries = 0
+        for put_result, _ in parser.handle_placeholders(query):
+            if put_result is not None:
+                put_result(list(range(values)))
+            else:
+                queries += 1
+        assert queries == values
+    return run
+
+
+def flush_edits(rows: int) -> Callable[[], Any]:
+    t = _db_thread()
+    edits = [{
+        'db': 'bench',
+        'table': 'bench',
+        'record': {'id': i, 'name': 'name {}'.format(i), 'price': i * 0.25},
+        'changes': {'name': 'renamed {}'.format(i)} if i % 3 else {'price': i * 0.5, 'name': None},
+    } for i in range(rows)]
+
+    def run():
+        t.unique_keys.clear()
+        t.flush_edits(edits)
+    return run
+
+
+WORDS = ('user', 'order', 'item', 'invoice', 'event', 'account', 'payment', 'audit', 'daily', 'archive')
+COMPLETIONS = (
+    'sel', 'select * from ', 'select * from user_', 'select * from uo', 'select * from ordit',
+    'select * from aud_dai', 'select * from xyz', 'select  from user_order_1 u where u.', 'select * from bench.ev',
+)
+
+
+def complete(identifiers: int) -> Callable[[], Any]:
+    """Tab completions of table and column names in a schema with this many tables."""
+    index = CompletionIndex()
+    tables = ['{}_{}_{}'.format(WORDS[i % 10], WORDS[i // 10 % 10], i) for i in range(identifiers)]
+    index.set_schema('bench', SchemaNames({
+        table: TableInfo(table, columns=['id', 'name', 'created']) for table in tables}))
+    for text in COMPLETIONS:
+        index.complete(text, len(text), 'bench')
+
+    def run():
+        for _ in range(100 // len(COMPLETIONS) + 1):
+            for text in COMPLETIONS:
+                index.complete(text, len(text), 'bench')
+    return run
+
+
+def cases(scale: str) -> List[Case]:
+    full = scale == 'full'
+    result = []
+    for profile in PROFILES:
+        sizes = [1000, 100000]
+        if profile.startswith('narrow'):
+            sizes += [1000000] + ([10000000] if full else [])
+        elif full:
+            sizes += [1000000]
+        result += [
+            Case('send_results {} {}'.format(profile, _size(rows)), rows, 'rows',
+                 lambda profile=profile, rows=rows: send_results(profile, rows))
+            for rows in sizes
+        ]
+    result += [
+        Case('_split_queries {}'.format(_size(n)), n, 'statements', lambda n=n: split_queries(n))
+        for n in [1000, 100000] + ([1000000] if full else [])
+    ]
+    result += [
+        Case('handle_placeholders {}'.format(_size(n)), n, 'values', lambda n=n: handle_placeholders(n))
+        for n in [1000, 100000] + ([1000000] if full else [])
+    ]
+    result += [
+        Case('flush_edits {}'.format(_size(n)), n, 'rows', lambda n=n: flush_edits(n))
+        for n in [1000, 100000] + ([1000000] if full else [])
+    ]
+    result += [
+        Case('complete {}'.format(_size(n)), (100 // len(COMPLETIONS) + 1) * len(COMPLETIONS), 'completions',
+             lambda n=n: complete(n))
+        for n in [1000, 100000] + ([1000000] if full else [])
+    ]
+    return result
+
+
+if __name__ == '__main__':
+    sys.exit(main('benchmarks.data_path', 'data_path', cases))
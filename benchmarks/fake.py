@@ -0,0 +1,169 @@
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from datetime import datetime, timedelta
+
+from MySQLdb.constants import FIELD_TYPE
+
+from dibi.results import Columns, ResultSet
+
+
+BLOCK = 4096
+EPOCH = datetime(2020, 1, 1)
+WORDS = 'lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor'.split()
+
+
+def _text(length: int) -> Callable[[int], str]:
+    def value(i: int) -> str:
+        words = []
+        size = 0
+        while size < length:
+            word = WORDS[(i + len(words)) % len(WORDS)]
+            words.append(word)
+            size += len(word) + 1
+        return ' '.join(words)[:length]
+    return value
+
+
+Column = Tuple[str, int, Callable[[int], Any]]
+
+
+def _wide(kinds: Sequence[Tuple[int, Callable[[int], Any]]], width: int) -> List[Column]:
+    return [('id', FIELD_TYPE.LONGLONG, lambda i: i)] + [
+        ('c{}'.format(idx), *kinds[idx % len(kinds)]) for idx in range(1, width)
+    ]
+
+
+PROFILES: Dict[str, List[Column]] = {
+    'narrow-numeric': [
+        ('id', FIELD_TYPE.LONGLONG, lambda i: i),
+        ('quantity', FIELD_TYPE.LONG, lambda i: i % 1000),
+        ('price', FIELD_TYPE.DOUBLE, lambda i: i * 0.25),
+        ('created', FIELD_TYPE.DATETIME, lambda i: EPOCH + timedelta(seconds=i)),
+    ],
+    'narrow-text': [
+        ('id', FIELD_TYPE.LONGLONG, lambda i: i),
+        ('name', FIELD_TYPE.VAR_STRING, _text(20)),
+        ('body', FIELD_TYPE.BLOB, _text(200)),
+    ],
+    'wide-numeric': _wide([
+        (FIELD_TYPE.LONG, lambda i: i % 100000),
+        (FIELD_TYPE.DOUBLE, lambda i: i / 7),
+    ], 50),
+    'wide-text': _wide([
+        (FIELD_TYPE.VAR_STRING, _text(30)),
+        (FIELD_TYPE.VAR_STRING, lambda i: None if i % 10 == 0 else 'value {}'.format(i)),
+    ], 50),
+}
+
+
+def _description(columns: Sequence[Tuple[str, int]]) -> Tuple[Tuple, ...]:
+    return tuple((name, kind, None, None, None, None, True) for name, kind in columns)
+
+
+class FakeCursor():
+    """DB-API cursor returning a synthetic result set for every query.
+
+    Rows are cut from a pre-built block of distinct rows, so generating them
+    costs next to nothing next to the code being measured. `SHOW INDEX`
+    answers with `id` as the primary key, an UPDATE matches every row of
+    its WHERE.
+    """
+
+    def __init__(self, connection: 'FakeConnection'):
+        self.connection = connection
+        self.description: Optional[Tuple[Tuple, ...]] = None
+        self.rowcount = 0
+        self.rows: List[Tuple] = []
+        self.remaining = 0
+        self.pos = 0
+
+    def execute(self, query: str, params=None) -> int:
+        self.connection.executed += 1
+        self.pos = 0
+        if query.lower().startswith('show index'):
+            self.description = _description([
+                ('Table', FIELD_TYPE.VAR_STRING), ('Non_unique', FIELD_TYPE.LONG),
+                ('Key_name', FIELD_TYPE.VAR_STRING), ('Column_name', FIELD_TYPE.VAR_STRING),
+                ('Null', FIELD_TYPE.VAR_STRING)])
+            self.rows = [('bench', 0, 'PRIMARY', 'id', '')]
+            self.remaining = 1
+        elif query.lower().startswith(('select', 'show')):
+            self.description = self.connection.description
+            self.rows = self.connection.block
+            self.remaining = self.connection.rows
+        else:
+            self.description = None
+            self.rows = []
+            self.remaining = 0
+        self.rowcount = self.remaining
+        if query.lower().startswith('update'):
+            # Every row named by a grouped edit is found, one `(key = %s)` per row after WHERE
+            self.rowcount = query.rpartition(' WHERE ')[2].count(' OR ') + 1
+        return self.rowcount
+
+    def fetchmany(self, size: int = 1) -> List[Tuple]:
+        size = min(size, self.remaining)
+        self.remaining -= size
+        rows = self.rows
+        batch: List[Tuple] = []
+        while size:
+            chunk = rows[self.pos:self.pos + size]
+            batch += chunk
+            size -= len(chunk)
+            self.pos = (self.pos + len(chunk)) % len(rows)
+        return batch
+
+    def fetchall(self) -> List[Tuple]:
+        return self.fetchmany(self.remaining)
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def nextset(self) -> Optional[bool]:
+        return None
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self) -> 'FakeCursor':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+class FakeConnection():
+    """Connection whose cursors return `rows` rows of the named profile."""
+
+    def __init__(self, profile: str = 'narrow-numeric', rows: int = 0):
+        columns = PROFILES[profile]
+        self.description = _description([(name, kind) for name, kind, _ in columns])
+        self.block = [tuple(value(i) for _, _, value in columns) for i in range(min(rows, BLOCK) or 1)]
+        self.rows = rows
+        self.executed = 0
+
+    def cursor(self, cursor_class=None) -> FakeCursor:
+        return FakeCursor(self)
+
+    def thread_id(self) -> int:
+        return 1
+
+    def commit(self) -> None:
+        pass
+
+    def rollback(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+def fake_result(profile: str, rows: int) -> ResultSet:
+    """ResultSet holding `rows` rows of the named profile, filled the way DbThread fills it."""
+    cursor = FakeConnection(profile, rows).cursor()
+    cursor.execute('select * from bench')
+    result = ResultSet(Columns.from_description(cursor.description))
+    while True:
+        batch = cursor.fetchmany(50000)
+        if not batch:
+            return result
+        result.append(batch)
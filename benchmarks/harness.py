@@ -0,0 +1,175 @@
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+from os import path
+from time import perf_counter
+import argparse
+import gc
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tracemalloc
+
+
+class Case(NamedTuple):
+    """One benchmark: `setup` prepares its input and returns the function that is timed.
+
+    The returned function may be called several times, each call has to
+    redo the same work. It can return a dict of further metrics, like frame
+    time percentiles, which are reported from the fastest call.
+    """
+    name: str
+    items: int
+    unit: str
+    setup: Callable[[], Callable[[], Any]]
+
+
+METRICS = (
+    # key, label, higher is better
+    ('items_per_s', 'items/s', True),
+    ('peak_rss_mb', 'peak RSS MB', False),
+    ('alloc_peak_mb', 'alloc peak MB', False),
+    ('frame_p95_ms', 'p95 frame ms', False),
+)
+COLUMNS = ('items', 'unit', 'seconds', 'items_per_s', 'peak_rss_mb', 'alloc_peak_mb')
+
+MIN_TIME = 0.5
+MAX_REPEATS = 50
+
+
+def measure(case: Case, allocations: bool = True) -> Dict[str, Any]:
+    """Time a case, then trace the allocations of a separate run.
+
+    Short cases are repeated for `MIN_TIME` and the fastest run counts.
+    Peak RSS is the high-water mark of the whole process, which is why each
+    case is run in a process of its own.
+    """
+    run = case.setup()
+    seconds = float('inf')
+    total = 0.0
+    extra: Dict[str, Any] = {}
+    for _ in range(MAX_REPEATS):
+        gc.collect()
+        start = perf_counter()
+        metrics = run()
+        elapsed = perf_counter() - start
+        if elapsed < seconds:
+            seconds = elapsed
+            extra = metrics or {}
+        total += elapsed
+        if total >= MIN_TIME:
+            break
+    result = {
+        **extra,
+        'items': case.items,
+        'unit': case.unit,
+        'seconds': seconds,
+        'items_per_s': case.items / seconds if seconds else 0.0,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+    del run
+    if allocations:
+        run = case.setup()
+        gc.collect()
+        tracemalloc.start()
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        result['alloc_peak_mb'] = peak / (1 << 20)
+    return result
+
+
+def compare(result: Dict[str, Any], baseline: Optional[Dict[str, Any]], tolerance: float) -> List[str]:
+    """Metrics of a result that are more than `tolerance` worse than the baseline."""
+    if not baseline:
+        return []
+    regressions = []
+    for key, label, higher_is_better in METRICS:
+        old, new = baseline.get(key), result.get(key)
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        if (-change if higher_is_better else change) > tolerance:
+            regressions.append('{} {:+.0%}'.format(label, change))
+    return regressions
+
+
+def load_baseline(filepath: str) -> Dict[str, Any]:
+    try:
+        with open(filepath) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_baseline(filepath: str, results: Dict[str, Dict[str, Any]]) -> None:
+    os.makedirs(path.dirname(filepath), exist_ok=True)
+    with open(filepath, 'w') as f:
+        json.dump({
+            'machine': {'python': platform.python_version(), 'platform': platform.platform()},
+            'cases': results,
+        }, f, indent=2, sort_keys=True)
+
+
+def _run_isolated(module: str, name: str, scale: str, allocations: bool) -> Dict[str, Any]:
+    argv = [sys.executable, '-m', module, '--scale', scale, '--run-case', name]
+    if not allocations:
+        argv.append('--no-allocations')
+    output = subprocess.run(argv, check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def _format_row(name: str, result: Dict[str, Any], regressions: List[str]) -> str:
+    alloc = result.get('alloc_peak_mb')
+    extra = ', '.join('{} {:.1f}'.format(key, value) for key, value in result.items() if key not in COLUMNS)
+    return '{:<44} {:>10} {:>9.3f} {:>14,.0f} {:>9.1f} {:>9} {}'.format(
+        name,
+        '{:,}'.format(result['items']),
+        result['seconds'],
+        result['items_per_s'],
+        result['peak_rss_mb'],
+        '-' if alloc is None else '{:.1f}'.format(alloc),
+        '  '.join(filter(None, [extra, ('REGRESSION: ' + ', '.join(regressions)) if regressions else ''])))
+
+
+def main(module: str, suite: str, cases: Callable[[str], List[Case]], argv: Optional[List[str]] = None) -> int:
+    """Run the cases of a suite, each in its own process, and compare them to the saved baseline."""
+    default_baseline = path.join(path.dirname(__file__), 'baselines', suite + '.json')
+    parser = argparse.ArgumentParser(prog='python -m ' + module)
+    parser.add_argument('--scale', choices=('quick', 'full'), default='quick',
+                        help='full adds the largest inputs, up to 10M rows')
+    parser.add_argument('-k', dest='pattern', default='', help='only run cases containing this text')
+    parser.add_argument('--baseline', default=default_baseline, help='baseline file to compare with and save to')
+    parser.add_argument('--save', action='store_true', help='save the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='relative change flagged as regression')
+    parser.add_argument('--no-allocations', dest='allocations', action='store_false',
+                        help='skip the tracemalloc run of each case')
+    parser.add_argument('--run-case', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    by_name = {case.name: case for case in cases(args.scale)}
+    if args.run_case:
+        print(json.dumps(measure(by_name[args.run_case], args.allocations)))
+        return 0
+
+    baseline = load_baseline(args.baseline).get('cases', {})
+    results = {}
+    failed = 0
+    print('{:<44} {:>10} {:>9} {:>14} {:>9} {:>9}'.format(
+        'case', 'items', 'seconds', 'items/s', 'RSS MB', 'alloc MB'))
+    for name in by_name:
+        if args.pattern not in name:
+            continue
+        result = _run_isolated(module, name, args.scale, args.allocations)
+        regressions = compare(result, baseline.get(name), args.tolerance)
+        failed += bool(regressions)
+        results[name] = result
+        print(_format_row(name, result, regressions), flush=True)
+
+    if args.save:
+        save_baseline(args.baseline, {**baseline, **results})
+        print('Saved baseline to', args.baseline)
+    if failed:
+        print('{} case(s) regressed by more than {:.0%}'.format(failed, args.tolerance))
+    return 1 if failed and not args.save else 0
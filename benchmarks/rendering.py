@@ -0,0 +1,216 @@
+"""Benchmarks of the widgets users wait on, run headless with the offscreen Qt platform.
+
+    python -m benchmarks.rendering [--scale full] [-k scroll] [--save]
+"""
+from typing import Any, Callable, Dict, List, Optional
+from time import perf_counter
+from types import SimpleNamespace
+import os
+import sys
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from PyQt5 import QtWidgets  # noqa: E402
+
+from benchmarks.data_path import STATEMENTS  # noqa: E402
+from benchmarks.fake import fake_result  # noqa: E402
+from benchmarks.harness import Case, main  # noqa: E402
+from dibi.timing import percentile  # noqa: E402
+from dibi.ui import ConnectionTab, InputBox, TableWidget  # noqa: E402
+
+
+WIDTH, HEIGHT = 1280, 800
+FRAMES = 200
+
+app: Optional[QtWidgets.QApplication] = None
+
+
+def _app() -> QtWidgets.QApplication:
+    """The application, widgets are only painted once it has processed their show event."""
+    global app
+    if app is None:
+        app = QtWidgets.QApplication(sys.argv[:1])
+    return app
+
+
+def _table_widget() -> TableWidget:
+    _app()
+    widget = TableWidget(None)
+    widget.render()
+    widget.resize(WIDTH, HEIGHT)
+    widget.show()
+    app.processEvents()
+    return widget
+
+
+def _connection_tab() -> ConnectionTab:
+    """A connection tab whose workers drop every job, there is no connection behind it."""
+    _app()
+    tab = ConnectionTab()
+    tab.render()
+    tab.resize(WIDTH, HEIGHT)
+    tab.show()
+    app.processEvents()
+    tab.t = tab.meta = SimpleNamespace(job=SimpleNamespace(emit=lambda *args: None))
+    return tab
+
+
+def _frame_times(frames: List[float]) -> Dict[str, float]:
+    return {
+        'frame_p50_ms': percentile(frames, 0.5) * 1000,
+        'frame_p95_ms': percentile(frames, 0.95) * 1000,
+        'frame_max_ms': max(frames) * 1000,
+    }
+
+
+def set_data(profile: str, rows: int) -> Callable[[], Any]:
+    """Show a result in the grid: model reset, column sizing and the first paint."""
+    widget = _table_widget()
+    result = fake_result(profile, rows)
+
+    def run():
+        widget.set_data(result)
+        widget.viewport().repaint()
+    return run
+
+
+def scroll(profile: str, rows: int) -> Callable[[], Any]:
+    """Scroll through a loaded result a few rows per frame, painting every frame."""
+    widget = _table_widget()
+    widget.set_data(fake_result(profile, rows))
+    scrollbar = widget.verticalScrollBar()
+    step = max(1, scrollbar.maximum() // FRAMES)
+
+    def run():
+        frames = []
+        scrollbar.setValue(0)
+        for frame in range(FRAMES):
+            start = perf_counter()
+            scrollbar.setValue(frame * step)
+            widget.viewport().repaint()
+            frames.append(perf_counter() - start)
+        return _frame_times(frames)
+    return run
+
+
+def _script(size: int) -> str:
+    lines = []
+    length = 0
+    while length < size:
+        line = STATEMENTS[len(lines) % len(STATEMENTS)].format(i=len(lines))
+        lines.append(line)
+        length += len(line) + 1
+    return '\n'.join(lines)
+
+
+def load_script(size: int) -> Callable[[], Any]:
+    """Put a script into the editor and wait for the first paint of it."""
+    _app()
+    editor = InputBox(None)
+    editor.resize(WIDTH, 300)
+    editor.show()
+    app.processEvents()
+    text = _script(size)
+
+    def run():
+        editor.setPlainText(text)
+        app.processEvents()
+        editor.viewport().repaint()
+    return run
+
+
+def rehighlight(size: int) -> Callable[[], Any]:
+    """Highlight a whole script again, as after the highlighting rules change."""
+    _app()
+    editor = InputBox(None)
+    editor.setPlainText(_script(size))
+
+    def run():
+        editor.highlighter.rehighlight()
+    return run
+
+
+def tables_list(tables: int) -> Callable[[], Any]:
+    """Fill the table list of the current database for the first time and paint it."""
+    tab = _connection_tab()
+    tab.current_db = 'bench'
+    names = ['table_{:06d}'.format(i) for i in range(tables)]
+
+    def run():
+        tab.table_models = {}
+        tab.on_tables_list('bench', list(names))
+        tab.listView.repaint()
+    return run
+
+
+def switch_db(tables: int) -> Callable[[], Any]:
+    """Switch between two databases whose table lists were loaded before."""
+    tab = _connection_tab()
+    tab._dbs = ['first', 'second']
+    for db in tab._dbs:
+        tab.current_db = db
+        tab.on_tables_list(db, ['{}_{:06d}'.format(db, i) for i in range(tables)])
+
+    def run():
+        for index in (0, 1):
+            tab.on_db_selected(index)
+            tab.listView.repaint()
+    return run
+
+
+def filter_tables(tables: int) -> Callable[[], Any]:
+    """Type a filter into the table list one letter at a time, painting after each."""
+    tab = _connection_tab()
+    tab.current_db = 'bench'
+    tab.on_tables_list('bench', ['table_{:06d}'.format(i) for i in range(tables)])
+
+    def run():
+        for text in ('1', '12', '123', '1234', ''):
+            tab.table_filter.setText(text)
+            tab.listView.repaint()
+    return run
+
+
+def dbs_list(dbs: int) -> Callable[[], Any]:
+    """Fill the database selector, selecting the first database as a fresh connection does."""
+    tab = _connection_tab()
+    names = ['schema_{:05d}'.format(i) for i in range(dbs)]
+
+    def run():
+        tab.on_dbs_list(list(names))
+    return run
+
+
+def _size(n: int) -> str:
+    if n >= 1000000:
+        return '{}M'.format(n // 1000000)
+    return '{}k'.format(n // 1000)
+
+
+def cases(scale: str) -> List[Case]:
+    full = scale == 'full'
+    result = []
+    for profile in ('narrow-numeric', 'narrow-text', 'wide-text'):
+        for rows in [1000, 100000] + ([1000000] if full else []):
+            result.append(Case(
+                'set_data {} {}'.format(profile, _size(rows)), rows, 'rows',
+                lambda profile=profile, rows=rows: set_data(profile, rows)))
+        result.append(Case(
+            'scroll {} 100k'.format(profile), FRAMES, 'frames',
+            lambda profile=profile: scroll(profile, 100000)))
+    for mb in [1, 4] + ([16] if full else []):
+        result.append(Case('load_script {}MB'.format(mb), mb << 20, 'bytes', lambda mb=mb: load_script(mb << 20)))
+        result.append(Case('rehighlight {}MB'.format(mb), mb << 20, 'bytes', lambda mb=mb: rehighlight(mb << 20)))
+    for tables in [1000, 50000] + ([200000] if full else []):
+        result.append(Case(
+            'on_tables_list {}'.format(_size(tables)), tables, 'tables', lambda tables=tables: tables_list(tables)))
+        result.append(Case(
+            'switch_db {}'.format(_size(tables)), 2, 'switches', lambda tables=tables: switch_db(tables)))
+        result.append(Case(
+            'filter_tables {}'.format(_size(tables)), 5, 'filters', lambda tables=tables: filter_tables(tables)))
+    result.append(Case('on_dbs_list 10k', 10000, 'dbs', lambda: dbs_list(10000)))
+    return result
+
+
+if __name__ == '__main__':
+    sys.exit(main('benchmarks.rendering', 'rendering', cases))
@@ -0,0 +1,331 @@
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+from bisect import bisect_left
+from collections import defaultdict
+import re
+
+from dibi import lexer
+from dibi.schema import TableInfo
+
+
+KEYWORDS = [
+    'ALTER', 'AND', 'AS', 'ASC', 'BETWEEN', 'BY', 'CASE', 'COUNT', 'CREATE', 'DELETE', 'DESC', 'DESCRIBE',
+    'DISTINCT', 'DROP', 'ELSE', 'END', 'EXISTS', 'EXPLAIN', 'FROM', 'GROUP', 'HAVING', 'IN', 'INDEX', 'INNER',
+    'INSERT', 'INTO', 'IS', 'JOIN', 'LEFT', 'LIKE', 'LIMIT', 'NOT', 'NULL', 'OFFSET', 'ON', 'OR', 'ORDER',
+    'RIGHT', 'SELECT', 'SET', 'SHOW', 'TABLE', 'THEN', 'UNION', 'UPDATE', 'USE', 'USING', 'VALUES', 'WHEN',
+    'WHERE',
+]
+
+# the keyword closest before the cursor decides what is completed
+TABLE_CONTEXT = {'from', 'join', 'into', 'update', 'table', 'describe', 'desc', 'truncate'}
+COLUMN_CONTEXT = {'select', 'where', 'on', 'and', 'or', 'by', 'set', 'having', 'distinct', 'using', 'values'}
+
+# words after a table name that are not its alias
+NOT_ALIAS = {
+    'as', 'cross', 'for', 'group', 'having', 'inner', 'join', 'left', 'limit', 'lock', 'natural', 'on',
+    'order', 'outer', 'partition', 'right', 'select', 'set', 'straight_join', 'union', 'using', 'values',
+    'where', 'window',
+}
+
+BOUNDARY = re.compile(r'(?<![A-Za-z0-9])[A-Za-z0-9]|(?<=[a-z])[A-Z]|(?<=[A-Za-z])[0-9]')
+CAMEL = re.compile(r'(?<=[a-z])(?=[A-Z])|(?<=[A-Za-z])(?=[0-9])')
+WORD_HEAD = re.compile(r'(?<![a-z0-9])[a-z0-9][a-z0-9]?')
+WORD_CHARS = '_$`.'
+
+
+def boundaries(name: str) -> List[int]:
+    """Positions where the words of a name start, `user_orderItems` has three."""
+    return [m.start() for m in BOUNDARY.finditer(name)]
+
+
+class Names():
+    """Identifiers of one kind, searched by prefix on a sorted index and by subsequence.
+
+    For fuzzy search names are also indexed by their initials and by the
+    first two letters of each word. The names of each of those buckets are
+    joined by newlines, so one regex finds the subsequence matches among
+    them without a Python loop over the names.
+    """
+
+    def __init__(self, names: Iterable[str]):
+        self.names: Dict[str, str] = {}
+        for name in names:
+            self.names.setdefault(name.lower(), name)
+        self.keys = sorted(self.names)
+        self.initials: List[Tuple[str, str]] = []
+        self.word_starts: Optional[Dict[str, str]] = None
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __contains__(self, name: str) -> bool:
+        return name.lower() in self.names
+
+    def get(self, name: str) -> Optional[str]:
+        return self.names.get(name.lower())
+
+    def prefixed(self, prefix: str, limit: int) -> List[str]:
+        keys = self.keys
+        start = bisect_left(keys, prefix)
+        return [self.names[key] for key in keys[start:start + limit] if key.startswith(prefix)]
+
+    def index(self) -> 'Names':
+        """Build the indexes of fuzzy search, which takes a while for 100k names."""
+        if self.word_starts is None:
+            # words of camelCase names are split by a marker first, so all lines split the same way
+            lines = CAMEL.sub('\x01', '\n'.join(self.names.values())).lower().split('\n')
+            heads = [WORD_HEAD.findall(line) for line in lines]
+            buckets: Dict[str, List[str]] = defaultdict(list)
+            for key, key_heads in zip(self.names, heads):
+                for head in key_heads:
+                    buckets[head].append(key)
+            self.initials = sorted(zip([''.join([head[0] for head in key_heads]) for key_heads in heads], self.names))
+            self.word_starts = {head: '\n'.join(keys) for head, keys in buckets.items()}
+        return self
+
+    def rank(self, name: str, query: str) -> int:
+        """How well a lowercase query matches a name, lower is better.
+
+        0 prefix, 1 initials (`uo` for `user_orders`), 2 start of a later word,
+        3 substring, 4 any other subsequence.
+        """
+        key = name.lower()
+        if key.startswith(query):
+            return 0
+        starts = boundaries(name)
+        if ''.join(key[i] for i in starts).startswith(query):
+            return 1
+        if any(key.startswith(query, i) for i in starts):
+            return 2
+        if query in key:
+            return 3
+        return 4
+
+    def fuzzy(self, query: str, limit: int) -> List[str]:
+        """Names matching the query by initials, or as a subsequence starting at the start of a word."""
+        word_starts = self.index().word_starts or {}
+        found = []
+        start = bisect_left(self.initials, (query, ''))
+        for initials, key in self.initials[start:start + limit]:
+            if not initials.startswith(query):
+                break
+            found.append(self.names[key])
+
+        head = query[:2]
+        text = word_starts.get(head, '')
+        pattern = re.compile(re.escape(head) + ''.join(
+            '[^\n{0}]*{0}'.format(re.escape(char)) for char in query[2:]))
+        pos = 0
+        while len(found) < limit:
+            m = pattern.search(text, pos)
+            if m is None:
+                break
+            start = text.rfind('\n', 0, m.start()) + 1
+            end = text.find('\n', m.end())
+            if end < 0:
+                end = len(text)
+            found.append(self.names[text[start:end]])
+            pos = end + 1
+        return found
+
+
+class Completions(NamedTuple):
+    start: int  # position where the replaced word starts
+    matches: List[str]
+    missing_db: Optional[str] = None  # database whose tables are not loaded yet
+
+
+class SchemaNames():
+    """Completion index of the tables and columns of one database.
+
+    Building it for big schemas takes long enough to stall typing, so the
+    meta thread builds one along with every schema it loads.
+    """
+
+    def __init__(self, schema: Dict[str, TableInfo]):
+        self.schema = schema
+        self.tables = Names(schema).index()
+        self.columns = Names(column for info in schema.values() for column in info.columns).index()
+        self.table_columns: Dict[str, Names] = {}
+
+    def columns_of(self, table: str) -> Names:
+        name = self.tables.get(table)
+        if name is None:
+            return Names(())
+        if name not in self.table_columns:
+            self.table_columns[name] = Names(self.schema[name].columns)
+        return self.table_columns[name]
+
+
+class CompletionIndex():
+    """Databases, tables and columns of a connection, completed by the context of the cursor.
+
+    Tables are completed after FROM and JOIN, columns of the tables in the
+    statement after SELECT and WHERE, keywords first at the start of a
+    statement. `db.` completes the tables of `db`, `alias.` the columns of
+    the aliased table.
+    """
+
+    def __init__(self):
+        self.keywords = Names(KEYWORDS)
+        self.databases = Names(())
+        self.tables: Dict[str, Names] = {}
+        self.schemas: Dict[str, SchemaNames] = {}
+
+    def set_databases(self, dbs: Iterable[str]) -> None:
+        self.databases = Names(dbs)
+
+    def set_tables(self, db: str, tables: Iterable[str]) -> None:
+        """Tables of a database whose schema is still loading."""
+        if db not in self.schemas:
+            self.tables[db] = Names(tables)
+
+    def set_schema(self, db: str, names: SchemaNames) -> None:
+        self.schemas[db] = names
+        self.tables[db] = names.tables
+
+    def table_columns(self, db: Optional[str], table: str) -> Names:
+        schema = self.schemas.get(db or '')
+        return schema.columns_of(table) if schema is not None else Names(())
+
+    def all_columns(self, db: Optional[str]) -> Names:
+        """Columns of every table of a database, for statements without tables yet."""
+        schema = self.schemas.get(db or '')
+        return schema.columns if schema is not None else Names(())
+
+    def complete(self, text: str, pos: int, current_db: Optional[str], limit: int = 50) -> Completions:
+        statement_start = text.rfind(';', 0, pos) + 1
+        statement_end = text.find(';', pos)
+        statement = text[statement_start:statement_end if statement_end >= 0 else len(text)]
+        pos -= statement_start
+        start = pos
+        while start > 0 and (statement[start - 1].isalnum() or statement[start - 1] in WORD_CHARS):
+            start -= 1
+        word = statement[start:pos]
+        if word.startswith('`'):
+            word = word[1:]
+            start += 1
+        scope = tables_in_scope(lexer.significant(statement))
+
+        missing_db = None
+        if '.' in word:
+            qualifier, word = word.rsplit('.', 1)
+            start = pos - len(word)
+            parts = qualifier.replace('`', '').split('.')
+            current_tables = self.tables.get(current_db or '')
+            if len(parts) == 2:
+                groups = [(self.table_columns(parts[0], parts[1]), '')]
+            elif parts[0].lower() in scope:
+                db, table = scope[parts[0].lower()]
+                groups = [(self.table_columns(db or current_db, table), '')]
+            elif parts[0] in self.tables or parts[0] in self.databases:
+                groups = [(self.tables.get(parts[0]) or Names(()), ' ')]
+                if parts[0] not in self.tables:
+                    missing_db = parts[0]
+            elif current_tables is not None and parts[0] in current_tables:
+                groups = [(self.table_columns(current_db, parts[0]), '')]
+            else:
+                groups = []
+                missing_db = parts[0]
+        else:
+            tables = (self.tables.get(current_db or '') or Names(()), ' ')
+            databases = (self.databases, '')
+            keywords = (self.keywords, ' ')
+            context = statement_context(lexer.significant(statement[:start]))
+            if context == 'table':
+                groups = [tables, databases, keywords]
+            elif context == 'column':
+                columns = [
+                    (self.table_columns(db or current_db, table), '')
+                    for db, table in dict.fromkeys(scope.values())]
+                aliases = Names(scope)
+                if not scope:
+                    columns = [(self.all_columns(current_db), '')]
+                groups = columns + [(aliases, ''), keywords]
+            else:
+                groups = [keywords, tables, databases]
+
+        return Completions(statement_start + start, rank_matches(groups, word.lower(), limit), missing_db)
+
+
+def rank_matches(groups: List[Tuple[Names, str]], query: str, limit: int) -> List[str]:
+    """Best matches of all groups, by match quality, then group order, then length."""
+    ranked = []
+    for order, (names, suffix) in enumerate(groups):
+        found = names.prefixed(query, limit)
+        if query and len(found) < limit:
+            found += names.fuzzy(query, limit)
+        for name in found:
+            ranked.append((names.rank(name, query), order, len(name) if query else 0, name.lower(), name + suffix))
+    ranked.sort()
+    matches: List[str] = []
+    seen = set()
+    for *_, match in ranked:
+        if match not in seen:
+            seen.add(match)
+            matches.append(match)
+    return matches[:limit]
+
+
+def statement_context(tokens: List[lexer.Token]) -> str:
+    """'table', 'column' or '' from the last keyword of the tokens before the cursor."""
+    for token in reversed(tokens):
+        if token.kind != 'word':
+            continue
+        word = token.value.lower()
+        if word in TABLE_CONTEXT:
+            return 'table'
+        if word in COLUMN_CONTEXT:
+            return 'column'
+    return ''
+
+
+def _qualified_name(tokens: List[lexer.Token], i: int) -> Tuple[Optional[str], Optional[str], int]:
+    names: List[str] = []
+    while i < len(tokens) and tokens[i].kind in ('word', 'quoted'):
+        names.append(lexer.unquote(tokens[i]))
+        i += 1
+        if i < len(tokens) and tokens[i].value == '.' and len(names) < 2:
+            i += 1
+            if i == len(tokens):
+                # `db.` still being typed
+                return None, None, i
+        else:
+            break
+    if not names:
+        return None, None, i
+    if len(names) == 1:
+        return None, names[0], i
+    return names[0], names[1], i
+
+
+def tables_in_scope(tokens: List[lexer.Token]) -> Dict[str, Tuple[Optional[str], str]]:
+    """Tables named after FROM, JOIN, UPDATE and INTO, by lowercase alias and name, as (db, table).
+
+    Tables without a database have None for it, which `complete` reads as
+    the current database.
+    """
+    scope: Dict[str, Tuple[Optional[str], str]] = {}
+    i = 0
+    while i < len(tokens):
+        if tokens[i].kind != 'word' or tokens[i].value.lower() not in ('from', 'join', 'update', 'into'):
+            i += 1
+            continue
+        i += 1
+        while True:
+            db, table, i = _qualified_name(tokens, i)
+            if table is None:
+                break
+            alias = table
+            if i < len(tokens) and tokens[i].value.lower() == 'as':
+                i += 1
+            if i < len(tokens) and tokens[i].kind in ('word', 'quoted') \
+                    and tokens[i].value.lower() not in NOT_ALIAS:
+                alias = lexer.unquote(tokens[i])
+                i += 1
+            scope[alias.lower()] = (db, table)
+            scope.setdefault(table.lower(), (db, table))
+            if i < len(tokens) and tokens[i].value == ',':
+                i += 1
+                continue
+            break
+    return scope
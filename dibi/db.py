@@ -1,105 +1,470 @@
 import re
+import csv
+import io
 import subprocess
+import threading
 from os import path
-from typing import List, Dict, Iterator, Optional, Tuple, Union, Any
+from typing import Callable, List, Dict, Iterable, Iterator, Optional, Set, Tuple, TypeVar, Union, Any
 from collections import deque
-import json
+import heapq
+import queue
+from itertools import count
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic
 
-import sqlparse
 from PyQt5.QtCore import pyqtSignal, pyqtSlot
 from PyQt5 import QtCore
 import MySQLdb
 import MySQLdb.cursors
 import MySQLdb.connections
+from MySQLdb.constants import CLIENT, ER
 import sshtunnel
 
+from dibi import lexer, tracing
+from dibi.completion import SchemaNames
 from dibi.configuration import ConnectionInfo
+from dibi.results import Columns, ResultSet
+from dibi.schema import SchemaCache
+from dibi.script import Checkpoints, ScriptReader
+from dibi.timing import QueryTiming
 
 
 sshtunnel.SSH_TIMEOUT = 10
 
+T = TypeVar('T')
+
+
+def open_connection(connection: ConnectionInfo, host: str, port: int, **kwargs) -> MySQLdb.connections.Connection:
+    return MySQLdb.connect(
+        host=host,
+        user=connection.user,
+        password=connection.get_password(),
+        port=port,
+        **kwargs
+    )
+
 
 class SQLParser():
     @staticmethod
     def get_table_from_query(query: str) -> Union[Tuple[str, str], Tuple[None, None]]:
-        m = re.search(
-            r'from\s+`?([a-z0-9_]+)`?\.?`?([a-z0-9_]+)?`?', query, re.IGNORECASE)
-
-        if m:
-            db, table = m.groups()
-            if table is None:
-                return None, db
-            return db, table
+        tokens = lexer.significant(query)
+        for idx, token in enumerate(tokens):
+            if token.kind == 'word' and token.value.lower() == 'from':
+                return SQLParser._get_name(tokens[idx + 1:idx + 4])
         return None, None
 
     @staticmethod
     def get_db_from_use(query: str) -> Optional[str]:
-        m = re.search(r'use\s+`?([a-z0-9_]+)', query, re.IGNORECASE)
+        tokens = lexer.significant(query)
+        if len(tokens) < 2 or tokens[0].value.lower() != 'use':
+            return None
+        return SQLParser._get_name(tokens[1:2])[1]
+
+    @staticmethod
+    def _get_name(tokens: List[lexer.Token]) -> Union[Tuple[Optional[str], str], Tuple[None, None]]:
+        """Schema and name of a possibly qualified identifier at the start of `tokens`."""
+        if not tokens or tokens[0].kind not in ('word', 'quoted'):
+            return None, None
+        if len(tokens) > 2 and tokens[1].value == '.' and tokens[2].kind in ('word', 'quoted'):
+            return lexer.unquote(tokens[0]), lexer.unquote(tokens[2])
+        return None, lexer.unquote(tokens[0])
+
+    DDL_COMMANDS = ('create', 'alter', 'drop', 'rename', 'truncate')
+    DDL_OBJECTS = ('table', 'view', 'index', 'database', 'schema')
+    OTHER_OBJECTS = ('procedure', 'function', 'trigger', 'event', 'user', 'role', 'server', 'tablespace')
+
+    @staticmethod
+    def get_tables_from_ddl(query: str) -> List[Tuple[Optional[str], str]]:
+        """Tables a DDL statement changes as (db, table), a created or dropped database as (db, '')."""
+        tokens = lexer.significant(query)
+        words = [t.value.lower() if t.kind == 'word' else t.value for t in tokens]
+        if not words or words[0] not in SQLParser.DDL_COMMANDS:
+            return []
+
+        kind, pos = 'table', 1
+        if words[0] != 'truncate' or words[1:2] == ['table']:
+            for pos, word in enumerate(words[1:], 2):
+                if word in SQLParser.DDL_OBJECTS:
+                    kind = word
+                    break
+                if word in SQLParser.OTHER_OBJECTS or word in ('(', 'as'):
+                    return []
+            else:
+                return []
+        if words[pos:pos + 2] == ['if', 'exists']:
+            pos += 2
+        elif words[pos:pos + 3] == ['if', 'not', 'exists']:
+            pos += 3
+
+        if kind in ('database', 'schema'):
+            _, name = SQLParser._get_name(tokens[pos:pos + 1])
+            return [] if name is None else [(name, '')]
+        if kind == 'index':
+            if 'on' not in words[pos:]:
+                return []
+            pos = words.index('on', pos) + 1
+
+        tables: List[Tuple[Optional[str], str]] = []
+        while pos < len(tokens):
+            db, name = SQLParser._get_name(tokens[pos:pos + 3])
+            if name is None:
+                break
+            tables.append((db, name))
+            pos += 1 if db is None else 3
+            if words[0] == 'rename' and words[pos:pos + 1] == ['to']:
+                pos += 1
+            elif words[0] in ('drop', 'rename') and kind != 'index' and words[pos:pos + 1] == [',']:
+                pos += 1
+            else:
+                break
+        return tables
+
+    @staticmethod
+    def is_pageable(query: str) -> bool:
+        words = {t.value.lower() for t in lexer.significant(query) if t.kind == 'word'}
+        return lexer.first_word(query) == 'select' and not words & {'limit', 'into', 'for', 'lock'}
+
+    @staticmethod
+    def get_seek_parts(query: str) -> Optional[Tuple[str, Optional[str], str, Optional[str]]]:
+        """Split a single table SELECT into (select ... from, db, table, where condition)."""
+        query = lexer.strip_trailing_comments(query)
+        tokens = lexer.significant(query)
+        words = {t.value.lower() for t in tokens if t.kind == 'word'}
+        if words & {'distinct', 'join', 'union', 'group', 'order', 'having',
+                    'count', 'sum', 'avg', 'min', 'max', 'group_concat'}:
+            return None
+        if any(t.value == '(' and n.value.lower() == 'select' for t, n in zip(tokens, tokens[1:])):
+            return None
+        m = re.match(
+            r'\s*(select\s.+?\sfrom\s+(?:`?([a-z0-9_]+)`?\.)?`?([a-z0-9_]+)`?)(?:\s+where\s+(.+?))?\s*$',
+            query, re.IGNORECASE | re.DOTALL)
         if not m:
             return None
-        return m.groups()[0]
+        head, db, table, where = m.groups()
+        return head, db, table, where
 
     @staticmethod
     def get_shell_cmd_for_pipe(query: str) -> str:
-        return '-- !'.join(query.split('-- !')[1:])
+        return lexer.split(query)[1]
 
     def __init__(self):
         self.variables = {}
 
     def handle_placeholders(self, query: str):
-        q, = sqlparse.parse(query)
-        b = [i for i in q if not i.is_whitespace]
-        if len(b) > 2 and b[1].value == ':=':
-            self.variables[b[0].value] = self._token_str(b[2:])
-            b = b[2:]
+        tokens = lexer.tokenize(query.strip())
+        words = [idx for idx, t in enumerate(tokens) if t.kind not in lexer.SKIPPED]
+        if len(words) > 2 and tokens[words[0]].kind == 'word' and tokens[words[1]].kind == 'assign':
+            name = tokens[words[0]].value
+            tokens = tokens[words[2]:]
+            self.variables[name] = self._token_str(tokens)
 
-        placeholders = self._get_placeholders(b)
+        placeholders = self._get_placeholders(tokens)
 
         if not placeholders:
-            yield None, self._token_str(b)
+            yield None, self._token_str(tokens)
             return
 
         cache: Dict[str, List[Any]] = {}
 
         for placeholder in placeholders:
-            if placeholder not in cache and placeholder in self.variables:
-                def put_result(results: List[Any]):
+            if placeholder not in cache:
+                def put_result(results: List[Any], placeholder=placeholder):
                     cache[placeholder] = results
                 yield put_result, self.variables[placeholder]
 
         for key, values in cache.items():
             for value in values:
-                yield None, ' '.join(
-                    str(self._replace_placeholder(i, key, value))
-                    for i in b)
+                yield None, ''.join(
+                    str(self._replace_placeholder(t, key, value))
+                    for t in tokens)
+
+    PREDICATE_CLAUSES = frozenset(('where', 'on', 'having'))
+    CLAUSES = PREDICATE_CLAUSES | frozenset(('select', 'from', 'set', 'values', 'update', 'group', 'order', 'limit'))
+
+    def get_set_placeholders(self, query: str) -> List[str]:
+        """Variables of a query that are only compared as `= $name` or `in ($name)` in a WHERE, ON or HAVING.
+
+        These can be replaced by a subquery, so the query runs once instead of
+        once per value. One name per placeholder in the query, in order, empty
+        when any variable is used in another way.
+        """
+        tokens = lexer.significant(query)
+        names: List[str] = []
+        for idx, token in enumerate(tokens):
+            if token.kind != 'placeholder' or token.value[1:] not in self.variables:
+                continue
+            if not (self._is_equal_placeholder(tokens, idx) or self._is_in_placeholder(tokens, idx)):
+                return []
+            if not self._in_predicate(tokens, idx):
+                return []
+            names.append(token.value[1:])
+        return names
 
-    def _token_str(self, statements: List[sqlparse.sql.Statement]) -> str:
-        return ' '.join(str(t) for t in statements)
+    @staticmethod
+    def _is_equal_placeholder(tokens: List[lexer.Token], idx: int) -> bool:
+        return idx > 0 and tokens[idx - 1].value == '=' and (idx < 2 or tokens[idx - 2].value not in '<>!')
 
-    def _get_placeholders(self, statements: List[sqlparse.sql.Statement]):
+    @staticmethod
+    def _is_in_placeholder(tokens: List[lexer.Token], idx: int) -> bool:
+        return (
+            1 < idx < len(tokens) - 1 and tokens[idx - 1].value == '('
+            and tokens[idx - 2].value.lower() == 'in' and tokens[idx + 1].value == ')')
+
+    @classmethod
+    def _in_predicate(cls, tokens: List[lexer.Token], idx: int) -> bool:
+        """Whether the clause around a token is a condition, skipping the parenthesized parts before it."""
+        depth = 0
+        for token in reversed(tokens[:idx]):
+            if token.value == ')':
+                depth += 1
+            elif token.value == '(':
+                depth = max(depth - 1, 0)
+            elif not depth and token.kind == 'word' and token.value.lower() in cls.CLAUSES:
+                return token.value.lower() in cls.PREDICATE_CLAUSES
+        return False
+
+    def replace_set_placeholders(self, query: str, subqueries: List[str]) -> str:
+        """Replace the placeholders found by get_set_placeholders by one subquery each, in order."""
+        tokens = list(lexer.tokenize(query))
+        remaining = iter(subqueries)
+        for idx, token in enumerate(tokens):
+            if token.kind != 'placeholder' or token.value[1:] not in self.variables:
+                continue
+            subquery = next(remaining)
+            previous = next(i for i in range(idx - 1, -1, -1) if tokens[i].kind not in lexer.SKIPPED)
+            if tokens[previous].value == '=':
+                tokens[previous] = lexer.Token('word', 'IN')
+                subquery = '({})'.format(subquery)
+            tokens[idx] = lexer.Token('word', subquery)
+        return self._token_str(tokens)
+
+    def _token_str(self, tokens: Tuple[lexer.Token, ...]) -> str:
+        return ''.join(t.value for t in tokens)
+
+    def _get_placeholders(self, tokens: Tuple[lexer.Token, ...]) -> List[str]:
         r = []
-        for s in statements:
-            if str(s.ttype) == 'Token.Name.Placeholder' and s.value[1:] in self.variables.keys():
-                r.append(s.value[1:])
+        for t in tokens:
+            if t.kind == 'placeholder' and t.value[1:] in self.variables and t.value[1:] not in r:
+                r.append(t.value[1:])
         return r
 
-    def _replace_placeholder(self, statement: sqlparse.sql.Statement, name: str, value: Any):
-        if str(statement.ttype) == 'Token.Name.Placeholder' and statement.value[1:] == name:
+    def _replace_placeholder(self, token: lexer.Token, name: str, value: Any):
+        if token.kind == 'placeholder' and token.value[1:] == name:
             return value
-        return str(statement)
+        return token.value
+
+
+def grouped_update_query(db: str, table: str, key: List[str], rows: List[Tuple[Tuple, Dict[str, Any]]]) -> Tuple[str, tuple]:
+    """One UPDATE for many rows, each column set by a CASE on the unique key of the row.
+
+    MySQL assigns the columns left to right and later CASEs see the values
+    assigned before them, so edited key columns come last and are matched
+    by the values they have by then.
+    """
+    columns: List[str] = []
+    for _, changes in rows:
+        columns += [c for c in changes if c not in columns]
+    columns = [c for c in columns if c not in key] + [k for k in key if k in columns]
+
+    match = '({})'.format(' AND '.join('`{}` = %s'.format(k) for k in key))
+    current = [list(key_values) for key_values, _ in rows]
+    assignments = []
+    params: List[Any] = []
+    for column in columns:
+        cases = []
+        for values, (_, changes) in zip(current, rows):
+            if column in changes:
+                cases.append('WHEN {} THEN %s'.format(match))
+                params += values + [changes[column]]
+        assignments.append('`{0}` = CASE {1} ELSE `{0}` END'.format(column, ' '.join(cases)))
+        if column in key:
+            position = key.index(column)
+            for values, (_, changes) in zip(current, rows):
+                if column in changes:
+                    values[position] = changes[column]
+
+    for key_values, _ in rows:
+        params += list(key_values)
+
+    query = 'UPDATE `{}`.`{}` SET {} WHERE {}'.format(
+        db, table, ', '.join(assignments), ' OR '.join([match] * len(rows)))
+    return query, tuple(params)
+
+
+class BatchSizer():
+    first = 100
+    minimum = 500
+    maximum = 50000
+    interval = 0.25
+
+    def __init__(self):
+        self.size = self.first
+
+    def update(self, rows: int, elapsed: float) -> int:
+        if rows and elapsed > 0:
+            self.size = int(min(self.maximum, max(self.minimum, rows / elapsed * self.interval)))
+        return self.size
+
+
+def keyset_condition(key: List[str], values: Tuple) -> Tuple[str, tuple]:
+    """Rows after `values` in key order, as `a > x OR (a = x AND b > y)` which can use the index."""
+    conditions = []
+    params: List[Any] = []
+    for idx, column in enumerate(key):
+        conditions.append('({})'.format(' AND '.join(
+            ['`{}` = %s'.format(k) for k in key[:idx]] + ['`{}` > %s'.format(column)])))
+        params += list(values[:idx + 1])
+    return ' OR '.join(conditions), tuple(params)
+
+
+class Page():
+    """Position of a paged SELECT.
+
+    Pages seek past the last key seen when the unique key of the table is
+    known and returned by the query, so every page costs the same. Other
+    queries page with OFFSET.
+    """
+
+    size = 1000
+
+    def __init__(self, query: str, params=None, where: Optional[str] = None, key: Optional[List[str]] = None):
+        query = lexer.strip_trailing_comments(query)
+        if params is None:
+            query = query.replace('%', '%%')
+            where = where and where.replace('%', '%%')
+        self.query = query
+        self.params = tuple(params or ())
+        self.where = where
+        self.key = key or []
+        self.seek = bool(self.key)
+        self.last: Optional[Tuple] = None
+        self.offset = 0
+        self.done = False
+        self.result = ResultSet()
+        self.prefetched: List[Tuple] = []
+
+    def next_query(self) -> Tuple[str, tuple]:
+        query = self.query
+        params = self.params
+        conditions = ['({})'.format(self.where)] if self.where else []
+        if self.seek and self.last is not None:
+            condition, values = keyset_condition(self.key, self.last)
+            conditions.append('({})'.format(condition))
+            params += values
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        if self.key:
+            query += ' ORDER BY ' + ', '.join('`{}`'.format(k) for k in self.key)
+        query += ' LIMIT {}'.format(self.size)
+        if not self.seek and self.offset:
+            query += ' OFFSET {}'.format(self.offset)
+        return query, params
+
+    def advance(self, columns: Columns, rows: List[Tuple]) -> None:
+        self.offset += len(rows)
+        if not self.seek or not rows:
+            return
+        try:
+            positions = [columns.index[k] for k in self.key]
+        except KeyError:
+            self.seek = False
+            return
+        self.last = tuple(rows[-1][idx] for idx in positions)
+
+
+class ShellPipe():
+    """Rows written as CSV to the stdin of a shell command.
+
+    Writes block while the pipe is full, so rows are read from the server
+    only as fast as the command consumes them. Output of the command is
+    drained on a separate thread and kept up to `output_limit` bytes.
+    """
+
+    output_limit = 64 * 1024
+    progress_interval = 1.0
+
+    def __init__(self, cmd: str):
+        self.process = subprocess.Popen(
+            cmd, shell=True, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer, lineterminator='\n')
+        self.output = bytearray()
+        self.truncated = False
+        self.rows = 0
+        self.bytes = 0
+        self.started = monotonic()
+        self.reported = self.started
+        self.reader = threading.Thread(target=self._read_output, daemon=True)
+        self.reader.start()
+
+    def _read_output(self) -> None:
+        while True:
+            chunk = self.process.stdout.read1(io.DEFAULT_BUFFER_SIZE)
+            if not chunk:
+                return
+            room = self.output_limit - len(self.output)
+            if len(chunk) > room:
+                self.truncated = True
+            self.output += chunk[:max(room, 0)]
+
+    def write(self, rows: List[Tuple]) -> None:
+        self.writer.writerows(rows)
+        data = self.buffer.getvalue().encode('utf-8')
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        self.process.stdin.write(data)
+        self.rows += len(rows)
+        self.bytes += len(data)
+
+    def progress_due(self) -> bool:
+        now = monotonic()
+        if now - self.reported < self.progress_interval:
+            return False
+        self.reported = now
+        return True
+
+    def progress(self) -> str:
+        elapsed = max(monotonic() - self.started, 1e-6)
+        return 'Piped {} rows, {:.1f} MB ({:.0f} rows/s)'.format(
+            self.rows, self.bytes / 1e6, self.rows / elapsed)
+
+    def close(self) -> Tuple[int, str]:
+        try:
+            self.process.stdin.close()
+        except BrokenPipeError:
+            pass
+        returncode = self.process.wait()
+        self.reader.join()
+        output = self.output.decode('utf-8', 'replace')
+        if self.truncated:
+            output += '\n... (output truncated)'
+        return returncode, output
 
 
 class DbThread(QtCore.QObject):
-    db_list_updated = pyqtSignal(list, str)
-    table_list_updated = pyqtSignal(list)
     error = pyqtSignal(str)
     info = pyqtSignal(str)
-    query_result = pyqtSignal(list)
+    query_result = pyqtSignal(object)
+    query_result_batch = pyqtSignal(object, int)
     execute = pyqtSignal(str, tuple)
     use_db = pyqtSignal(str)
     running_query = pyqtSignal(bool)
-    running_query = pyqtSignal(bool)
     ready_to_connect = pyqtSignal()
+    connected = pyqtSignal(int, str, int)
+    schema_changed = pyqtSignal(str, str)
+    committed = pyqtSignal()
+    has_more = pyqtSignal(object, bool)
+    timed = pyqtSignal(object)
+
+    EDITS_BATCH = 500
+
+    BATCHED = frozenset((
+        'insert', 'update', 'delete', 'replace', 'create', 'alter', 'drop', 'truncate', 'rename',
+        'set', 'use', 'grant', 'revoke', 'lock', 'unlock', 'start', 'begin', 'commit', 'rollback',
+        'savepoint', 'release',
+    ))
+    BATCH_STATEMENTS = 500
+    BATCH_BYTES = 1 << 20
 
     connection: Optional[ConnectionInfo] = None
     tunnel_server: Optional[sshtunnel.SSHTunnelForwarder]
@@ -113,10 +478,19 @@ class DbThread(QtCore.QObject):
     def __init__(self):
         super().__init__()
         self.queue: deque = deque([])
-        self.table_cache: Dict[str, List[str]] = {}
         self.c = None
         self.is_ready = False
         self.tunnel_server = None
+        self.current_db: Optional[str] = None
+        self.current_table: Optional[str] = None
+        self.unique_keys: Dict[Tuple[str, str], List[Tuple[List[str], bool]]] = {}
+        self.page: Optional[Page] = None
+        self.queued = 0.0
+        self.trace = 0
+        self.timing: Optional[QueryTiming] = None
+        self.checkpoints = Checkpoints()
+        self.stop_script = threading.Event()
+        self.nesting = 0
         self.variables: Dict[str, List[Tuple]] = {}
         self.sql_parser = SQLParser()
         self.destroyed.connect(self.disconnect)
@@ -124,8 +498,17 @@ class DbThread(QtCore.QObject):
     @pyqtSlot(str, str, int, dict)
     @pyqtSlot(str, str, str, dict)
     def enqueue(self, request_type, param_a, param_b=None, more=None):
+        self.queued = (more or {}).get('queued', 0.0)
+        self.trace = (more or {}).get('trace', 0)
         try:
-            self.process(request_type, param_a, param_b, more)
+            with tracing.span('DbThread.enqueue', request=request_type):
+                tracing.flow('query', self.trace, 't')
+                self.process(request_type, param_a, param_b, more)
+        except MySQLdb.OperationalError as err:
+            if err.args[0] == ER.QUERY_INTERRUPTED:
+                self.info.emit('Query cancelled')
+                return
+            self.error.emit(str(err))
         except Exception as err:
             self.error.emit(str(err))
 
@@ -139,6 +522,7 @@ class DbThread(QtCore.QObject):
         self.is_ready = True
         self.ready_to_connect.emit()
 
+    @tracing.traced('DbThread.connect_to_info')
     def connect_to_info(self, connection: ConnectionInfo):
         self.running_query.emit(True)
         self.disconnect()
@@ -150,26 +534,27 @@ class DbThread(QtCore.QObject):
                 ssh_pkey=path.expanduser('~/.ssh/id_rsa'),
                 remote_bind_address=(connection.host, connection.port))
             try:
-                self.tunnel_server.start()
+                with tracing.span('ssh tunnel'):
+                    self.tunnel_server.start()
             except Exception as err:
                 self.error.emit(str(err))
                 return
 
+        host = connection.host if self.tunnel_server is None else '127.0.0.1'
+        port = connection.port if self.tunnel_server is None else self.tunnel_server.local_bind_port
         try:
-            self.c = MySQLdb.connect(
-                host=connection.host if self.tunnel_server is None else '127.0.0.1',
-                user=connection.user,
-                password=connection.get_password(),
-                port=connection.port if self.tunnel_server is None else self.tunnel_server.local_bind_port,
-                cursorclass=MySQLdb.cursors.DictCursor
-            )
+            with tracing.span('open_connection'):
+                # FOUND_ROWS makes UPDATE report the rows it matched, which flush_edits checks
+                self.c = open_connection(
+                    connection, host, port,
+                    client_flag=CLIENT.MULTI_STATEMENTS | CLIENT.MULTI_RESULTS | CLIENT.FOUND_ROWS)
         except Exception as err:
             self.error.emit(str(err))
             return
         self.connection = connection
         self.info.emit(str(f'Connected to: {connection}.'))
         self.running_query.emit(False)
-        self.job.emit('db_list', '', '', {})
+        self.connected.emit(self.c.thread_id(), host, port)
         self.run_query('SET SESSION TRANSACTION ISOLATION LEVEL READ UNCOMMITTED')
 
     def disconnect(self):
@@ -187,6 +572,7 @@ class DbThread(QtCore.QObject):
 
         print('Disconnected')
 
+    @tracing.traced('DbThread.process')
     def process(self, request_type: str, params: str, extra, more) -> None:
         if request_type == 'disconnect':
             self.disconnect()
@@ -204,83 +590,98 @@ class DbThread(QtCore.QObject):
         elif request_type == 'table_contents':
             self.send_results('show columns in `{}`'.format(params))
 
-        elif request_type == 'table_list':
-            self._get_table_list(params)
+        elif request_type == 'use':
+            self._use_db(params)
 
         elif request_type == 'table_data':
             self.send_results('select * from `{}`'.format(params))
 
-        elif request_type == 'db_list':
-            if self.connection is None:
-                return
-            self.db_list_updated.emit(self.get_db_list(), self.connection.label)
+        elif request_type == 'next_page':
+            self.next_page(params)
 
         elif request_type == 'get_reference':
-            self.get_reference(column=params, value=extra)
+            self.get_reference(column=params, value=extra, target=more)
 
         elif request_type == 'commit':
+            self.flush_edits(more.get('edits') or [])
             self.c.commit()
+            self.committed.emit()
 
         elif request_type == 'rollback':
             self.c.rollback()
 
-        elif request_type == 'update':
-            self.update_record(record=more, column_name=params, value=json.loads(extra))
+        elif request_type == 'run_script':
+            self.run_script(params, bool(more.get('resume')))
 
         else:
             print('unknown request_type', request_type)
 
-    def update_record(self, record, column_name, value):
-        if not self.current_table:
-            raise RuntimeError('No table selected to update {}'.format(column_name))
-
-        rows = self.run_query('show index from `{}` where non_unique = false or key_name="primary"'.format(self.current_table))
-
-        index = []
-        for row in rows:
-            if row['Key_name'].lower() == 'primary':
-                index.append(row['Column_name'])
+    def unique_key(self, db: str, table: str, not_null: bool = False) -> List[str]:
+        """Columns of the primary key, or else of the first unique index without nullable columns.
 
-        if not index:
-            name = None
-            for row in rows:
-                if name is None:
-                    name = row['Key_name']
-                if row['Key_name'].lower() == name:
-                    index.append(row['Column_name'])
-
-        if not index:
-            raise RuntimeError('Could not find unique index to update {}'.format(column_name))
+        NULLs are not unique and never match `=` or `>`, so a unique index
+        with a nullable column is only used when there is no other one, and
+        never with `not_null`, as for seeking past a position.
+        """
+        try:
+            indexes = self.unique_keys[(db, table)]
+        except KeyError:
+            indexes = self.unique_keys[(db, table)] = self._unique_indexes(db, table)
+
+        for columns, nullable in sorted(indexes, key=lambda index: index[1]):
+            if not (nullable and not_null):
+                return columns
+        raise RuntimeError('Could not find unique index to update `{}`.`{}`'.format(db, table))
+
+    def _unique_indexes(self, db: str, table: str) -> List[Tuple[List[str], bool]]:
+        """Columns of each unique index, primary key first, and whether any of them is nullable."""
+        cursor = self.run_query('show index from `{}`.`{}` where non_unique = false or key_name="primary"'.format(db, table))
+        columns = Columns.from_description(cursor.description)
+        key_name, column, null = columns.index['Key_name'], columns.index['Column_name'], columns.index['Null']
+
+        indexes: Dict[str, Tuple[List[str], bool]] = {}
+        for row in cursor.fetchall():
+            index, nullable = indexes.get(row[key_name], ([], False))
+            indexes[row[key_name]] = index + [row[column]], nullable or row[null] == 'YES'
+        return [index for name, index in indexes.items() if name.lower() == 'primary'] + [
+            index for name, index in indexes.items() if name.lower() != 'primary']
+
+    def flush_edits(self, edits: List[dict]):
+        if not edits:
+            return
 
-        query = 'update `{}` set `{}` = %s where {}'.format(
-            self.current_table, column_name, ' AND '.join([
-                '`{}` = %s'.format(i) for i in index
-            ]))
-        params = (value,) + tuple([record[i] for i in index])
-        self.run_query(query, params)
+        tables: Dict[Tuple[str, str], List[dict]] = {}
+        for edit in edits:
+            tables.setdefault((edit['db'], edit['table']), []).append(edit)
 
-    def _get_table_list(self, db):
+        self.run_query('SAVEPOINT dibi_edits')
+        try:
+            for (db, table), rows in tables.items():
+                key = self.unique_key(db, table)
+                for start in range(0, len(rows), self.EDITS_BATCH):
+                    batch = [
+                        (tuple(row['record'][k] for k in key), row['changes'])
+                        for row in rows[start:start + self.EDITS_BATCH]
+                    ]
+                    cursor = self.run_query(*grouped_update_query(db, table, key, batch))
+                    missing = len({key_values for key_values, _ in batch}) - cursor.rowcount
+                    if missing > 0:
+                        raise RuntimeError(
+                            '{} of {} edited rows of `{}`.`{}` were not found, nothing was committed'
+                            .format(missing, len(batch), db, table))
+        except Exception:
+            self.run_query('ROLLBACK TO SAVEPOINT dibi_edits')
+            raise
+        self.run_query('RELEASE SAVEPOINT dibi_edits')
+
+    def _use_db(self, db):
         self.run_query('use `{}`'.format(db))
         self.current_db = db
         self.use_db.emit(db)
-        try:
-            self.table_list_updated.emit(self.table_cache[db])
-            return
-        except KeyError:
-            pass
-
-        tables = [list(row.values())[0]
-                  for row in self.run_query('show tables')]
-        self.table_cache[db] = tables
-        self.table_list_updated.emit(tables)
 
     def _prepare_query(self, query):
-        if query[:3].lower() == 'use':
-            self.current_db = SQLParser.get_db_from_use(query)
-            self.use_db.emit(self.current_db)
-
-        elif query[:6].lower() == 'select':
-            query += ' LIMIT 100'
+        """Note the table a statement reads, called right before it runs."""
+        if lexer.first_word(query) == 'select':
             db, table = SQLParser.get_table_from_query(query)
             if db:
                 self.current_db = db
@@ -289,69 +690,349 @@ class DbThread(QtCore.QObject):
 
         return query
 
+    def _ran_query(self, query: str):
+        """Follow the database a statement switched to, called once it ran."""
+        if lexer.first_word(query) == 'use':
+            self.current_db = SQLParser.get_db_from_use(query)
+            self.use_db.emit(self.current_db)
+
     def _split_queries(self, queries: str) -> Iterator[str]:
-        # queries = queries.split('-- ')[0]
-        for query in sqlparse.split(queries):
-            if query[-1] == ';':
-                query = query[:-1]
-            if not query.strip():
-                continue
-            query = self._prepare_query(query)
+        statements, _ = lexer.split(queries)
+        for query in statements:
             if not query:
                 continue
 
             yield query
 
+    @tracing.traced('DbThread.send_results')
     def send_results(self, text, params=None):
-        columns: Tuple = tuple()
-        query_result: List[Tuple] = list()
-        for query in self._split_queries(text):
+        self.timing = QueryTiming(text, queued=self.queued, trace=self.trace)
+        if self.queued:
+            self.timing.wait = monotonic() - self.queued
+        try:
+            self._send_or_pipe_results(text, params)
+        finally:
+            self.timing = None
+
+    def _send_or_pipe_results(self, text, params=None):
+        cmd_to_pipe = SQLParser.get_shell_cmd_for_pipe(text)
+        if not cmd_to_pipe:
+            self._send_results(text, params)
+            return
+
+        pipe = ShellPipe(cmd_to_pipe)
+        try:
+            self._send_results(text, params, pipe)
+        except BrokenPipeError:
+            pass
+        finally:
+            returncode, output = pipe.close()
+        if output:
+            self.info.emit(output)
+        self.info.emit(pipe.progress())
+        if returncode:
+            self.error.emit(f'`{cmd_to_pipe.strip()}` exited with status {returncode}')
+        self._timed(pipe.rows, pipe.bytes)
+
+    def _timed(self, rows: int, size: int):
+        timing = self.timing
+        if timing is None:
+            return
+        timing.rows = rows
+        timing.bytes = size
+        self.timing = None
+        self.timed.emit(timing)
+
+    def _emit_result(self, result: ResultSet):
+        with tracing.span('DbThread.query_result'):
+            if self.timing is not None:
+                result.timing = self.timing
+                self.timing.emitted = monotonic()
+                tracing.flow('query', self.timing.trace, 't')
+            self.query_result.emit(result)
+
+    def _append(self, result: ResultSet, rows: List[Tuple], offset: int = 0):
+        start = monotonic()
+        with tracing.span('ResultSet.append', rows=len(rows)):
+            result.append(rows, offset)
+        if self.timing is not None:
+            self.timing.convert += monotonic() - start
+
+    def _send_results(self, text, params=None, pipe: Optional[ShellPipe] = None):
+        result = ResultSet()
+        sent = False
+        self.page = None
+        queries = list(self._split_queries(text))
+        groups = self._batches(queries) if params is None else ([q] for q in queries)
+        for group in groups:
+            if len(group) > 1:
+                self.run_batch(group, lambda idx: self._statement_done(group[idx], log=True))
+                continue
+
+            query = self._prepare_query(group[0])
+            substituted = False
+            query = self._materialize_placeholders(query)
             for put_result, query in self.sql_parser.handle_placeholders(str(query)):
-                c = iter(self.run_query(query, params))
                 if put_result is not None:
-                    put_result([next(iter(r.values())) for r in c if r])
+                    substituted = True
+                    put_result([
+                        r[0]
+                        for _, batch in self.stream_query(query, params)
+                        for r in batch if r
+                    ])
                     continue
 
-                try:
-                    first_row = next(c)
-                except StopIteration:
-                    self.query_result.emit([])
+                if len(queries) == 1 and not substituted and pipe is None and SQLParser.is_pageable(query):
+                    self.send_pages(self._page_for(query, params))
                     return
-                returned_columns = tuple(first_row.keys())
-
-                pad: Tuple = tuple()
-                if columns != returned_columns:
-                    pad = len(columns) * (None,)
-                    columns += returned_columns
 
-                first_row_values = tuple(first_row.values())
-                rest_values = [tuple(r.values()) for r in c]
-                results = ([pad + first_row_values] +
-                           [pad + r for r in rest_values])
+                offset: Optional[int] = None
+                for returned_columns, batch in self.stream_query(query, params):
+                    if pipe is not None:
+                        pipe.write(batch)
+                        if pipe.progress_due():
+                            self.info.emit(pipe.progress())
+                        continue
+
+                    if offset is None:
+                        offset = 0
+                        if result.columns != returned_columns:
+                            offset = result.add_columns(returned_columns)
+                        if result.table is None:
+                            db, result.table = SQLParser.get_table_from_query(query)
+                            result.db = db or self.current_db
+
+                    self._append(result, batch, offset)
+                    if not sent:
+                        self._emit_result(result)
+                        sent = True
+                    else:
+                        self.query_result_batch.emit(result, len(result))
+
+                self._statement_done(query)
+
+        if pipe is None and not sent:
+            self._emit_result(result)
+        if pipe is None:
+            self._timed(len(result), result.nbytes())
+
+    def _materialize_placeholders(self, query: str) -> str:
+        """Store the variables a query compares against in temporary tables and select from those instead.
+
+        A temporary table can only be named once in a statement, so each
+        placeholder gets a table of its own, copied from the first one of
+        its variable. The query is left to the per-value path when the
+        tables cannot be created, as on a read-only server.
+        """
+        if self.current_db is None or '$' not in query:
+            return query
+        names = self.sql_parser.get_set_placeholders(query)
+        if not names:
+            return query
+
+        subqueries = []
+        created: Dict[str, str] = {}
+        try:
+            for idx, name in enumerate(names):
+                table = '`{}`.`dibi_var_{}_{}`'.format(self.current_db, name, idx)
+                source = created.get(name)
+                self.run_query('DROP TEMPORARY TABLE IF EXISTS {}'.format(table))
+                self.run_query('CREATE TEMPORARY TABLE {} AS {}'.format(
+                    table, self.sql_parser.variables[name] if source is None else 'SELECT * FROM ' + source))
+                created.setdefault(name, table)
+                column = self.run_query('SELECT * FROM {} LIMIT 0'.format(table)).description[0][0]
+                subqueries.append('SELECT `{}` FROM {}'.format(column, table))
+        except MySQLdb.Error as err:
+            if err.args and err.args[0] == ER.QUERY_INTERRUPTED:
+                raise
+            self.info.emit('Running the query once per value, the variables could not be stored: {}'.format(err))
+            return query
+        return self.sql_parser.replace_set_placeholders(query, subqueries)
+
+    def _statement_done(self, query: str, log: bool = False):
+        if log:
+            self.execute.emit(query, ())
+        self._ran_query(query)
+        for db, table in SQLParser.get_tables_from_ddl(query):
+            db = db or self.current_db or ''
+            self.unique_keys = {
+                k: v for k, v in self.unique_keys.items()
+                if k != (db, table) and (table or k[0] != db)
+            }
+            self.schema_changed.emit(db, table)
+
+    def _batches(self, items: Iterable[T], text: Callable[[T], str] = str) -> Iterator[List[T]]:
+        """Group consecutive statements that return no rows, to be sent in one round trip."""
+        batch: List[T] = []
+        size = 0
+        for item in items:
+            query = text(item)
+            if lexer.first_word(query) not in self.BATCHED or (self.sql_parser.variables and '$' in query):
+                if batch:
+                    yield batch
+                    batch, size = [], 0
+                yield [item]
+                continue
+            if batch and (len(batch) >= self.BATCH_STATEMENTS or size + len(query) > self.BATCH_BYTES):
+                yield batch
+                batch, size = [], 0
+            batch.append(item)
+            size += len(query)
+        if batch:
+            yield batch
+
+    def run_batch(self, queries: List[str], done: Callable[[int], None]):
+        """Run statements as one multi-statement query.
+
+        Each statement's result is reached with nextset(), `done` is called
+        with its index once it succeeded. An error is raised from the
+        execute or nextset() call of the statement that failed, the server
+        skips the statements after it.
+        """
+        cursor = self.c.cursor()
+        self._running(True)
+        idx = 0
+        try:
+            with tracing.span('execute batch', statements=len(queries)):
+                cursor.execute('\n;\n'.join(queries))
+            for idx in range(len(queries)):
+                if idx:
+                    cursor.nextset()
+                done(idx)
+        except MySQLdb.Error:
+            self.info.emit('Failed: {}'.format(queries[idx][:500]))
+            raise
+        finally:
+            try:
+                cursor.close()
+            except MySQLdb.Error:
+                pass
+            self._running(False)
 
-                query_result += results
+    def _page_for(self, query: str, params=None) -> Page:
+        parts = SQLParser.get_seek_parts(query)
+        if parts is None:
+            return Page(query, params)
 
-        cmd_to_pipe = SQLParser.get_shell_cmd_for_pipe(text)
-        if cmd_to_pipe:
+        head, db, table, where = parts
+        try:
+            key = self.unique_key(db or self.current_db or '', table, not_null=True)
+        except (RuntimeError, MySQLdb.Error):
+            return Page(query, params)
+        return Page(head, params, where, key)
+
+    def _read_page(self, page: Page) -> Iterator[Tuple[Columns, List[Tuple]]]:
+        fetched = 0
+        for columns, batch in self.stream_query(*page.next_query()):
+            page.advance(columns, batch)
+            fetched += len(batch)
+            yield columns, batch
+        page.done = fetched < page.size
+
+    def send_pages(self, page: Page):
+        self.page = page
+        result = page.result
+        sent = False
+        for columns, batch in self._read_page(page):
+            if not sent:
+                result.add_columns(columns)
+                db, result.table = SQLParser.get_table_from_query(page.query)
+                result.db = db or self.current_db
+            self._append(result, batch)
+            if not sent:
+                self._emit_result(result)
+                sent = True
+            else:
+                self.query_result_batch.emit(result, len(result))
+
+        if not sent:
+            self._emit_result(result)
+        self._timed(len(result), result.nbytes())
+        self.prefetch()
+
+    def prefetch(self):
+        """Read the page after the one on screen, so scrolling to it does not wait for the server."""
+        page = self.page
+        if page is None:
+            return
+        rows: List[Tuple] = []
+        if not page.done:
+            for _, batch in self._read_page(page):
+                rows += batch
+        page.prefetched = rows
+        self.has_more.emit(page.result, bool(rows))
+
+    def next_page(self, result_id: str):
+        page = self.page
+        if page is None or str(id(page.result)) != result_id or not page.prefetched:
+            return
+        rows, page.prefetched = page.prefetched, []
+        page.result.append(rows)
+        self.query_result_batch.emit(page.result, len(page.result))
+        self.prefetch()
+
+    def run_script(self, script: str, resume: bool = False):
+        """Run a script file statement by statement, saving a checkpoint to resume from when it stops."""
+        reader = ScriptReader(script, self.checkpoints.get(script) if resume else None)
+        checkpoint = reader.start
+        if checkpoint.statement:
+            self.info.emit(f'Resuming {script} at statement {checkpoint.statement + 1}')
+
+        self.stop_script.clear()
+        started = reported = monotonic()
+        self._running(True)
+        try:
+            for group in self._batches(reader, lambda item: item[1].text):
+                if self.stop_script.is_set():
+                    raise RuntimeError('Script stopped')
+                if len(group) == 1:
+                    index, statement = group[0]
+                    self._run_script_statement(self._prepare_query(statement.text))
+                    self._statement_done(statement.text)
+                    checkpoint = reader.checkpoint(index, statement)
+                else:
+                    def done(idx: int, group=group):
+                        nonlocal checkpoint
+                        self._statement_done(group[idx][1].text)
+                        checkpoint = reader.checkpoint(*group[idx])
+                    self.run_batch([s.text for _, s in group], done)
+                if monotonic() - reported >= 1:
+                    reported = monotonic()
+                    self.checkpoints.save(script, checkpoint)
+                    self.info.emit(self._script_progress(reader, checkpoint.statement - reader.start.statement, started))
+        except Exception:
+            self.checkpoints.save(script, checkpoint)
             self.info.emit(
-                subprocess.check_output(
-                    cmd_to_pipe,
-                    shell=True,
-                    text=True,
-                    input='\n'.join([','.join([str(c) for c in r]) for r in query_result])
-                )
-            )
+                f'Stopped before statement {checkpoint.statement + 1} of {script}, run it again to resume')
+            raise
+        finally:
+            self._running(False)
 
-        self.query_result.emit([columns] + query_result)
+        self.checkpoints.clear(script)
+        self.info.emit('Finished ' + self._script_progress(reader, checkpoint.statement - reader.start.statement, started))
 
-    def get_db_list(self):
-        return [
-            db['Database']
-            for db in self.run_query('show databases')
-            if db['Database'] not in ('information_schema', 'mysql', 'performance_schema')
-        ]
+    def _run_script_statement(self, query: str):
+        cursor = self.c.cursor(MySQLdb.cursors.SSCursor)
+        try:
+            cursor.execute(query)
+            if cursor.description:
+                while cursor.fetchmany(BatchSizer.maximum):
+                    pass
+        finally:
+            cursor.close()
+
+    def _script_progress(self, reader: ScriptReader, statements: int, started: float) -> str:
+        elapsed = max(monotonic() - started, 1e-6)
+        return '{}: {} statements, {:.1f} of {:.1f} MB ({:.0f} statements/s)'.format(
+            reader.script, statements, reader.bytes_read / 1e6, reader.size / 1e6, statements / elapsed)
+
+    def get_reference(self, column, value, target=None):
+        if target:
+            self.send_results(
+                'select * from `{}`.`{}` where `{}` = %s'
+                .format(target['schema'], target['table'], target['column']), (value, ))
+            return
 
-    def get_reference(self, column, value):
         c = self.run_query(
             '''
 SELECT table_name, column_name, referenced_table_name, referenced_column_name
@@ -369,11 +1050,16 @@ AND column_name = %s''',
         if row is None:
             raise RuntimeError('Error finding reference')
 
+        _, _, referenced_table, referenced_column = row
         self.send_results(
             'select * from `{}` where `{}` = %s'
-            .format(
-                row['referenced_table_name'], row['referenced_column_name']
-            ), (value, ))
+            .format(referenced_table, referenced_column), (value, ))
+
+    def _running(self, running: bool):
+        """Report whether a query runs, once for nested calls like the batches of a script."""
+        self.nesting += 1 if running else -1
+        if self.nesting == int(running):
+            self.running_query.emit(running)
 
     def run_query(self, query: str, params=None):
 
@@ -382,9 +1068,373 @@ AND column_name = %s''',
             return
 
         with self.c.cursor() as cursor:
-            self.running_query.emit(True)
+            self._running(True)
             self.execute.emit(query, params or ())
-            cursor.execute(query, params)
-            self.running_query.emit(False)
+            try:
+                cursor.execute(query, params)
+            finally:
+                self._running(False)
+
+            return cursor
+
+    def stream_query(self, query: str, params=None) -> Iterator[Tuple[Columns, List[Tuple]]]:
+        if self.c is None:
+            self.error.emit('No connection')
+            return
+
+        cursor = self.c.cursor(MySQLdb.cursors.SSCursor)
+        try:
+            self._running(True)
+            self.execute.emit(query, params or ())
+            start = monotonic()
+            with tracing.span('execute', query=query[:200]):
+                cursor.execute(query, params)
+            if self.timing is not None:
+                self.timing.execute += monotonic() - start
+
+            columns = Columns.from_description(cursor.description)
+            sizer = BatchSizer()
+            while True:
+                start = monotonic()
+                with tracing.span('fetchmany', size=sizer.size):
+                    rows = cursor.fetchmany(sizer.size)
+                elapsed = monotonic() - start
+                if self.timing is not None:
+                    self.timing.fetch += elapsed
+                if not rows:
+                    return
+                sizer.update(len(rows), elapsed)
+                yield columns, list(rows)
+        finally:
+            try:
+                cursor.close()
+            except MySQLdb.Error:
+                pass
+            self._running(False)
+
+
+class QueryKiller(QtCore.QObject):
+    error = pyqtSignal(str)
+    info = pyqtSignal(str)
+    kill = pyqtSignal(int, str, int)
+
+    c: Optional[MySQLdb.connections.Connection]
+
+    def __init__(self, connection: ConnectionInfo):
+        super().__init__()
+        self.connection = connection
+        self.c = None
+        self.kill.connect(self.kill_query)
+        self.destroyed.connect(self.disconnect)
+
+    @pyqtSlot(int, str, int)
+    def kill_query(self, thread_id: int, host: str, port: int):
+        try:
+            self._kill(thread_id, host, port)
+        except MySQLdb.OperationalError:
+            self.disconnect()
+            try:
+                self._kill(thread_id, host, port)
+            except Exception as err:
+                self.error.emit(str(err))
+        except Exception as err:
+            self.error.emit(str(err))
+
+    def _kill(self, thread_id: int, host: str, port: int):
+        if self.c is None:
+            self.c = open_connection(self.connection, host, port, connect_timeout=5, autocommit=True)
+        with self.c.cursor() as cursor:
+            cursor.execute('KILL QUERY %s', (thread_id, ))
+        self.info.emit(f'Sent KILL QUERY {thread_id}')
+
+    def disconnect(self):
+        if self.c is None:
+            return
+        try:
+            self.c.close()
+        except MySQLdb.Error:
+            pass
+        self.c = None
+
+
+class ConnectionPool():
+    """Connections running queries in parallel, kept open between calls.
+
+    Connections still running a query when the pool is closed are closed
+    once they are returned.
+    """
+
+    def __init__(self, connect, size: int = 4):
+        self.connect = connect
+        self.idle: queue.Queue = queue.Queue()
+        self.executor = ThreadPoolExecutor(max_workers=size)
+        self.lock = threading.Lock()
+        self.closed = False
+
+    def run_queries(self, queries: List[Tuple[str, tuple]]) -> List[Tuple[Columns, List[Tuple]]]:
+        return list(self.executor.map(lambda q: self._run(*q), queries))
+
+    def _run(self, query: str, params: tuple) -> Tuple[Columns, List[Tuple]]:
+        try:
+            c = self.idle.get_nowait()
+        except queue.Empty:
+            c = self.connect()
+
+        try:
+            with c.cursor() as cursor:
+                cursor.execute(query, params)
+                return Columns.from_description(cursor.description), list(cursor.fetchall())
+        except MySQLdb.OperationalError:
+            c.close()
+            c = None
+            raise
+        finally:
+            if c is not None:
+                self._release(c)
+
+    def _release(self, c):
+        with self.lock:
+            if not self.closed:
+                self.idle.put(c)
+                return
+        try:
+            c.close()
+        except MySQLdb.Error:
+            pass
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+        self.executor.shutdown(wait=False)
+        while not self.idle.empty():
+            try:
+                self.idle.get_nowait().close()
+            except MySQLdb.Error:
+                pass
+
+
+class MetaThread(QtCore.QObject):
+    PRIORITY_INTERACTIVE = 0
+    PRIORITY_BROWSE = 1
+    PRIORITY_BACKGROUND = 2
+
+    DETAILS_BATCH = 500
+    REFERENCING_LIMIT = 1000
+
+    db_list_updated = pyqtSignal(list, str)
+    table_list_updated = pyqtSignal(str, list)
+    schema_loaded = pyqtSignal(str, object)
+    names_loaded = pyqtSignal(str, object)
+    query_result = pyqtSignal(object)
+    error = pyqtSignal(str)
+    info = pyqtSignal(str)
+
+    job = pyqtSignal(int, str, str, dict)
+
+    c: Optional[MySQLdb.connections.Connection]
+
+    def __init__(self, connection: ConnectionInfo):
+        super().__init__()
+        self.connection = connection
+        self.c = None
+        self.queue: List[Tuple[int, int, str, str, dict]] = []
+        self.order = count()
+        self.scheduled = False
+        self.schema = SchemaCache(connection.label)
+        self.refreshed: Set[str] = set()
+        self.names: Dict[str, SchemaNames] = {}
+        self.pool: Optional[ConnectionPool] = None
+        self.job.connect(self.enqueue)
+        self.destroyed.connect(self.disconnect)
 
+    @pyqtSlot(int, str, str, dict)
+    def enqueue(self, priority: int, request_type: str, params: str, more: dict):
+        heapq.heappush(self.queue, (priority, next(self.order), request_type, params, more))
+        if not self.scheduled:
+            self.scheduled = True
+            QtCore.QTimer.singleShot(0, self.drain)
+
+    def drain(self):
+        self.scheduled = False
+        if not self.queue:
+            return
+        _, _, request_type, params, more = heapq.heappop(self.queue)
+        try:
+            self.process(request_type, params, more)
+        except Exception as err:
+            self.error.emit(str(err))
+
+        if self.queue and not self.scheduled:
+            self.scheduled = True
+            QtCore.QTimer.singleShot(0, self.drain)
+
+    def process(self, request_type: str, params: str, more: dict) -> None:
+        if request_type == 'connect':
+            self.connect_to(more['host'], more['port'])
+
+        elif self.c is None:
+            self.error.emit('No metadata connection')
+
+        elif request_type == 'db_list':
+            self.db_list_updated.emit(self.get_db_list(), self.connection.label)
+
+        elif request_type == 'table_list':
+            self.table_list_updated.emit(params, self.get_table_list(params))
+
+        elif request_type == 'refresh':
+            self.refresh_schema(params)
+
+        elif request_type == 'load_details':
+            self.load_details(params)
+
+        elif request_type == 'referencing_rows':
+            self.get_referencing_rows(more['refs'], more['value'])
+
+        elif request_type == 'invalidate':
+            self.schema.invalidate(params, more.get('table') or None)
+            self.refreshed.discard(params)
+            self.refresh_schema(params)
+
+        elif request_type == 'table_contents':
+            cursor = self.run_query('show columns from `{}` from `{}`'.format(params, more['db']))
+            result = ResultSet(Columns.from_description(cursor.description))
+            result.append(cursor.fetchall())
+            self.query_result.emit(result)
+
+        else:
+            print('unknown request_type', request_type)
+
+    @tracing.traced('MetaThread.connect_to')
+    def connect_to(self, host: str, port: int):
+        self.disconnect()
+        self.c = self.open_read_only(host, port)
+        self.pool = ConnectionPool(lambda: self.open_read_only(host, port))
+        self.schema.load()
+        self.refreshed = set()
+        self.enqueue(self.PRIORITY_BROWSE, 'db_list', '', {})
+
+    def open_read_only(self, host: str, port: int) -> MySQLdb.connections.Connection:
+        c = open_connection(self.connection, host, port, autocommit=True)
+        try:
+            with c.cursor() as cursor:
+                cursor.execute('SET SESSION TRANSACTION READ ONLY')
+        except MySQLdb.Error:
+            c.close()
+            raise
+        return c
+
+    def disconnect(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool = None
+        if self.c is None:
+            return
+        try:
+            self.c.close()
+        except MySQLdb.Error:
+            pass
+        self.c = None
+
+    def run_query(self, query: str, params=None):
+        with self.c.cursor() as cursor:
+            cursor.execute(query, params)
             return cursor
+
+    def get_db_list(self) -> List[str]:
+        return [
+            db
+            for db, in self.run_query('show databases')
+            if db not in ('information_schema', 'mysql', 'performance_schema')
+        ]
+
+    def get_table_list(self, db: str) -> List[str]:
+        if self.schema.tables(db) is None:
+            self.refresh_tables(db)
+            self.enqueue(self.PRIORITY_BACKGROUND, 'load_details', db, {})
+        elif db not in self.refreshed:
+            self.enqueue(self.PRIORITY_BACKGROUND, 'refresh', db, {})
+
+        self.emit_schema(db)
+        return self.schema.tables(db) or []
+
+    def emit_schema(self, db: str):
+        """Send the schema of a database along with its completion index, rebuilt when the schema changed."""
+        schema = self.schema.schema(db)
+        self.schema_loaded.emit(db, schema)
+        if schema is None:
+            return
+        if db not in self.names or self.names[db].schema is not schema:
+            with tracing.span('SchemaNames', db=db):
+                self.names[db] = SchemaNames(schema)
+        self.names_loaded.emit(db, self.names[db])
+
+    def refresh_tables(self, db: str) -> List[str]:
+        self.refreshed.add(db)
+        return self.schema.update_tables(db, self.run_query(
+            'SELECT TABLE_NAME, CREATE_TIME FROM information_schema.TABLES '
+            'WHERE TABLE_SCHEMA = %s ORDER BY TABLE_NAME', (db, )))
+
+    def refresh_schema(self, db: str):
+        tables = self.schema.tables(db)
+        self.refresh_tables(db)
+        if self.schema.tables(db) == tables:
+            self.load_details(db)
+            return
+
+        self.table_list_updated.emit(db, self.schema.tables(db) or [])
+        if not self.load_details(db):
+            self.schema.save()
+            self.emit_schema(db)
+
+    def load_details(self, db: str) -> bool:
+        stale = [
+            name for name, info in (self.schema.schema(db) or {}).items()
+            if not info.loaded
+        ]
+        if not stale:
+            return False
+
+        where, params = 'TABLE_SCHEMA = %s', [db]
+        if len(stale) < self.DETAILS_BATCH:
+            where += ' AND TABLE_NAME IN ({})'.format(', '.join(['%s'] * len(stale)))
+            params += stale
+
+        self.schema.update_details(
+            db,
+            self.run_query(
+                'SELECT TABLE_NAME, COLUMN_NAME, COLUMN_TYPE FROM information_schema.COLUMNS '
+                'WHERE {} ORDER BY TABLE_NAME, ORDINAL_POSITION'.format(where), params),
+            self.run_query(
+                'SELECT TABLE_NAME, INDEX_NAME, NON_UNIQUE, COLUMN_NAME FROM information_schema.STATISTICS '
+                'WHERE {} ORDER BY TABLE_NAME, INDEX_NAME, SEQ_IN_INDEX'.format(where), params),
+            self.run_query(
+                'SELECT TABLE_NAME, COLUMN_NAME, REFERENCED_TABLE_SCHEMA, REFERENCED_TABLE_NAME, REFERENCED_COLUMN_NAME '
+                'FROM information_schema.KEY_COLUMN_USAGE '
+                'WHERE {} AND REFERENCED_TABLE_NAME IS NOT NULL'.format(where), params),
+            stale)
+        self.schema.save()
+        self.emit_schema(db)
+        return True
+
+    def get_referencing_rows(self, refs: List[List[str]], value: str):
+        if self.pool is None:
+            return
+        results = self.pool.run_queries([
+            (
+                'select * from `{}`.`{}` where `{}` = %s limit {}'
+                .format(schema, table, column, self.REFERENCING_LIMIT),
+                (value, )
+            )
+            for schema, table, column in refs
+        ])
+
+        result = ResultSet()
+        for (schema, table, _), (columns, rows) in zip(refs, results):
+            if not rows:
+                continue
+            offset = result.add_columns(Columns(
+                tuple(f'{table}.{name}' for name in columns.names), columns.types))
+            result.append(rows, offset)
+        self.info.emit('Found {} referencing rows in {} tables'.format(
+            len(result), sum(1 for _, rows in results if rows)))
+        self.query_result.emit(result)
@@ -0,0 +1,260 @@
+from typing import Any, Dict, List, Optional, Tuple
+from datetime import date, datetime
+import csv
+import json
+import os
+import threading
+from time import monotonic
+
+from PyQt5.QtCore import pyqtSignal, pyqtSlot
+from PyQt5 import QtCore
+import MySQLdb
+import MySQLdb.cursors
+from MySQLdb.constants import ER, FIELD_TYPE, FLAG
+
+from dibi.configuration import ConnectionInfo
+from dibi.db import BatchSizer, open_connection
+from dibi.results import Columns
+
+
+pyarrow_supported = False
+try:
+    import pyarrow
+    import pyarrow.ipc
+    pyarrow_supported = True
+except Exception:
+    pass
+
+
+class CsvWriter():
+    extension = '.csv'
+
+    def __init__(self, filepath: str, columns: Columns):
+        self.f = open(filepath, 'w', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.f)
+        self.writer.writerow(columns.names)
+
+    def write(self, rows: List[Tuple]) -> None:
+        self.writer.writerows(map(_decoded, rows))
+
+    def tell(self) -> int:
+        return self.f.tell()
+
+    def close(self) -> None:
+        self.f.close()
+
+
+def _decoded(row: Tuple) -> Tuple:
+    """A row with bytes decoded as utf-8 as in JSON Lines, instead of written as b'' reprs."""
+    if bytes not in map(type, row):
+        return row
+    return tuple(v.decode('utf-8', 'replace') if type(v) is bytes else v for v in row)
+
+
+def _json_value(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, bytes):
+        return value.decode('utf-8', 'replace')
+    return str(value)
+
+
+class JsonLinesWriter():
+    extension = '.jsonl'
+
+    def __init__(self, filepath: str, columns: Columns):
+        self.f = open(filepath, 'w', encoding='utf-8')
+        self.names = columns.names
+
+    def write(self, rows: List[Tuple]) -> None:
+        names = self.names
+        self.f.write(''.join(
+            json.dumps(dict(zip(names, row)), default=_json_value, ensure_ascii=False) + '\n'
+            for row in rows))
+
+    def tell(self) -> int:
+        return self.f.tell()
+
+    def close(self) -> None:
+        self.f.close()
+
+
+ARROW_TYPES = {
+    FIELD_TYPE.TINY: 'int64',
+    FIELD_TYPE.SHORT: 'int64',
+    FIELD_TYPE.LONG: 'int64',
+    FIELD_TYPE.INT24: 'int64',
+    FIELD_TYPE.LONGLONG: 'int64',
+    FIELD_TYPE.YEAR: 'int64',
+    FIELD_TYPE.FLOAT: 'float64',
+    FIELD_TYPE.DOUBLE: 'float64',
+    FIELD_TYPE.DATE: 'date32',
+    FIELD_TYPE.NEWDATE: 'date32',
+    FIELD_TYPE.DATETIME: 'timestamp',
+    FIELD_TYPE.TIMESTAMP: 'timestamp',
+    FIELD_TYPE.TIME: 'duration',
+}
+
+
+class ArrowWriter():
+    """Arrow IPC file with column types taken from the result description.
+
+    Unsigned integers are stored as uint64. Text and blob columns share a
+    MySQL type, they are stored as binary when the first value seen is
+    bytes. Decimals are kept exact as strings.
+    """
+
+    extension = '.arrow'
+
+    def __init__(self, filepath: str, columns: Columns):
+        self.filepath = filepath
+        self.columns = columns
+        self.sink = None
+        self.writer = None
+        self.schema = None
+
+    def _arrow_type(self, column_type: Optional[int], flags: int, values: Tuple) -> Any:
+        kind = ARROW_TYPES.get(column_type)
+        if kind == 'int64':
+            return pyarrow.uint64() if flags & FLAG.UNSIGNED else pyarrow.int64()
+        if kind == 'float64':
+            return pyarrow.float64()
+        if kind == 'date32':
+            return pyarrow.date32()
+        if kind == 'timestamp':
+            return pyarrow.timestamp('us')
+        if kind == 'duration':
+            return pyarrow.duration('us')
+        first = next((v for v in values if v is not None), None)
+        if isinstance(first, bytes):
+            return pyarrow.binary()
+        return pyarrow.string()
+
+    def _values(self, values: Tuple, arrow_type: Any) -> List[Any]:
+        if arrow_type == pyarrow.string():
+            return [v if v is None or isinstance(v, str) else _json_value(v) for v in values]
+        return list(values)
+
+    def _open(self, values: List[Tuple]) -> None:
+        self.schema = pyarrow.schema([
+            (name, self._arrow_type(column_type, flags, column))
+            for name, column_type, flags, column in zip(
+                self.columns.names, self.columns.types, self.columns.flags, values or [()] * len(self.columns))
+        ])
+        self.sink = pyarrow.OSFile(self.filepath, 'wb')
+        self.writer = pyarrow.ipc.new_file(self.sink, self.schema)
+
+    def write(self, rows: List[Tuple]) -> None:
+        values = list(zip(*rows))
+        if self.schema is None:
+            self._open(values)
+        self.writer.write_batch(pyarrow.record_batch([
+            pyarrow.array(self._values(column, field.type), type=field.type)
+            for column, field in zip(values, self.schema)
+        ], schema=self.schema))
+
+    def tell(self) -> int:
+        return self.sink.tell() if self.sink is not None else 0
+
+    def close(self) -> None:
+        if self.writer is None:
+            self._open([])
+        self.writer.close()
+        self.sink.close()
+
+
+WRITERS = {
+    writer.extension: writer
+    for writer in (CsvWriter, JsonLinesWriter) + ((ArrowWriter, ) if pyarrow_supported else ())
+}
+
+
+class ExportThread(QtCore.QObject):
+    """Streams a query from its own connection straight into a file.
+
+    Rows never reach the grid and only one batch is held in memory. The
+    file is written next to the target and renamed into place when the
+    export finishes, so a cancelled export leaves nothing behind.
+    """
+
+    error = pyqtSignal(str)
+    info = pyqtSignal(str)
+    connected = pyqtSignal(int)
+    progress = pyqtSignal(int, int)
+    finished = pyqtSignal(str, int)
+
+    job = pyqtSignal(str, str, dict)
+
+    progress_interval = 0.5
+
+    def __init__(self, connection: ConnectionInfo):
+        super().__init__()
+        self.connection = connection
+        self.cancelled = threading.Event()
+        self.job.connect(self.export)
+
+    def cancel(self) -> None:
+        self.cancelled.set()
+
+    @pyqtSlot(str, str, dict)
+    def export(self, query: str, filepath: str, more: Dict[str, Any]):
+        self.cancelled.clear()
+        writer_class = WRITERS.get(os.path.splitext(filepath)[1].lower())
+        if writer_class is None:
+            self.error.emit('Can not export to {}, supported formats: {}'.format(
+                filepath, ', '.join(WRITERS)))
+            self.finished.emit(filepath, 0)
+            return
+
+        tmp = filepath + '.part'
+        rows = 0
+        try:
+            rows = self._export(query.strip().rstrip(';'), tmp, writer_class, more)
+            if self.cancelled.is_set():
+                self.info.emit('Export cancelled')
+            else:
+                os.replace(tmp, filepath)
+                self.info.emit(f'Exported {rows} rows to {filepath}')
+        except MySQLdb.OperationalError as err:
+            if err.args[0] == ER.QUERY_INTERRUPTED:
+                self.info.emit('Export cancelled')
+            else:
+                self.error.emit(str(err))
+        except Exception as err:
+            self.error.emit(str(err))
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            self.finished.emit(filepath, rows)
+
+    def _export(self, query: str, filepath: str, writer_class, more: Dict[str, Any]) -> int:
+        c = open_connection(
+            self.connection, more['host'], more['port'], **({'db': more['db']} if more.get('db') else {}))
+        try:
+            self.connected.emit(c.thread_id())
+            cursor = c.cursor(MySQLdb.cursors.SSCursor)
+            cursor.execute(query)
+            writer = writer_class(filepath, Columns.from_description(cursor.description, cursor.description_flags))
+            try:
+                return self._write_rows(cursor, writer)
+            finally:
+                writer.close()
+        finally:
+            c.close()
+
+    def _write_rows(self, cursor, writer) -> int:
+        sizer = BatchSizer()
+        rows = 0
+        reported = monotonic()
+        while not self.cancelled.is_set():
+            start = monotonic()
+            batch = cursor.fetchmany(sizer.size)
+            if not batch:
+                break
+            sizer.update(len(batch), monotonic() - start)
+            writer.write(batch)
+            rows += len(batch)
+            if monotonic() - reported >= self.progress_interval:
+                reported = monotonic()
+                self.progress.emit(rows, writer.tell())
+        return rows
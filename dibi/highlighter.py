@@ -46,16 +46,98 @@ syntaxhighlighter.py
 #############################################################################
 """
 
-from PyQt5.QtCore import Qt, QRegExp
+from typing import Dict, Iterable, Optional
+from time import monotonic
+import re
+
+from PyQt5.QtCore import Qt, QTimer
 from PyQt5.QtGui import (QTextCharFormat, QColor, QFont, QSyntaxHighlighter)
 
 
+# Block states, a comment or string left open at the end of a line
+# continues on the next one. PENDING marks blocks whose state is known
+# but that are not formatted yet.
+NORMAL, COMMENT, SINGLE_QUOTED, DOUBLE_QUOTED = 0, 1, 2, 3
+PENDING = 0x10
+
+TOKEN = re.compile(r'''
+    (?P<comment>(?:--(?=\s|$)|\#).*)
+  | (?P<block_comment>/\*.*?\*/)
+  | (?P<open_comment>/\*)
+  | (?P<string>'(?:[^'\\]|\\.|'')*'|"(?:[^"\\]|\\.|"")*")
+  | (?P<open_single>'(?:[^'\\]|\\.|'')*\\?$)
+  | (?P<open_double>"(?:[^"\\]|\\.|"")*\\?$)
+  | (?P<quoted>`(?:[^`]|``)*`?)
+  | (?P<number>(?<![\w$])(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?(?![\w$]))
+  | (?P<word>[\w$]+)
+''', re.VERBOSE)
+
+CONTINUATION = {
+    COMMENT: re.compile(r'.*?\*/'),
+    SINGLE_QUOTED: re.compile(r"(?:[^'\\]|\\.|'')*'"),
+    DOUBLE_QUOTED: re.compile(r'(?:[^"\\]|\\.|"")*"'),
+}
+OPENED = {'open_comment': COMMENT, 'open_single': SINGLE_QUOTED, 'open_double': DOUBLE_QUOTED}
+
+# Only what changes the state of a block, so the blocks that are not
+# formatted yet can be skipped through quickly.
+SPECIAL = re.compile(r'''['"`]|--(?=\s|$)|\#|/\*''')
+CLOSED = {
+    "'": re.compile(r"'(?:[^'\\]|\\.|'')*'"),
+    '"': re.compile(r'"(?:[^"\\]|\\.|"")*"'),
+    '`': re.compile(r'`(?:[^`]|``)*`'),
+}
+QUOTED = {"'": SINGLE_QUOTED, '"': DOUBLE_QUOTED, '`': NORMAL}
+
+
+def block_state(text: str, state: int) -> int:
+    """State at the end of a block, from the state at the end of the previous one."""
+    pos = 0
+    if state in CONTINUATION:
+        m = CONTINUATION[state].match(text)
+        if m is None:
+            return state
+        pos = m.end()
+    while True:
+        m = SPECIAL.search(text, pos)
+        if m is None:
+            return NORMAL
+        found = m.group()
+        if found in CLOSED:
+            closed = CLOSED[found].match(text, m.start())
+            if closed is None:
+                return QUOTED[found]
+            pos = closed.end()
+        elif found == '/*':
+            end = text.find('*/', m.end())
+            if end < 0:
+                return COMMENT
+            pos = end + 2
+        else:
+            return NORMAL
+
+
 ########################################################################
 class Highlighter(QSyntaxHighlighter):
-    """Highlighter class to provide text coloring in the query panel."""
+    """Highlighter class to provide text coloring in the query panel.
+
+    Every block is tokenized by one regex pass. Words are classified by a
+    single dict lookup of keywords, table and column names, so the cost
+    of a block does not depend on the size of the schema.
+
+    In documents longer than `lazy_blocks`, only blocks near the visible
+    ones are formatted right away. The others only get their state, which
+    is enough to carry comments and strings across lines, and are formatted
+    in short slices while the event loop is idle.
+    """
+
+    lazy_blocks = 1000
+    margin = 50
+    idle_blocks = 100
+    slice_seconds = 0.01
 
     # ----------------------------------------------------------------------
-    def __init__(self, parent=None):
+    def __init__(self, parent):
         """Initialize Highlighter with basic highlight options."""
         super(Highlighter, self).__init__(parent)
 
@@ -71,9 +153,9 @@ class Highlighter(QSyntaxHighlighter):
         }
 
         # SQL keywords to show as bold and blue
-        keyword_format = QTextCharFormat()
-        keyword_format.setForeground(Qt.darkBlue)
-        keyword_format.setFontWeight(QFont.Bold)
+        self.keyword_format = QTextCharFormat()
+        self.keyword_format.setForeground(Qt.darkBlue)
+        self.keyword_format.setFontWeight(QFont.Bold)
 
         self.plain_keywords = [
             'and', 'as', 'asc', 'by', 'case', 'desc', 'end',
@@ -82,106 +164,181 @@ class Highlighter(QSyntaxHighlighter):
             'select', 'where',
         ]
 
-        keyword_patterns = [
-            '\\b{0}\\b'.format(plain_keyword)
-            for plain_keyword in self.plain_keywords
-        ]
+        self.numeric_format = QTextCharFormat()
+        self.numeric_format.setForeground(Qt.blue)
 
-        self.highlight_rules = []
-        for pattern in keyword_patterns:
-            regexp = QRegExp(pattern)
-            regexp.setCaseSensitivity(Qt.CaseInsensitive)
-            self.highlight_rules.append((regexp, keyword_format))
+        # comments to show as green
+        self.comment_format = QTextCharFormat()
+        self.comment_format.setForeground(Qt.darkGreen)
 
-        numeric_format = QTextCharFormat()
-        numeric_format.setForeground(Qt.blue)
-        regex = QRegExp(r'\s[-+]?[0-9]*\.?[0-9]+([eE][-+]?[0-9]+)?')
-        self.highlight_rules.append((regex, numeric_format))
+        # strings in quotes (both single and double) to show as red
+        self.quote_format = QTextCharFormat()
+        self.quote_format.setForeground(Qt.red)
 
-        # TODO: highlight parens around such as st_x(shape)
-        self.set_highlight_rules_comments()
-        self.multi_line_comment_format = QTextCharFormat()
-        self.multi_line_comment_format.setForeground(Qt.darkGreen)
+        # function names to show as italic and pink
+        self.function_format = QTextCharFormat()
+        self.function_format.setFontItalic(True)
+        self.function_format.setForeground(QColor(255, 105, 255))
 
-        self.set_highlight_rules_quotes()
+        self.item_formats = {}
+        for item_type, settings in self.gdb_highlight_settings.items():
+            fmt = QTextCharFormat()
+            fmt.setForeground(settings['Foreground'])
+            fmt.setFontWeight(settings['FontWeight'])
+            self.item_formats[item_type] = fmt
 
-        # function names to show as italic and pink
-        function_format = QTextCharFormat()
-        function_format.setFontItalic(True)
-        function_format.setForeground(QColor(255, 105, 255))
-        self.highlight_rules.append((QRegExp('\\b[A-Za-z0-9_]+(?=\\()'),
-                                     function_format))
+        self.items: Dict[str, frozenset] = {item_type: frozenset() for item_type in self.item_formats}
+        self.word_formats: Dict[str, QTextCharFormat] = {}
+        self._update_word_formats()
 
-        self.comment_start_expression = QRegExp('/\\*')
-        self.comment_end_expression = QRegExp('\\*/')
-        return
+        self.first_visible = 0
+        self.last_visible = 100
+        self.forced = (-1, -1)
+        self.scan = 0
+        self.idle = QTimer(self)
+        self.idle.setSingleShot(True)
+        self.idle.timeout.connect(self._format_pending)
+        self.doc = self.document()
+        self.doc.contentsChange.connect(self._on_contents_change)
 
     # ----------------------------------------------------------------------
-    def set_highlight_rules_quotes(self):
-        """Strings in quotes (both single and double) to show as red."""
-        quote_format = QTextCharFormat()
-        quote_format.setForeground(Qt.red)
-        self.highlight_rules.append((QRegExp('\".*\"'), quote_format))
-        self.highlight_rules.append((QRegExp("'.*\'"), quote_format))
-        return
+    def _update_word_formats(self):
+        """Merge names into one lookup table, keywords win over tables, tables over columns."""
+        word_formats = {}
+        for item_type in ('Column', 'Table'):
+            fmt = self.item_formats[item_type]
+            word_formats.update((name, fmt) for name in self.items[item_type])
+        word_formats.update((keyword, self.keyword_format) for keyword in self.plain_keywords)
+        self.word_formats = word_formats
 
     # ----------------------------------------------------------------------
-    def set_highlight_rules_comments(self):
-        """Single- and multi-line comments to show as green."""
-        single_line_comment_format = QTextCharFormat()
-        single_line_comment_format.setForeground(Qt.darkGreen)
-        self.highlight_rules.append((QRegExp('--[^\n]*'),
-                                     single_line_comment_format))
-        return
+    def set_highlight_rules_gdb_items(self, items: Iterable[str], item_type: str):
+        """Set the table or column names to highlight, replacing the previous ones."""
+        names = frozenset(item.lower() for item in items)
+        if names == self.items[item_type]:
+            return
+        self.items[item_type] = names
+        self._update_word_formats()
+        self.rehighlight()
 
     # ----------------------------------------------------------------------
-    def set_highlight_rules_gdb_items(self, items, item_type):
-        """Update highlight rules to include geodatabase datasets."""
-        for item in items:
-            fmt = QTextCharFormat()
-            fmt.setForeground(
-                self.gdb_highlight_settings[item_type]['Foreground'])
-            fmt.setFontWeight(
-                self.gdb_highlight_settings[item_type]['FontWeight'])
-            regexp = QRegExp('\\b{0}\\b'.format(item))
-            regexp.setCaseSensitivity(Qt.CaseInsensitive)
-            self.highlight_rules.append((regexp, fmt))
-
-        # need to put the single line comment rules afterwards;
-        # otherwise table names are highlighted even when are part of comment
-        self.set_highlight_rules_comments()
-        self.set_highlight_rules_quotes()
-        return
+    def set_visible(self, first: int, last: int):
+        """Format the blocks `first` to `last` now, if they are still pending."""
+        self.first_visible, self.last_visible = first, last
+        if self.forced != (-1, -1):
+            return
+        block = self.doc.findBlockByNumber(max(0, first - self.margin))
+        while block.isValid() and block.blockNumber() <= last + self.margin:
+            if self._is_pending(block):
+                self._format_blocks(block, last + self.margin)
+            block = block.next()
+
+    # ----------------------------------------------------------------------
+    @staticmethod
+    def _is_pending(block) -> bool:
+        state = block.userState()
+        return state >= 0 and bool(state & PENDING)
+
+    # ----------------------------------------------------------------------
+    def _format_blocks(self, block, last: int):
+        """Format the blocks from `block` to block number `last` with one rehighlight.
+
+        Formatting a pending block changes its state, so QSyntaxHighlighter
+        goes on to the next block by itself, until the forced range ends.
+        """
+        self.forced = (block.blockNumber(), last)
+        try:
+            self.rehighlightBlock(block)
+        finally:
+            self.forced = (-1, -1)
+
+    # ----------------------------------------------------------------------
+    def _on_contents_change(self, position: int, removed: int, added: int):
+        self.scan = min(self.scan, self.doc.findBlock(position).blockNumber())
+
+    # ----------------------------------------------------------------------
+    def _format_pending(self):
+        """Format pending blocks from `scan` on until the time slice is used up."""
+        deadline = monotonic() + self.slice_seconds
+        block = self.doc.findBlockByNumber(max(0, self.scan))
+        while block.isValid():
+            if self._is_pending(block):
+                number = block.blockNumber()
+                self._format_blocks(block, number + self.idle_blocks - 1)
+                block = self.doc.findBlockByNumber(number + self.idle_blocks)
+                if monotonic() > deadline:
+                    self.scan = number + self.idle_blocks
+                    self.idle.start(0)
+                    return
+            else:
+                block = block.next()
+        self.scan = self.doc.blockCount()
+
+    # ----------------------------------------------------------------------
+    def _is_deferred(self, number: int) -> bool:
+        if self.doc.blockCount() <= self.lazy_blocks:
+            return False
+        if self.forced[0] <= number <= self.forced[1]:
+            return False
+        return not (self.first_visible - self.margin <= number <= self.last_visible + self.margin)
+
+    # ----------------------------------------------------------------------
+    def _word_format(self, text: str, start: int, word: str) -> Optional[QTextCharFormat]:
+        fmt = self.word_formats.get(word.lower())
+        if fmt is self.keyword_format:
+            return fmt
+        if text.startswith('(', start + len(word)):
+            return self.function_format
+        return fmt
 
     # ----------------------------------------------------------------------
     def highlightBlock(self, text):  # noqa: N802
         """Reimplementation of the built-in method."""
-        for pattern, format_ in self.highlight_rules:
-            expression = QRegExp(pattern)
-            idx = expression.indexIn(text)
-            while idx >= 0:
-                length = expression.matchedLength()
-                self.setFormat(idx, length, format_)
-                idx = expression.indexIn(text, idx + length)
-
-        self.setCurrentBlockState(0)
-
-        start_idx = 0
-        if self.previousBlockState() != 1:
-            start_idx = self.comment_start_expression.indexIn(text)
-
-        while start_idx >= 0:
-            end_index = self.comment_end_expression.indexIn(text, start_idx)
-
-            if end_index == -1:
-                self.setCurrentBlockState(1)
-                comment_length = len(text) - start_idx
+        state = self.previousBlockState()
+        if state > 0:
+            state &= ~PENDING
+
+        number = self.currentBlock().blockNumber()
+        if self._is_deferred(number):
+            self.setCurrentBlockState(block_state(text, state) | PENDING)
+            self.scan = min(self.scan, number)
+            if not self.idle.isActive():
+                self.idle.start(0)
+            return
+
+        self.setCurrentBlockState(NORMAL)
+        pos = 0
+        if state in CONTINUATION:
+            m = CONTINUATION[state].match(text)
+            fmt = self.comment_format if state == COMMENT else self.quote_format
+            if m is None:
+                self.setFormat(0, len(text), fmt)
+                self.setCurrentBlockState(state)
+                return
+            pos = m.end()
+            self.setFormat(0, pos, fmt)
+
+        for m in TOKEN.finditer(text, pos):
+            kind = m.lastgroup
+            start = m.start()
+            if kind == 'word':
+                fmt = self._word_format(text, start, m.group())
+                if fmt is not None:
+                    self.setFormat(start, m.end() - start, fmt)
+            elif kind == 'number':
+                self.setFormat(start, m.end() - start, self.numeric_format)
+            elif kind == 'quoted':
+                fmt = self.word_formats.get(m.group().strip('`').lower())
+                if fmt is not None and fmt is not self.keyword_format:
+                    self.setFormat(start, m.end() - start, fmt)
+            elif kind in ('comment', 'block_comment'):
+                self.setFormat(start, m.end() - start, self.comment_format)
+            elif kind == 'string':
+                self.setFormat(start, m.end() - start, self.quote_format)
             else:
-                matched_length = self.comment_end_expression.matchedLength()
-                comment_length = end_index - start_idx + matched_length
-
-            self.setFormat(start_idx, comment_length,
-                           self.multi_line_comment_format)
-            start_idx = self.comment_start_expression.indexIn(
-                text, start_idx + comment_length)
-        return
+                state = OPENED[kind]
+                self.setFormat(
+                    start, len(text) - start,
+                    self.comment_format if state == COMMENT else self.quote_format)
+                self.setCurrentBlockState(state)
+                return
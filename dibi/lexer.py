@@ -0,0 +1,242 @@
+from typing import Callable, Generic, Iterator, List, NamedTuple, Optional, Tuple, TypeVar
+from collections import OrderedDict
+from functools import update_wrapper
+import re
+import threading
+
+
+class Token(NamedTuple):
+    kind: str
+    value: str
+
+
+class Statement(NamedTuple):
+    text: str
+    start: int
+    end: int
+    delimiter: str = ';'
+
+
+TOKEN = re.compile(r'''
+    (?P<whitespace>\s+)
+  | (?P<comment>(?:--(?=\s|$)|\#)[^\n]*|/\*.*?(?:\*/|\Z))
+  | (?P<string>'(?:[^'\\]|\\.|'')*(?:'|\Z)|"(?:[^"\\]|\\.|"")*(?:"|\Z))
+  | (?P<quoted>`(?:[^`]|``)*(?:`|\Z))
+  | (?P<placeholder>\$\w+)
+  | (?P<assign>:=)
+  | (?P<word>\w[\w$]*)
+  | (?P<punctuation>.)
+''', re.VERBOSE | re.DOTALL)
+
+SKIPPED = ('whitespace', 'comment')
+
+STRING_END = {
+    "'": re.compile(r"'(?:[^'\\]|\\.|'')*'", re.DOTALL),
+    '"': re.compile(r'"(?:[^"\\]|\\.|"")*"', re.DOTALL),
+    '`': re.compile(r'`(?:[^`]|``)*`'),
+}
+COMMENT_END = re.compile(r'/\*.*?\*/', re.DOTALL)
+DELIMITER_COMMAND = re.compile(r'\s*delimiter[ \t]+(\S+)[^\n]*(?:\n|\Z)', re.IGNORECASE)
+PARTIAL_DELIMITER_COMMAND = re.compile(r'\s*(\w*)[ \t]*\Z')
+PIPE = '-- !'
+
+
+T = TypeVar('T')
+
+
+class TextCache(Generic[T]):
+    """Least recently used results of a function of one text, up to a total text length.
+
+    Counting entries would let a few multi-megabyte scripts keep hundreds of
+    megabytes of tokens alive. Texts longer than a quarter of the budget
+    are not cached at all.
+    """
+
+    def __init__(self, function: Callable[[str], T], max_length: int):
+        self.function = function
+        self.max_length = max_length
+        self.entries: 'OrderedDict[str, T]' = OrderedDict()
+        self.length = 0
+        self.lock = threading.Lock()
+        update_wrapper(self, function)
+
+    def __call__(self, text: str) -> T:
+        with self.lock:
+            if text in self.entries:
+                self.entries.move_to_end(text)
+                return self.entries[text]
+        value = self.function(text)
+        if len(text) > self.max_length // 4:
+            return value
+        with self.lock:
+            if text not in self.entries:
+                self.entries[text] = value
+                self.length += len(text)
+            while self.length > self.max_length:
+                evicted, _ = self.entries.popitem(last=False)
+                self.length -= len(evicted)
+        return value
+
+    def cache_clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.length = 0
+
+
+def text_cache(max_length: int) -> Callable[[Callable[[str], T]], TextCache[T]]:
+    return lambda function: TextCache(function, max_length)
+
+
+@text_cache(max_length=1 << 20)
+def tokenize(statement: str) -> Tuple[Token, ...]:
+    return tuple(Token(m.lastgroup, m.group()) for m in TOKEN.finditer(statement))
+
+
+def significant(statement: str) -> List[Token]:
+    return [t for t in tokenize(statement) if t.kind not in SKIPPED]
+
+
+def strip_trailing_comments(statement: str) -> str:
+    """The statement without the comments and whitespace at its end, so clauses can be appended."""
+    tokens = tokenize(statement)
+    end = len(tokens)
+    while end and tokens[end - 1].kind in SKIPPED:
+        end -= 1
+    return ''.join(t.value for t in tokens[:end])
+
+
+def first_word(statement: str) -> str:
+    for m in TOKEN.finditer(statement):
+        if m.lastgroup == 'word':
+            return m.group().lower()
+        if m.lastgroup not in SKIPPED:
+            return ''
+    return ''
+
+
+def unquote(token: Token) -> str:
+    if token.kind == 'quoted':
+        return token.value[1:-1].replace('``', '`')
+    return token.value
+
+
+class Splitter():
+    """Splits a stream of SQL text into statements.
+
+    Only quotes, comments, delimiters and `DELIMITER` commands are looked at,
+    everything in between is skipped by a single regex search. Text can be
+    fed in chunks, a statement is returned once its delimiter has been read.
+    Anything after a `-- !` comment is the shell command to pipe results to,
+    unless `pipes` is off. A `DELIMITER` command may follow comments, as in
+    dumps, those comments are dropped with it.
+    """
+
+    def __init__(self, delimiter: str = ';', pipes: bool = True):
+        self.pipes = pipes
+        self.buffer = ''
+        self.consumed = 0
+        self.start = 0
+        self.pos = 0
+        # End of the whitespace and comments the current statement starts with
+        self.blank_end = 0
+        self.pipe: Optional[str] = None
+        self.set_delimiter(delimiter)
+
+    def set_delimiter(self, delimiter: str) -> None:
+        self.delimiter = delimiter
+        self.special = re.compile(
+            r'''['"`\#]|--(?=\s|$)|/\*|''' + re.escape(delimiter))
+
+    def feed(self, text: str) -> List[Statement]:
+        if self.pipe is not None:
+            self.pipe += text
+            return []
+        self.buffer += text
+        statements = list(self._split(final=False))
+        if self.start:
+            self.buffer = self.buffer[self.start:]
+            self.consumed += self.start
+            self.pos -= self.start
+            self.blank_end -= self.start
+            self.start = 0
+        return statements
+
+    def close(self) -> List[Statement]:
+        statements = list(self._split(final=True))
+        statement = self._statement(len(self.buffer))
+        if statement is not None:
+            statements.append(statement)
+        self.buffer = ''
+        self.consumed += self.start
+        self.start = self.pos = self.blank_end = 0
+        return statements
+
+    def _statement(self, end: int) -> Optional[Statement]:
+        text = self.buffer[self.start:end].strip()
+        if not text:
+            return None
+        return Statement(text, self.consumed + self.start, self.consumed + end, self.delimiter)
+
+    def _split(self, final: bool) -> Iterator[Statement]:
+        text = self.buffer
+        while self.pipe is None:
+            if self.pos == self.blank_end:
+                command = DELIMITER_COMMAND.match(text, self.pos)
+                if command is not None:
+                    if not (command.group().endswith('\n') or final):
+                        return
+                    self.set_delimiter(command.group(1))
+                    self.start = self.pos = self.blank_end = command.end()
+                    continue
+                partial = None if final else PARTIAL_DELIMITER_COMMAND.match(text, self.pos)
+                if partial is not None and 'delimiter'.startswith(partial.group(1).lower()):
+                    return
+
+            m = self.special.search(text, self.pos)
+            if m is None:
+                self.pos = max(self.pos, len(text) - max(len(self.delimiter), 2) + 1)
+                return
+
+            found = m.group()
+            end: Optional[int]
+            if found in STRING_END:
+                closed = STRING_END[found].match(text, m.start())
+                end = closed and closed.end()
+            elif found == '/*':
+                closed = COMMENT_END.match(text, m.start())
+                end = closed and closed.end()
+            elif found in ('--', '#'):
+                if self.pipes and text.startswith(PIPE, m.start()):
+                    statement = self._statement(m.start())
+                    if statement is not None:
+                        yield statement
+                    self.pipe = text[m.start() + len(PIPE):]
+                    self.start = self.pos = self.blank_end = len(text)
+                    return
+                newline = text.find('\n', m.start())
+                end = None if newline < 0 else newline + 1
+            else:
+                statement = self._statement(m.start())
+                if statement is not None:
+                    yield statement
+                self.start = self.pos = self.blank_end = m.end()
+                continue
+
+            if end is None:
+                if final:
+                    self.pos = len(text)
+                else:
+                    self.pos = m.start()
+                return
+            if (found in ('--', '#', '/*') and not text.startswith('/*!', m.start())
+                    and not text[self.blank_end:m.start()].strip()):
+                self.blank_end = end
+            self.pos = end
+
+
+@text_cache(max_length=4 << 20)
+def split(text: str) -> Tuple[Tuple[str, ...], str]:
+    """Statements of a complete text and the shell command it is piped to."""
+    splitter = Splitter()
+    statements = splitter.feed(text) + splitter.close()
+    return tuple(s.text for s in statements), splitter.pipe or ''
@@ -0,0 +1,352 @@
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+from collections.abc import MutableMapping
+from array import array
+from datetime import date, datetime, timedelta
+from threading import RLock
+
+from dibi.timing import QueryTiming
+
+
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+
+
+class Columns():
+    """Column descriptor shared by every row of a result.
+
+    `flags` are the MySQL column flags, like UNSIGNED, when the cursor
+    reported them and 0 otherwise.
+    """
+
+    def __init__(
+            self, names: Tuple[str, ...] = (), types: Tuple[Optional[int], ...] = (), flags: Tuple[int, ...] = ()):
+        self.names = tuple(names)
+        self.types = tuple(types) or (None,) * len(self.names)
+        self.flags = tuple(flags) or (0,) * len(self.names)
+        self.index: Dict[str, int] = {}
+        for idx, name in enumerate(self.names):
+            self.index.setdefault(name, idx)
+
+    @classmethod
+    def from_description(
+            cls, description: Optional[Sequence[Sequence[Any]]], flags: Optional[Sequence[int]] = None) -> 'Columns':
+        if not description:
+            return cls()
+        return cls(
+            tuple(d[0] for d in description),
+            tuple(d[1] for d in description),
+            tuple(flags or ()))
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.names)
+
+    def __getitem__(self, idx: int) -> str:
+        return self.names[idx]
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Columns):
+            return NotImplemented
+        return self.names == other.names
+
+    def __add__(self, other: 'Columns') -> 'Columns':
+        return Columns(self.names + other.names, self.types + other.types, self.flags + other.flags)
+
+    def __repr__(self) -> str:
+        return f'Columns{self.names}'
+
+
+class Column():
+    """Values of one column, stored in a typed buffer chosen from the first non-null value.
+
+    Integers and floats live in an `array`, temporal values as integer
+    offsets, strings as utf-8 bytes plus an offsets array. Anything that
+    does not fit the chosen buffer demotes the column to a plain list.
+    Edited cells are written in place when they fit, others are kept in
+    `edited` and read from there.
+    """
+
+    def __init__(self, length: int = 0):
+        self.kind: Optional[str] = None
+        self.values: Any = None
+        self.offsets = array('Q', [0])
+        self.nulls = bytearray(b'\x01' * length)
+        self.edited: Dict[int, Any] = {}
+
+    def __len__(self) -> int:
+        return len(self.nulls)
+
+    @staticmethod
+    def _kind_of(value: Any) -> str:
+        if isinstance(value, bool):
+            return 'object'
+        if isinstance(value, int):
+            return 'int'
+        if isinstance(value, float):
+            return 'float'
+        if isinstance(value, str):
+            return 'str'
+        if isinstance(value, datetime):
+            return 'datetime' if value.tzinfo is None else 'object'
+        if isinstance(value, date):
+            return 'date'
+        if isinstance(value, timedelta):
+            return 'timedelta'
+        return 'object'
+
+    def _init_storage(self, kind: str) -> None:
+        self.kind = kind
+        length = len(self.nulls)
+        if kind == 'str':
+            self.values = bytearray()
+            self.offsets = array('Q', [0] * (length + 1))
+        elif kind == 'object':
+            self.values = [None] * length
+        else:
+            self.values = array('d' if kind == 'float' else 'q', bytes(8 * length))
+
+    def _demote(self) -> None:
+        values = [self.get(i) for i in range(len(self.nulls))]
+        self.kind = 'object'
+        self.values = values
+        self.offsets = array('Q', [0])
+        for idx, value in self.edited.items():
+            self.nulls[idx] = value is None
+        self.edited = {}
+
+    def extend(self, values: Sequence[Any]) -> None:
+        if self.kind is None:
+            first = next((v for v in values if v is not None), None)
+            if first is None:
+                self.nulls.extend(b'\x01' * len(values))
+                return
+            self._init_storage(self._kind_of(first))
+
+        if self.kind != 'object':
+            try:
+                self._extend_typed(values)
+            except (TypeError, AttributeError, OverflowError, ValueError):
+                self._demote()
+
+        if self.kind == 'object':
+            self.values.extend(values)
+
+        self.nulls.extend([v is None for v in values])
+
+    def _extend_typed(self, values: Sequence[Any]) -> None:
+        length = len(self.values)
+        try:
+            if self.kind == 'str':
+                data = self.values
+                offsets = self.offsets
+                for v in values:
+                    if v is not None:
+                        data += v.encode('utf-8', 'surrogatepass')
+                    offsets.append(len(data))
+            elif self.kind in ('int', 'float'):
+                zero = 0 if self.kind == 'int' else 0.0
+                if self.kind == 'float' and any(type(v) is not float for v in values if v is not None):
+                    raise TypeError('Mixed values in a float column')
+                self.values.extend([zero if v is None else v for v in values])
+            elif self.kind == 'datetime':
+                self.values.extend([
+                    0 if v is None else (v - EPOCH) // MICROSECOND
+                    for v in values])
+            elif self.kind == 'date':
+                if any(type(v) is not date for v in values if v is not None):
+                    raise TypeError('Mixed values in a date column')
+                self.values.extend([0 if v is None else v.toordinal() for v in values])
+            elif self.kind == 'timedelta':
+                self.values.extend([0 if v is None else v // MICROSECOND for v in values])
+        except Exception:
+            if self.kind == 'str':
+                del self.offsets[len(self.nulls) + 1:]
+                del self.values[self.offsets[-1]:]
+            else:
+                del self.values[length:]
+            raise
+
+    def nbytes(self) -> int:
+        size = len(self.nulls)
+        if isinstance(self.values, (array, bytearray)):
+            size += len(self.values) * getattr(self.values, 'itemsize', 1) + len(self.offsets) * self.offsets.itemsize
+        elif self.values is not None:
+            size += 8 * len(self.values)
+        return size
+
+    def get(self, idx: int) -> Any:
+        if self.edited and idx in self.edited:
+            return self.edited[idx]
+        if self.nulls[idx]:
+            return None
+        kind = self.kind
+        if kind == 'object':
+            return self.values[idx]
+        if kind == 'str':
+            return self.values[self.offsets[idx]:self.offsets[idx + 1]].decode('utf-8', 'surrogatepass')
+        value = self.values[idx]
+        if kind == 'datetime':
+            return EPOCH + value * MICROSECOND
+        if kind == 'date':
+            return date.fromordinal(value)
+        if kind == 'timedelta':
+            return value * MICROSECOND
+        return value
+
+    def set(self, idx: int, value: Any) -> None:
+        self.edited.pop(idx, None)
+        if value is None or self.kind == 'object':
+            if self.kind == 'object':
+                self.values[idx] = value
+            self.nulls[idx] = value is None
+            return
+        try:
+            self.values[idx] = self._encode(value)
+        except (TypeError, OverflowError):
+            self.edited[idx] = value
+            return
+        self.nulls[idx] = False
+
+    def _encode(self, value: Any) -> Any:
+        """A value as stored in the typed buffer, TypeError when it does not fit there."""
+        kind = self.kind
+        if kind is None or kind == 'str' or self._kind_of(value) != kind:
+            raise TypeError('Value does not fit the column buffer')
+        if kind == 'float' and type(value) is not float or kind == 'date' and type(value) is not date:
+            raise TypeError('Value does not fit the column buffer')
+        if kind == 'datetime':
+            return (value - EPOCH) // MICROSECOND
+        if kind == 'date':
+            return value.toordinal()
+        if kind == 'timedelta':
+            return value // MICROSECOND
+        return value
+
+
+class ResultSet():
+    """Columnar result store, filled by DbThread and read by the grid model."""
+
+    def __init__(self, columns: Optional[Columns] = None):
+        if columns is None:
+            columns = Columns()
+        self.columns = columns
+        self.data: List[Column] = [Column() for _ in columns]
+        self.length = 0
+        self.lock = RLock()
+        self.db: Optional[str] = None
+        self.table: Optional[str] = None
+        self.timing: Optional[QueryTiming] = None
+
+    def __len__(self) -> int:
+        return self.length
+
+    def add_columns(self, columns: Columns) -> int:
+        with self.lock:
+            offset = len(self.columns)
+            self.columns += columns
+            self.data += [Column(self.length) for _ in columns]
+            return offset
+
+    def append(self, rows: Sequence[Tuple], offset: int = 0) -> None:
+        if not rows:
+            return
+        with self.lock:
+            width = len(rows[0])
+            values = list(zip(*rows))
+            for idx, column in enumerate(self.data):
+                if offset <= idx < offset + width:
+                    column.extend(values[idx - offset])
+                else:
+                    column.extend([None] * len(rows))
+            self.length += len(rows)
+
+    def nbytes(self) -> int:
+        with self.lock:
+            return sum(column.nbytes() for column in self.data)
+
+    def value(self, row: int, col: int) -> Any:
+        with self.lock:
+            return self.data[col].get(row)
+
+    def row(self, row: int) -> Tuple:
+        with self.lock:
+            return tuple(column.get(row) for column in self.data)
+
+    def rows(self) -> Iterator[Tuple]:
+        for row in range(len(self)):
+            yield self.row(row)
+
+    def set_value(self, row: int, col: int, value: Any) -> None:
+        with self.lock:
+            self.data[col].set(row, value)
+
+
+class RowView(MutableMapping):
+    """Dict-like view of a single row of a ResultSet."""
+
+    __slots__ = ('result', 'idx')
+
+    def __init__(self, result: ResultSet, idx: int):
+        self.result = result
+        self.idx = idx
+
+    def __getitem__(self, key: str) -> Any:
+        return self.result.value(self.idx, self.result.columns.index[key])
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self.result.set_value(self.idx, self.result.columns.index[key], value)
+
+    def __delitem__(self, key: str) -> None:
+        raise TypeError('Columns can not be removed from a row')
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.result.columns.index)
+
+    def __len__(self) -> int:
+        return len(self.result.columns.index)
+
+
+class EditBuffer():
+    """Cell edits waiting for commit, keyed by result and row.
+
+    The original values of an edited row are kept so the row can still be
+    found by its unique key, and restored on rollback.
+    """
+
+    def __init__(self):
+        self.rows: Dict[Tuple[int, int], Tuple[ResultSet, int, Dict[str, Any], Dict[str, Any]]] = {}
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def add(self, result: ResultSet, row: int, column: str, value: Any) -> None:
+        if result.table is None:
+            raise RuntimeError('Only results of a single table can be edited')
+        key = (id(result), row)
+        if key not in self.rows:
+            self.rows[key] = (result, row, dict(RowView(result, row)), {})
+        self.rows[key][3][column] = value
+        result.set_value(row, result.columns.index[column], value)
+
+    def is_dirty(self, result: ResultSet, row: int, column: str) -> bool:
+        try:
+            return column in self.rows[(id(result), row)][3]
+        except KeyError:
+            return False
+
+    def pending(self) -> List[Dict[str, Any]]:
+        return [
+            {'db': result.db, 'table': result.table, 'record': record, 'changes': dict(changes)}
+            for result, _, record, changes in self.rows.values()
+        ]
+
+    def revert(self) -> None:
+        for result, row, record, changes in self.rows.values():
+            for column in changes:
+                result.set_value(row, result.columns.index[column], record[column])
+        self.clear()
+
+    def clear(self) -> None:
+        self.rows = {}
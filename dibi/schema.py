@@ -0,0 +1,163 @@
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from dataclasses import dataclass, field, asdict, replace
+import json
+import os
+import re
+from os import path
+
+
+@dataclass
+class TableInfo:
+    name: str
+    create_time: str = ''
+    loaded: bool = False
+    columns: List[str] = field(default_factory=list)
+    column_types: List[str] = field(default_factory=list)
+    unique_indexes: Dict[str, List[str]] = field(default_factory=dict)
+    references: Dict[str, List[str]] = field(default_factory=dict)
+
+
+def cache_directory() -> str:
+    return path.join(
+        os.environ.get('XDG_CACHE_HOME', path.expanduser('~/.cache')), 'dibi')
+
+
+class SchemaCache():
+    """Tables, columns, unique indexes and foreign keys per schema, persisted per connection label.
+
+    Every update builds new TableInfo objects and a new per-schema dict, so
+    dicts handed out by `schema()` can be shared with other threads.
+    """
+
+    def __init__(self, label: str, directory: str = ''):
+        self.filepath = path.join(
+            directory or cache_directory(),
+            'schema-{}.json'.format(re.sub(r'[^\w.-]', '_', label)))
+        self.schemas: Dict[str, Dict[str, TableInfo]] = {}
+
+    def load(self) -> None:
+        try:
+            with open(self.filepath) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        try:
+            self.schemas = {
+                schema: {name: TableInfo(**info) for name, info in tables.items()}
+                for schema, tables in data.items()
+            }
+        except (AttributeError, KeyError, TypeError):
+            # Written by another version or edited by hand, reloaded from the server
+            self.schemas = {}
+
+    def save(self) -> None:
+        os.makedirs(path.dirname(self.filepath), exist_ok=True)
+        tmp = self.filepath + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({
+                schema: {name: asdict(info) for name, info in tables.items()}
+                for schema, tables in self.schemas.items()
+            }, f)
+        os.replace(tmp, self.filepath)
+
+    def schema(self, schema: str) -> Optional[Dict[str, TableInfo]]:
+        return self.schemas.get(schema)
+
+    def tables(self, schema: str) -> Optional[List[str]]:
+        tables = self.schemas.get(schema)
+        if tables is None:
+            return None
+        return list(tables)
+
+    def table(self, schema: str, table: str) -> Optional[TableInfo]:
+        return self.schemas.get(schema, {}).get(table)
+
+    def update_tables(self, schema: str, rows: Iterable[Sequence[Any]]) -> List[str]:
+        """Replace the table list of a schema from (name, create_time) rows, return tables needing details."""
+        cached = self.schemas.get(schema, {})
+        tables: Dict[str, TableInfo] = {}
+        stale = []
+        for name, create_time in rows:
+            create_time = str(create_time or '')
+            info = cached.get(name)
+            if info is None or info.create_time != create_time:
+                info = TableInfo(name, create_time)
+            if not info.loaded:
+                stale.append(name)
+            tables[name] = info
+        self.schemas[schema] = tables
+        return stale
+
+    def update_details(
+            self,
+            schema: str,
+            columns: Iterable[Sequence[Any]],
+            statistics: Iterable[Sequence[Any]],
+            references: Iterable[Sequence[Any]],
+            tables: Iterable[str]) -> None:
+        """Fill in columns, unique indexes and foreign keys of the given tables.
+
+        Rows are (table, column, column_type), (table, index, non_unique, column)
+        and (table, column, ref_schema, ref_table, ref_column).
+        """
+        details: Dict[str, TableInfo] = {}
+        current = self.schemas.setdefault(schema, {})
+
+        def info(table: str) -> TableInfo:
+            if table not in details:
+                details[table] = replace(
+                    current.get(table, TableInfo(table)),
+                    loaded=True, columns=[], column_types=[], unique_indexes={}, references={})
+            return details[table]
+
+        for table in tables:
+            info(table)
+        for table, column, column_type in columns:
+            info(table).columns.append(column)
+            info(table).column_types.append(column_type)
+        for table, index, non_unique, column in statistics:
+            if not int(non_unique):
+                info(table).unique_indexes.setdefault(index, []).append(column)
+        for table, column, ref_schema, ref_table, ref_column in references:
+            info(table).references[column] = [ref_schema, ref_table, ref_column]
+
+        self.schemas[schema] = {**current, **details}
+
+    def invalidate(self, schema: str, table: Optional[str] = None) -> None:
+        tables = self.schemas.get(schema)
+        if tables is None:
+            return
+        if table is None:
+            self.schemas[schema] = {
+                name: replace(info, create_time='', loaded=False)
+                for name, info in tables.items()
+            }
+        elif table in tables:
+            self.schemas[schema] = {
+                **tables, table: replace(tables[table], create_time='', loaded=False)}
+
+
+class ForeignKeys():
+    """Foreign key graph of the loaded schemas, in both directions."""
+
+    def __init__(self):
+        self.schemas: Dict[str, Dict[Tuple[str, str], Tuple[str, str, str]]] = {}
+        self.referenced_by: Dict[Tuple[str, str, str], List[Tuple[str, str, str]]] = {}
+
+    def add_schema(self, schema: str, tables: Dict[str, TableInfo]) -> None:
+        self.schemas[schema] = {
+            (table, column): (ref_schema or schema, ref_table, ref_column)
+            for table, info in tables.items()
+            for column, (ref_schema, ref_table, ref_column) in info.references.items()
+        }
+        referenced_by: Dict[Tuple[str, str, str], List[Tuple[str, str, str]]] = {}
+        for source_schema, references in self.schemas.items():
+            for (table, column), target in references.items():
+                referenced_by.setdefault(target, []).append((source_schema, table, column))
+        self.referenced_by = referenced_by
+
+    def reference(self, schema: str, table: str, column: str) -> Optional[Tuple[str, str, str]]:
+        return self.schemas.get(schema, {}).get((table, column))
+
+    def referencing(self, schema: str, table: str, column: str) -> List[Tuple[str, str, str]]:
+        return self.referenced_by.get((schema, table, column), [])
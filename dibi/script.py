@@ -0,0 +1,105 @@
+from typing import Dict, Iterator, Optional, Tuple
+from dataclasses import dataclass, asdict
+import codecs
+import json
+import os
+from os import path
+
+from dibi.lexer import Splitter, Statement
+from dibi.schema import cache_directory
+
+
+@dataclass
+class Checkpoint:
+    """Statements of a script that already ran, and where in the file the next one starts."""
+    statement: int = 0
+    offset: int = 0
+    delimiter: str = ';'
+    size: int = 0
+    mtime: float = 0
+
+
+class Checkpoints():
+    """Checkpoints of interrupted script runs, kept per script file."""
+
+    def __init__(self, directory: str = ''):
+        self.filepath = path.join(directory or cache_directory(), 'scripts.json')
+
+    def _load(self) -> Dict[str, dict]:
+        try:
+            with open(self.filepath) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self, checkpoints: Dict[str, dict]) -> None:
+        os.makedirs(path.dirname(self.filepath), exist_ok=True)
+        tmp = self.filepath + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(checkpoints, f)
+        os.replace(tmp, self.filepath)
+
+    def get(self, script: str) -> Optional[Checkpoint]:
+        checkpoint = self._load().get(path.abspath(script))
+        if checkpoint is None:
+            return None
+        checkpoint = Checkpoint(**checkpoint)
+        stat = os.stat(script)
+        if (checkpoint.size, checkpoint.mtime) != (stat.st_size, stat.st_mtime):
+            return None
+        return checkpoint
+
+    def save(self, script: str, checkpoint: Checkpoint) -> None:
+        self._save({**self._load(), path.abspath(script): asdict(checkpoint)})
+
+    def clear(self, script: str) -> None:
+        checkpoints = self._load()
+        if checkpoints.pop(path.abspath(script), None) is not None:
+            self._save(checkpoints)
+
+
+class ScriptReader():
+    """Statements of a script file, read and split a chunk at a time.
+
+    Starting from a checkpoint skips the text that already ran without
+    splitting it again.
+    """
+
+    chunk_size = 1 << 20
+
+    def __init__(self, script: str, checkpoint: Optional[Checkpoint] = None):
+        stat = os.stat(script)
+        self.script = script
+        self.size = stat.st_size
+        self.mtime = stat.st_mtime
+        self.start = checkpoint or Checkpoint()
+        self.bytes_read = 0
+
+    def checkpoint(self, index: int, statement: Statement) -> Checkpoint:
+        """Checkpoint after the statement with the given index ran."""
+        return Checkpoint(
+            index + 1, self.start.offset + statement.end, statement.delimiter, self.size, self.mtime)
+
+    def __iter__(self) -> Iterator[Tuple[int, Statement]]:
+        decoder = codecs.getincrementaldecoder('utf-8')('replace')
+        splitter = Splitter(self.start.delimiter, pipes=False)
+        skip = self.start.offset
+        index = self.start.statement
+        with open(self.script, 'rb') as f:
+            while True:
+                data = f.read(self.chunk_size)
+                self.bytes_read += len(data)
+                text = decoder.decode(data, final=not data)
+                if skip:
+                    skipped = min(skip, len(text))
+                    text = text[skipped:]
+                    skip -= skipped
+
+                statements = splitter.feed(text)
+                if not data:
+                    statements += splitter.close()
+                for statement in statements:
+                    yield index, statement
+                    index += 1
+                if not data:
+                    return
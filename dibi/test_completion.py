@@ -0,0 +1,42 @@
+import unittest
+
+from dibi.completion import CompletionIndex, Names, SchemaNames
+from dibi.schema import TableInfo
+
+
+class CompletionTest(unittest.TestCase):
+    def setUp(self):
+        self.index = CompletionIndex()
+        self.index.set_databases(['shop', 'logs'])
+        self.index.set_schema('shop', SchemaNames({
+            'users': TableInfo('users', columns=['id', 'name', 'email']),
+            'user_orders': TableInfo('user_orders', columns=['id', 'user_id', 'total']),
+        }))
+
+    def complete(self, text, pos=None):
+        return self.index.complete(text, len(text) if pos is None else pos, 'shop')
+
+    def test_ranking(self):
+        names = Names(['order_items', 'user_orders', 'orders', 'sorted'])
+        self.assertEqual(names.prefixed('or', 10), ['order_items', 'orders'])
+        self.assertEqual(names.fuzzy('uo', 10), ['user_orders'])
+        self.assertEqual(set(names.fuzzy('ors', 10)), {'orders', 'order_items', 'user_orders'})
+
+    def test_tables_after_from(self):
+        self.assertEqual(self.complete('select * from us').matches[:2], ['users ', 'user_orders '])
+        self.assertEqual(self.complete('select * from uo').matches[0], 'user_orders ')
+        self.assertEqual(self.complete('sel').matches[0], 'SELECT ')
+
+    def test_columns_in_scope(self):
+        text = 'select  from user_orders o join users u on u.'
+        self.assertEqual(self.complete(text, 7).matches[:3], ['id', 'total', 'user_id'])
+        completions = self.complete(text)
+        self.assertEqual(completions.start, len(text))
+        self.assertEqual(completions.matches, ['email', 'id', 'name'])
+        self.assertEqual(self.complete('update users set em').matches, ['email'])
+
+    def test_tables_of_other_database(self):
+        self.assertEqual(self.complete('select * from shop.u').matches, ['users ', 'user_orders '])
+        self.assertEqual(self.complete('select * from logs.').missing_db, 'logs')
+        self.index.set_tables('logs', ['events'])
+        self.assertEqual(self.complete('select * from logs.').matches, ['events '])
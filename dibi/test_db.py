@@ -1,6 +1,13 @@
+import os
+import tempfile
+import threading
 import unittest
 
-from dibi.db import SQLParser
+import MySQLdb
+
+from dibi.db import ConnectionPool, DbThread, SQLParser, BatchSizer, Page, ShellPipe, grouped_update_query
+from dibi.results import Columns
+from dibi.script import Checkpoints
 
 
 class SQLParserTest(unittest.TestCase):
@@ -28,6 +35,333 @@ class SQLParserTest(unittest.TestCase):
         put_result, _ = next(result)
         put_result(['bar', 'baz'])
         _, query = next(result)
-        self.assertEqual(query, 'select * from foo. bar')
+        self.assertEqual(query, 'select * from foo.bar')
         _, query = next(result)
-        self.assertEqual(query, 'select * from foo. baz')
+        self.assertEqual(query, 'select * from foo.baz')
+
+    def test_set_placeholders_become_subqueries(self):
+        parser = SQLParser()
+        next(parser.handle_placeholders('ids := select id from foo'))
+        query = 'select * from bar where foo_id = $ids or baz in ($ids)'
+        self.assertEqual(parser.get_set_placeholders(query), ['ids', 'ids'])
+        self.assertEqual(
+            parser.replace_set_placeholders(query, ['select id from tmp_0', 'select id from tmp_1']),
+            'select * from bar where foo_id IN (select id from tmp_0) or baz in (select id from tmp_1)')
+        self.assertEqual(parser.get_set_placeholders('select * from foo.$ids'), [])
+        self.assertEqual(parser.get_set_placeholders('update foo set x = $ids where y = 1'), [])
+        self.assertEqual(
+            parser.get_set_placeholders('select * from a join b on (b.id = $ids) where a.x in (1)'), ['ids'])
+
+
+class BatchSizerTest(unittest.TestCase):
+    def test_first_batch_is_small(self):
+        self.assertEqual(BatchSizer().size, BatchSizer.first)
+
+    def test_adapts_to_throughput(self):
+        sizer = BatchSizer()
+        self.assertEqual(sizer.update(1000, 0.05), 5000)
+        self.assertEqual(sizer.update(1000, 100), BatchSizer.minimum)
+        self.assertEqual(sizer.update(10 ** 9, 1), BatchSizer.maximum)
+
+
+class DDLTest(unittest.TestCase):
+    def test_get_tables_from_ddl(self):
+        self.assertEqual([(None, 'foo')], SQLParser.get_tables_from_ddl('alter table `foo` add column x int'))
+        self.assertEqual([('db', 'foo')], SQLParser.get_tables_from_ddl('CREATE TABLE IF NOT EXISTS db.foo (id int)'))
+        self.assertEqual([('foo', '')], SQLParser.get_tables_from_ddl('create database foo'))
+        self.assertEqual([('x', '')], SQLParser.get_tables_from_ddl('DROP DATABASE IF EXISTS `x`'))
+        self.assertEqual([], SQLParser.get_tables_from_ddl('select * from foo'))
+        self.assertEqual([], SQLParser.get_tables_from_ddl('create procedure p() begin drop table t; end'))
+
+    def test_indexes_and_table_lists(self):
+        self.assertEqual(
+            [('db', 'foo')], SQLParser.get_tables_from_ddl('create unique index k using btree on db.foo (a)'))
+        self.assertEqual([(None, 'foo')], SQLParser.get_tables_from_ddl('DROP INDEX `k` ON foo'))
+        self.assertEqual(
+            [(None, 'a'), ('db', 'b-c')], SQLParser.get_tables_from_ddl('drop table if exists a, db.`b-c`'))
+        self.assertEqual(
+            [(None, 'a'), (None, 'b'), (None, 'c'), ('db', 'd')],
+            SQLParser.get_tables_from_ddl('rename table a to b, c to db.d'))
+        self.assertEqual([(None, 'my table')], SQLParser.get_tables_from_ddl('truncate `my table`'))
+
+
+class GroupedUpdateTest(unittest.TestCase):
+    def test_rows_are_updated_in_one_statement(self):
+        query, params = grouped_update_query('shop', 'orders', ['id'], [
+            ((1, ), {'status': 'paid'}),
+            ((2, ), {'status': 'sent', 'note': None}),
+        ])
+        self.assertEqual(
+            query,
+            'UPDATE `shop`.`orders` SET '
+            '`status` = CASE WHEN (`id` = %s) THEN %s WHEN (`id` = %s) THEN %s ELSE `status` END, '
+            '`note` = CASE WHEN (`id` = %s) THEN %s ELSE `note` END '
+            'WHERE (`id` = %s) OR (`id` = %s)')
+        self.assertEqual(params, (1, 'paid', 2, 'sent', 2, None, 1, 2))
+
+    def test_key_columns_are_assigned_last(self):
+        query, params = grouped_update_query('shop', 'items', ['order_id', 'line'], [
+            ((1, 1), {'line': 2, 'order_id': 5, 'qty': 3}),
+            ((1, 2), {'qty': 4}),
+        ])
+        self.assertEqual(
+            query,
+            'UPDATE `shop`.`items` SET '
+            '`qty` = CASE WHEN (`order_id` = %s AND `line` = %s) THEN %s '
+            'WHEN (`order_id` = %s AND `line` = %s) THEN %s ELSE `qty` END, '
+            '`order_id` = CASE WHEN (`order_id` = %s AND `line` = %s) THEN %s ELSE `order_id` END, '
+            '`line` = CASE WHEN (`order_id` = %s AND `line` = %s) THEN %s ELSE `line` END '
+            'WHERE (`order_id` = %s AND `line` = %s) OR (`order_id` = %s AND `line` = %s)')
+        self.assertEqual(params, (1, 1, 3, 1, 2, 4, 1, 1, 5, 5, 1, 2, 1, 1, 1, 2))
+
+
+class RecordingConnection():
+    """Connection whose statements all affect `rowcount` rows, SELECTs return one row."""
+
+    def __init__(self, rowcount: int = 0):
+        self.queries = []
+        self.rowcount = rowcount
+        self.description = None
+        self.rows = []
+
+    def cursor(self, cursor_class=None):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def execute(self, query, params=None):
+        self.queries.append((query, params))
+        self.description = None
+        self.rows = []
+        if query.lower().startswith('select'):
+            self.description = (('id', 3, None, None, None, None, True), )
+            self.rows = [(1, )]
+
+    def fetchmany(self, size):
+        rows, self.rows = self.rows, []
+        return rows
+
+    def nextset(self):
+        return None
+
+    def close(self):
+        pass
+
+
+class FlushEditsTest(unittest.TestCase):
+    EDITS = [
+        {'db': 'shop', 'table': 'files', 'record': {'hash': b'\x01\x02'}, 'changes': {'name': 'a'}},
+        {'db': 'shop', 'table': 'files', 'record': {'hash': b'\x03'}, 'changes': {'name': 'b'}},
+    ]
+
+    def thread(self, rowcount):
+        thread = DbThread()
+        thread.c = RecordingConnection(rowcount)
+        thread.unique_keys[('shop', 'files')] = [(['hash'], False)]
+        return thread
+
+    def test_key_values_are_sent_as_they_are(self):
+        thread = self.thread(2)
+        thread.flush_edits(self.EDITS)
+        self.assertEqual(thread.c.queries[1][1], (b'\x01\x02', 'a', b'\x03', 'b', b'\x01\x02', b'\x03'))
+
+    def test_rows_not_found_roll_back(self):
+        thread = self.thread(1)
+        with self.assertRaisesRegex(RuntimeError, '1 of 2 edited rows'):
+            thread.flush_edits(self.EDITS)
+        self.assertEqual(thread.c.queries[-1][0], 'ROLLBACK TO SAVEPOINT dibi_edits')
+
+
+class SendResultsTest(unittest.TestCase):
+    def test_statements_are_prepared_when_they_run(self):
+        thread = DbThread()
+        thread.c = RecordingConnection()
+        thread.current_db = 'shop'
+        results = []
+        thread.query_result.connect(lambda result: results.append((result.db, result.table)))
+        thread.use_db.connect(lambda db: thread.c.queries.append(('use_db', db)))
+        thread.send_results('select * from orders where id = 1; use archive')
+        self.assertEqual(results, [('shop', 'orders')])
+        self.assertEqual([q for q, _ in thread.c.queries], [
+            'select * from orders where id = 1', 'use archive', 'use_db'])
+        self.assertEqual(thread.current_db, 'archive')
+
+
+class RunScriptTest(unittest.TestCase):
+    def test_running_and_schema_changes_of_a_script(self):
+        with tempfile.TemporaryDirectory() as directory:
+            script = os.path.join(directory, 'script.sql')
+            with open(script, 'w') as f:
+                f.write('insert into t values (1);\nalter table t add primary key (id);\nselect * from t;\n'
+                        'create index k on u (a);\n')
+            thread = DbThread()
+            thread.c = RecordingConnection()
+            thread.checkpoints = Checkpoints(directory)
+            thread.current_db = 'shop'
+            thread.unique_keys = {('shop', 't'): [(['a'], False)], ('shop', 'u'): [(['id'], False)]}
+            running, changed = [], []
+            thread.running_query.connect(running.append)
+            thread.schema_changed.connect(lambda db, table: changed.append((db, table)))
+            thread.run_script(script)
+        self.assertEqual([q for q, _ in thread.c.queries], [
+            'insert into t values (1)\n;\nalter table t add primary key (id)', 'select * from t',
+            'create index k on u (a)'])
+        self.assertEqual(running, [True, False])
+        self.assertEqual(changed, [('shop', 't'), ('shop', 'u')])
+        self.assertEqual(thread.unique_keys, {})
+
+
+class ReadOnlyConnection(RecordingConnection):
+    def execute(self, query, params=None):
+        if query.startswith('CREATE'):
+            raise MySQLdb.OperationalError(1290, 'read only')
+        super().execute(query, params)
+
+
+class MaterializeTest(unittest.TestCase):
+    def thread(self, connection):
+        thread = DbThread()
+        thread.c = connection
+        thread.current_db = 'shop'
+        thread.sql_parser.variables['ids'] = 'select id from foo'
+        return thread
+
+    def test_each_placeholder_gets_a_table(self):
+        thread = self.thread(RecordingConnection())
+        self.assertEqual(
+            thread._materialize_placeholders('select * from bar where a = $ids or b in ($ids)'),
+            'select * from bar where a IN (SELECT `id` FROM `shop`.`dibi_var_ids_0`) '
+            'or b in (SELECT `id` FROM `shop`.`dibi_var_ids_1`)')
+        self.assertIn(
+            ('CREATE TEMPORARY TABLE `shop`.`dibi_var_ids_1` AS SELECT * FROM `shop`.`dibi_var_ids_0`', None),
+            thread.c.queries)
+
+    def test_runs_once_per_value_when_tables_cannot_be_created(self):
+        thread = self.thread(ReadOnlyConnection())
+        thread.send_results('select * from bar where a = $ids')
+        self.assertEqual([q for q, _ in thread.c.queries[-2:]], [
+            'select id from foo', 'select * from bar where a = 1'])
+
+
+class IndexConnection(RecordingConnection):
+    """Connection answering SHOW INDEX with the given (key name, column, nullable) rows."""
+
+    def __init__(self, indexes):
+        super().__init__()
+        self.indexes = indexes
+
+    def execute(self, query, params=None):
+        super().execute(query, params)
+        if query.startswith('show index'):
+            self.description = tuple(
+                (name, 253, None, None, None, None, True) for name in ('Key_name', 'Column_name', 'Null'))
+            self.rows = [(key, column, 'YES' if nullable else '') for key, column, nullable in self.indexes]
+
+    def fetchall(self):
+        return self.rows
+
+
+class PageTest(unittest.TestCase):
+    def test_seeks_only_by_keys_without_nulls(self):
+        thread = DbThread()
+        thread.c = IndexConnection([('email', 'email', True), ('code', 'org', False), ('code', 'code', False)])
+        self.assertEqual(thread.unique_key('shop', 'users'), ['org', 'code'])
+        self.assertEqual(thread._page_for('select * from users').key, ['org', 'code'])
+        thread.c.indexes = [('email', 'email', True), ('PRIMARY', 'id', False)]
+        self.assertEqual(thread.unique_key('shop', 'orders'), ['id'])
+        thread.c.indexes = [('email', 'email', True)]
+        self.assertFalse(thread._page_for('select * from accounts').seek)
+        self.assertEqual(thread.unique_key('shop', 'accounts'), ['email'])
+
+    def test_seeks_past_last_key(self):
+        page = Page('select * from foo', None, 'name like "a%"', ['id', 'k'])
+        self.assertEqual(
+            page.next_query(),
+            ('select * from foo WHERE (name like "a%%") ORDER BY `id`, `k` LIMIT 1000', ()))
+        page.advance(Columns(('id', 'k', 'name')), [(1, 2, 'a'), (1, 3, 'ab')])
+        self.assertEqual(
+            page.next_query(),
+            ('select * from foo WHERE (name like "a%%") AND ((`id` > %s) OR (`id` = %s AND `k` > %s)) '
+             'ORDER BY `id`, `k` LIMIT 1000', (1, 1, 3)))
+
+    def test_offset_without_key(self):
+        page = Page('select name from foo', None, None, ['id'])
+        page.advance(Columns(('name', )), [('a', )])
+        self.assertEqual(page.next_query(), ('select name from foo ORDER BY `id` LIMIT 1000 OFFSET 1', ()))
+
+    def test_trailing_comments_are_dropped(self):
+        page = Page('select * from foo -- note', None)
+        self.assertEqual(page.next_query(), ('select * from foo LIMIT 1000', ()))
+        self.assertEqual(
+            SQLParser.get_seek_parts('select * from foo where a = 1 # note\n'),
+            ('select * from foo', None, 'foo', 'a = 1'))
+
+    def test_seek_parts(self):
+        self.assertEqual(
+            SQLParser.get_seek_parts('select * from foo.bar where a = 1'),
+            ('select * from foo.bar', 'foo', 'bar', 'a = 1'))
+        self.assertIsNone(SQLParser.get_seek_parts('select * from foo join bar using (id)'))
+        self.assertFalse(SQLParser.is_pageable('select * from foo limit 5'))
+
+
+class ShellPipeTest(unittest.TestCase):
+    def test_rows_are_written_as_csv(self):
+        pipe = ShellPipe('cat')
+        pipe.write([(1, 'a,b'), (2, None)])
+        self.assertEqual(pipe.close(), (0, '1,"a,b"\n2,\n'))
+        self.assertEqual(pipe.rows, 2)
+
+
+class BatchesTest(unittest.TestCase):
+    def test_statements_without_rows_are_grouped(self):
+        queries = ['insert into a values (1)', 'update a set b = 1', 'select * from a', 'delete from a', 'drop table a']
+        self.assertEqual(list(DbThread()._batches(queries)), [queries[:2], queries[2:3], queries[3:]])
+
+
+class BlockingConnection():
+    """Connection whose queries wait until `release` is set."""
+
+    description = (('id', 3, None, None, None, None, True), )
+
+    def __init__(self, started: threading.Event, release: threading.Event):
+        self.started = started
+        self.release = release
+        self.closed = False
+
+    def cursor(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def execute(self, query, params):
+        self.started.set()
+        self.release.wait(5)
+
+    def fetchall(self):
+        return [(1, )]
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTest(unittest.TestCase):
+    def test_busy_connections_are_closed_when_returned(self):
+        started, release = threading.Event(), threading.Event()
+        connection = BlockingConnection(started, release)
+        pool = ConnectionPool(lambda: connection)
+        future = pool.executor.submit(pool._run, 'select 1', ())
+        started.wait(5)
+        pool.close()
+        self.assertFalse(connection.closed)
+        release.set()
+        future.result(5)
+        self.assertTrue(connection.closed)
+        self.assertTrue(pool.idle.empty())
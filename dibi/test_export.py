@@ -0,0 +1,62 @@
+import json
+import os
+import tempfile
+import unittest
+from datetime import date, datetime
+from decimal import Decimal
+
+from MySQLdb.constants import FIELD_TYPE, FLAG
+
+from dibi.export import ArrowWriter, CsvWriter, JsonLinesWriter, pyarrow_supported
+from dibi.results import Columns
+
+
+class WriterTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.columns = Columns(('id', 'name', 'created'))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_csv_has_header_and_quotes(self):
+        filepath = os.path.join(self.directory.name, 'out.csv')
+        writer = CsvWriter(filepath, self.columns)
+        writer.write([(1, 'a,b', None), (2, b'\xc3\xa4', None)])
+        writer.close()
+        with open(filepath, newline='', encoding='utf-8') as f:
+            self.assertEqual(f.read(), 'id,name,created\r\n1,"a,b",\r\n2,ä,\r\n')
+
+    def test_json_lines(self):
+        filepath = os.path.join(self.directory.name, 'out.jsonl')
+        writer = JsonLinesWriter(filepath, self.columns)
+        writer.write([(1, 'a', date(2020, 1, 2)), (2, None, None)])
+        writer.close()
+        with open(filepath) as f:
+            self.assertEqual([json.loads(line) for line in f], [
+                {'id': 1, 'name': 'a', 'created': '2020-01-02'},
+                {'id': 2, 'name': None, 'created': None},
+            ])
+
+    @unittest.skipUnless(pyarrow_supported, 'pyarrow is not installed')
+    def test_arrow_round_trip(self):
+        import pyarrow
+        import pyarrow.ipc
+        filepath = os.path.join(self.directory.name, 'out.arrow')
+        columns = Columns(
+            ('id', 'name', 'created', 'price', 'data', 'hash'),
+            (FIELD_TYPE.LONGLONG, FIELD_TYPE.VAR_STRING, FIELD_TYPE.DATETIME, FIELD_TYPE.NEWDECIMAL, FIELD_TYPE.BLOB,
+             FIELD_TYPE.LONGLONG),
+            (0, 0, 0, 0, 0, FLAG.UNSIGNED))
+        writer = ArrowWriter(filepath, columns)
+        writer.write([(1, 'a', datetime(2020, 1, 2, 3, 4), Decimal('1.10'), b'\x00', 2 ** 64 - 1)])
+        writer.write([(2, None, None, None, None, None)])
+        writer.close()
+        with pyarrow.OSFile(filepath) as f:
+            table = pyarrow.ipc.open_file(f).read_all()
+        self.assertEqual(table.schema, pyarrow.schema([
+            ('id', pyarrow.int64()), ('name', pyarrow.string()), ('created', pyarrow.timestamp('us')),
+            ('price', pyarrow.string()), ('data', pyarrow.binary()), ('hash', pyarrow.uint64())]))
+        self.assertEqual(table.num_rows, 2)
+        self.assertEqual(table.column('price').to_pylist(), ['1.10', None])
+        self.assertEqual(table.column('hash').to_pylist(), [2 ** 64 - 1, None])
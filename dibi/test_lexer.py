@@ -0,0 +1,69 @@
+import unittest
+
+from dibi.lexer import Splitter, TextCache, split, tokenize
+
+
+SCRIPT = """select 1; select ';' as x -- not a delimiter;
+; select "a\\"b;" from `t;x`; /* c; */ select 2;
+delimiter //
+create procedure p() begin select 1; select 2; end//
+delimiter ;
+select 3 -- !gzip > out.gz
+"""
+
+STATEMENTS = (
+    'select 1',
+    "select ';' as x -- not a delimiter;",
+    'select "a\\"b;" from `t;x`',
+    '/* c; */ select 2',
+    'create procedure p() begin select 1; select 2; end',
+    'select 3',
+)
+
+
+class SplitterTest(unittest.TestCase):
+    def test_split(self):
+        self.assertEqual(split(SCRIPT), (STATEMENTS, 'gzip > out.gz\n'))
+
+    def test_chunks_give_the_same_statements(self):
+        for size in (1, 2, 3, 7):
+            splitter = Splitter()
+            statements = []
+            for start in range(0, len(SCRIPT), size):
+                statements += splitter.feed(SCRIPT[start:start + size])
+            statements += splitter.close()
+            self.assertEqual(tuple(s.text for s in statements), STATEMENTS)
+            self.assertEqual([SCRIPT[s.start:s.end].strip() for s in statements], list(STATEMENTS))
+
+    def test_delimiter_after_comments(self):
+        dump = (
+            '-- dump\nDELIMITER ;;\n/* trigger */ create trigger t before insert on x for each row '
+            'begin set new.a=1; end;;\n# back\nDELIMITER ;\nselect 1;')
+        expected = (
+            '/* trigger */ create trigger t before insert on x for each row begin set new.a=1; end',
+            'select 1')
+        self.assertEqual(split(dump), (expected, ''))
+        for size in (1, 5):
+            splitter = Splitter()
+            statements = []
+            for start in range(0, len(dump), size):
+                statements += splitter.feed(dump[start:start + size])
+            statements += splitter.close()
+            self.assertEqual(tuple(s.text for s in statements), expected)
+
+    def test_tokenize(self):
+        self.assertEqual(
+            [(t.kind, t.value) for t in tokenize("a := `b c`.$d 'e'") if t.kind != 'whitespace'],
+            [('word', 'a'), ('assign', ':='), ('quoted', '`b c`'), ('punctuation', '.'),
+             ('placeholder', '$d'), ('string', "'e'")])
+
+
+class TextCacheTest(unittest.TestCase):
+    def test_bounded_by_text_length(self):
+        cache = TextCache(len, 16)
+        for text in ('aaaa', 'bbbb', 'cccc', 'dddd', 'aaaa', 'eeee'):
+            cache(text)
+        self.assertEqual(list(cache.entries), ['cccc', 'dddd', 'aaaa', 'eeee'])
+        self.assertEqual(cache.length, 16)
+        self.assertEqual(cache('x' * 5), 5)
+        self.assertNotIn('x' * 5, cache.entries)
@@ -0,0 +1,81 @@
+import unittest
+from datetime import date, datetime
+from decimal import Decimal
+
+from dibi.results import Columns, EditBuffer, ResultSet, RowView
+
+
+class ResultSetTest(unittest.TestCase):
+    def test_typed_columns_round_trip(self):
+        rows = [
+            (1, 'ä', 1.5, datetime(2020, 1, 2, 3, 4, 5), date(2020, 1, 1), Decimal('1.10')),
+            (None, None, None, None, None, None),
+        ]
+        result = ResultSet(Columns(('i', 's', 'f', 'dt', 'd', 'dec')))
+        result.append(rows)
+        self.assertEqual(list(result.rows()), rows)
+        self.assertEqual(
+            [c.kind for c in result.data],
+            ['int', 'str', 'float', 'datetime', 'date', 'object'])
+
+    def test_mismatched_values_demote_column(self):
+        result = ResultSet(Columns(('id',)))
+        result.append([(1,), (2,)])
+        result.append([(2 ** 64,)])
+        self.assertEqual(result.data[0].kind, 'object')
+        self.assertEqual([r[0] for r in result.rows()], [1, 2, 2 ** 64])
+
+    def test_added_columns_are_padded(self):
+        result = ResultSet(Columns(('id',)))
+        result.append([(1,)])
+        offset = result.add_columns(Columns(('name',)))
+        result.append([('a',)], offset)
+        self.assertEqual(list(result.rows()), [(1, None), (None, 'a')])
+
+    def test_columns_concatenate(self):
+        columns = Columns(('id',), (3,)) + Columns(('id', 'name'), (3, 253))
+        self.assertEqual(columns.names, ('id', 'id', 'name'))
+        self.assertEqual(columns.index, {'id': 0, 'name': 2})
+
+    def test_edits_keep_typed_columns(self):
+        result = ResultSet(Columns(('id', 'name', 'created')))
+        result.append([(1, 'a', date(2020, 1, 1)), (2, 'b', None)])
+        result.set_value(0, 0, 5)
+        result.set_value(1, 0, 2 ** 64)
+        result.set_value(0, 1, 'longer')
+        result.set_value(1, 2, date(2021, 1, 1))
+        result.set_value(0, 2, None)
+        self.assertEqual([c.kind for c in result.data], ['int', 'str', 'date'])
+        self.assertEqual(list(result.rows()), [(5, 'longer', None), (2 ** 64, 'b', date(2021, 1, 1))])
+        result.append([('x', 'c', None)])
+        self.assertEqual(result.data[0].kind, 'object')
+        self.assertEqual([r[0] for r in result.rows()], [5, 2 ** 64, 'x'])
+
+
+class RowViewTest(unittest.TestCase):
+    def test_reads_and_writes_through(self):
+        result = ResultSet(Columns(('id', 'name')))
+        result.append([(1, 'a'), (2, 'b')])
+        record = RowView(result, 1)
+        self.assertEqual(dict(record), {'id': 2, 'name': 'b'})
+        record['name'] = 'c'
+        self.assertEqual(result.row(1), (2, 'c'))
+
+
+class EditBufferTest(unittest.TestCase):
+    def test_keeps_original_record_and_reverts(self):
+        result = ResultSet(Columns(('id', 'name')))
+        result.append([(1, 'a')])
+        result.db, result.table = 'shop', 'users'
+        edits = EditBuffer()
+        edits.add(result, 0, 'id', 5)
+        edits.add(result, 0, 'name', 'b')
+        self.assertEqual(result.row(0), (5, 'b'))
+        self.assertEqual(edits.pending(), [{
+            'db': 'shop', 'table': 'users',
+            'record': {'id': 1, 'name': 'a'},
+            'changes': {'id': 5, 'name': 'b'},
+        }])
+        edits.revert()
+        self.assertEqual(result.row(0), (1, 'a'))
+        self.assertEqual(len(edits), 0)
@@ -0,0 +1,67 @@
+import unittest
+import tempfile
+
+from dibi.schema import ForeignKeys, SchemaCache
+
+
+class SchemaCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = SchemaCache('local db', self.directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def load(self):
+        self.cache.update_tables('shop', [('orders', '2020-01-01'), ('users', '2020-01-01')])
+        self.cache.update_details(
+            'shop',
+            [('orders', 'id', 'int'), ('orders', 'user_id', 'int'), ('users', 'id', 'int')],
+            [('orders', 'PRIMARY', 0, 'id'), ('orders', 'user_idx', 1, 'user_id'), ('users', 'PRIMARY', '0', 'id')],
+            [('orders', 'user_id', 'shop', 'users', 'id')],
+            ['orders', 'users'])
+
+    def test_details(self):
+        self.load()
+        orders = self.cache.table('shop', 'orders')
+        self.assertEqual(orders.columns, ['id', 'user_id'])
+        self.assertEqual(orders.unique_indexes, {'PRIMARY': ['id']})
+        self.assertEqual(orders.references, {'user_id': ['shop', 'users', 'id']})
+
+    def test_only_changed_tables_are_stale(self):
+        self.load()
+        stale = self.cache.update_tables(
+            'shop', [('orders', '2020-01-01'), ('users', '2021-01-01'), ('items', None)])
+        self.assertEqual(stale, ['users', 'items'])
+        self.assertTrue(self.cache.table('shop', 'orders').loaded)
+
+    def test_invalidate(self):
+        self.load()
+        self.cache.invalidate('shop', 'orders')
+        self.assertEqual(self.cache.update_tables('shop', [('orders', '2020-01-01')]), ['orders'])
+
+    def test_persisted(self):
+        self.load()
+        self.cache.save()
+        cache = SchemaCache('local db', self.directory.name)
+        cache.load()
+        self.assertEqual(cache.schemas, self.cache.schemas)
+
+    def test_unreadable_cache_is_empty(self):
+        for content in ('{"shop": {"orders": {"unknown": 1}}}', '{"shop": {"orders": {}}}', '[1]'):
+            with open(self.cache.filepath, 'w') as f:
+                f.write(content)
+            self.cache.load()
+            self.assertEqual(self.cache.schemas, {})
+
+
+class ForeignKeysTest(unittest.TestCase):
+    def test_both_directions(self):
+        cache = SchemaCache('test', tempfile.gettempdir())
+        cache.update_tables('shop', [('orders', ''), ('users', '')])
+        cache.update_details('shop', [], [], [('orders', 'user_id', 'shop', 'users', 'id')], ['orders', 'users'])
+        foreign_keys = ForeignKeys()
+        foreign_keys.add_schema('shop', cache.schema('shop'))
+        self.assertEqual(foreign_keys.reference('shop', 'orders', 'user_id'), ('shop', 'users', 'id'))
+        self.assertEqual(foreign_keys.referencing('shop', 'users', 'id'), [('shop', 'orders', 'user_id')])
+        self.assertIsNone(foreign_keys.reference('shop', 'users', 'id'))
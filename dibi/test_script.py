@@ -0,0 +1,47 @@
+import os
+import tempfile
+import unittest
+
+from dibi.script import Checkpoints, ScriptReader
+
+
+SCRIPT = """insert into t values (1, 'ä;');
+delimiter //
+create trigger x begin select 1; end//
+delimiter ;
+insert into t values (2, 'b');
+"""
+
+
+class ScriptReaderTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.script = os.path.join(self.directory.name, 'script.sql')
+        with open(self.script, 'w') as f:
+            f.write(SCRIPT)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_resume_from_checkpoint(self):
+        reader = ScriptReader(self.script)
+        reader.chunk_size = 5
+        statements = list(reader)
+        self.assertEqual([s.text for _, s in statements], [
+            "insert into t values (1, 'ä;')",
+            'create trigger x begin select 1; end',
+            "insert into t values (2, 'b')",
+        ])
+
+        checkpoints = Checkpoints(self.directory.name)
+        checkpoints.save(self.script, reader.checkpoint(*statements[1]))
+        resumed = list(ScriptReader(self.script, checkpoints.get(self.script)))
+        self.assertEqual([(i, s.text) for i, s in resumed], [(2, "insert into t values (2, 'b')")])
+
+    def test_checkpoint_of_changed_script_is_ignored(self):
+        checkpoints = Checkpoints(self.directory.name)
+        reader = ScriptReader(self.script)
+        checkpoints.save(self.script, reader.checkpoint(*next(iter(reader))))
+        with open(self.script, 'a') as f:
+            f.write('select 1;\n')
+        self.assertIsNone(checkpoints.get(self.script))
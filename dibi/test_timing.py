@@ -0,0 +1,20 @@
+import unittest
+
+from dibi.timing import QueryTiming, Timings, query_shape
+
+
+class TimingsTest(unittest.TestCase):
+    def test_query_shape(self):
+        self.assertEqual(
+            query_shape("SELECT * FROM t WHERE id = 12 AND name IN ('a', 'b')"),
+            'select * from t where id = ? and name in (?)')
+
+    def test_summary_per_shape(self):
+        timings = Timings(size=3)
+        for idx in range(4):
+            timings.add(QueryTiming(f'select * from t where id = {idx}', execute=idx))
+        timings.add(QueryTiming('show tables', fetch=0.5))
+        self.assertEqual(timings.summary(), [
+            ('select * from t where id = ?', 2, 3, 3),
+            ('show tables', 1, 0.5, 0.5),
+        ])
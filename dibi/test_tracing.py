@@ -0,0 +1,26 @@
+import json
+import os
+import tempfile
+import unittest
+
+from dibi.tracing import Tracer
+
+
+class TracerTest(unittest.TestCase):
+    def test_nested_spans_and_flows_are_saved(self):
+        with tempfile.TemporaryDirectory() as directory:
+            tracer = Tracer(os.path.join(directory, 'trace.json'))
+            with tracer.span('outer'):
+                with tracer.span('inner', rows=3):
+                    tracer.flow('query', 1, 's')
+            tracer.save()
+            with open(tracer.filepath) as f:
+                events = json.load(f)['traceEvents']
+
+        self.assertEqual([e['ph'] for e in events], ['M', 's', 'X', 'X'])
+        flow, inner, outer = events[1:]
+        self.assertEqual(inner['args'], {'rows': 3})
+        self.assertEqual(len({e['tid'] for e in events}), 1)
+        self.assertLessEqual(outer['ts'], inner['ts'])
+        self.assertGreaterEqual(outer['ts'] + outer['dur'], inner['ts'] + inner['dur'])
+        self.assertTrue(inner['ts'] <= flow['ts'] <= inner['ts'] + inner['dur'])
@@ -0,0 +1,83 @@
+from typing import Deque, Dict, List, Optional, Tuple
+from collections import deque
+from dataclasses import dataclass
+import re
+
+from dibi import lexer
+
+
+PHASES = ('wait', 'execute', 'fetch', 'convert', 'deliver', 'render')
+
+
+def query_shape(query: str) -> str:
+    """Query with literals replaced by `?`, so runs of the same query with different values group together."""
+    parts = []
+    for token in lexer.tokenize(query):
+        if token.kind in lexer.SKIPPED:
+            continue
+        if token.kind == 'string' or (token.kind == 'word' and token.value[0].isdigit()):
+            parts.append('?')
+        elif token.kind == 'word':
+            parts.append(token.value.lower())
+        else:
+            parts.append(token.value)
+    shape = re.sub(r'\( \?(?: , \?)* \)', '(?)', ' '.join(parts))
+    return shape[:200]
+
+
+@dataclass
+class QueryTiming:
+    """Seconds spent in each phase of one query, from the job being queued to the grid showing it."""
+    query: str
+    queued: float = 0
+    emitted: float = 0
+    wait: float = 0
+    execute: float = 0
+    fetch: float = 0
+    convert: float = 0
+    deliver: float = 0
+    render: float = 0
+    rows: int = 0
+    bytes: int = 0
+    trace: int = 0
+
+    @property
+    def total(self) -> float:
+        return sum(getattr(self, phase) for phase in PHASES)
+
+    def __str__(self) -> str:
+        return '{:.1f} ms: {}; {} rows, {:.1f} kB'.format(
+            self.total * 1000,
+            ', '.join('{} {:.1f}'.format(phase, getattr(self, phase) * 1000) for phase in PHASES),
+            self.rows,
+            self.bytes / 1000)
+
+
+def percentile(values: List[float], p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+
+class Timings():
+    """Ring buffer of the last query timings, summarised per query shape."""
+
+    def __init__(self, size: int = 1000):
+        self.entries: Deque[Tuple[str, QueryTiming]] = deque(maxlen=size)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def add(self, timing: QueryTiming) -> None:
+        self.entries.append((query_shape(timing.query), timing))
+
+    def summary(self, shape: Optional[str] = None) -> List[Tuple[str, int, float, float]]:
+        """(shape, count, p50, p95) of total time per shape, slowest first."""
+        totals: Dict[str, List[float]] = {}
+        for entry_shape, timing in self.entries:
+            if shape is None or entry_shape == shape:
+                totals.setdefault(entry_shape, []).append(timing.total)
+        rows = [
+            (entry_shape, len(values), percentile(values, 0.5), percentile(values, 0.95))
+            for entry_shape, values in totals.items()
+        ]
+        return sorted(rows, key=lambda row: row[3], reverse=True)
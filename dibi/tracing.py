@@ -0,0 +1,120 @@
+from typing import Any, Callable, ContextManager, Dict, Iterator, Optional, TypeVar
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+from itertools import count
+from os import path
+from time import perf_counter
+import atexit
+import json
+import os
+import threading
+
+from PyQt5 import QtCore
+
+from dibi.schema import cache_directory
+
+
+F = TypeVar('F', bound=Callable[..., Any])
+
+
+class Tracer():
+    """Records spans as Chrome trace events, loadable in chrome://tracing or Perfetto.
+
+    Spans are complete (`X`) events on the thread they ran on, so spans
+    opened inside each other nest in the flame view. Work handed over to
+    another thread is linked by flow events sharing an id.
+    """
+
+    max_events = 1_000_000
+
+    def __init__(self, filepath: str):
+        self.filepath = filepath
+        self.events: deque = deque(maxlen=self.max_events)
+        self.pid = os.getpid()
+        self.start = perf_counter()
+        self.named: set = set()
+        self.ids = count(1)
+
+    def _now(self) -> float:
+        return (perf_counter() - self.start) * 1e6
+
+    def _tid(self) -> int:
+        tid = threading.get_native_id()
+        if tid not in self.named:
+            self.named.add(tid)
+            name = QtCore.QThread.currentThread().objectName() or threading.current_thread().name
+            self.events.append({
+                'name': 'thread_name', 'ph': 'M', 'pid': self.pid, 'tid': tid, 'args': {'name': name}})
+        return tid
+
+    @contextmanager
+    def span(self, name: str, **args: Any) -> Iterator[None]:
+        tid = self._tid()
+        start = self._now()
+        try:
+            yield
+        finally:
+            event: Dict[str, Any] = {
+                'name': name, 'ph': 'X', 'ts': start, 'dur': self._now() - start, 'pid': self.pid, 'tid': tid}
+            if args:
+                event['args'] = args
+            self.events.append(event)
+
+    def flow(self, name: str, flow_id: int, phase: str) -> None:
+        """Start (`s`), continue (`t`) or finish (`f`) the flow `flow_id` from within the current span."""
+        event = {
+            'name': name, 'cat': 'flow', 'ph': phase, 'id': flow_id,
+            'ts': self._now(), 'pid': self.pid, 'tid': self._tid()}
+        if phase == 'f':
+            event['bp'] = 'e'
+        self.events.append(event)
+
+    def save(self) -> None:
+        os.makedirs(path.dirname(self.filepath) or '.', exist_ok=True)
+        tmp = self.filepath + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'traceEvents': list(self.events), 'displayTimeUnit': 'ms'}, f)
+        os.replace(tmp, self.filepath)
+
+
+def trace_file(setting: str) -> str:
+    """`DIBI_TRACE=1` writes to the cache directory, any other value is taken as the trace file."""
+    if setting.lower() in ('1', 'true', 'yes', 'on'):
+        return path.join(cache_directory(), f'trace-{os.getpid()}.json')
+    return path.expanduser(setting)
+
+
+tracer: Optional[Tracer] = None
+if os.environ.get('DIBI_TRACE'):
+    tracer = Tracer(trace_file(os.environ['DIBI_TRACE']))
+    atexit.register(tracer.save)
+
+
+def span(name: str, **args: Any) -> ContextManager[None]:
+    if tracer is None:
+        return nullcontext()
+    return tracer.span(name, **args)
+
+
+def traced(name: str) -> Callable[[F], F]:
+    """Decorator recording every call of the function as a span."""
+    def decorator(fn: F) -> F:
+        if tracer is None:
+            return fn
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with tracer.span(name):
+                return fn(*args, **kwargs)
+        return wrapper  # type: ignore
+    return decorator
+
+
+def new_flow() -> int:
+    return next(tracer.ids) if tracer is not None else 0
+
+
+def flow(name: str, flow_id: int, phase: str) -> None:
+    if tracer is not None and flow_id:
+        tracer.flow(name, flow_id, phase)
@@ -1,10 +1,25 @@
 from PyQt5 import QtCore, QtGui, QtWidgets
-from typing import List, Dict, Tuple, Union, Optional, Any
-import json
-
+from typing import Iterable, List, Dict, Sequence, Set, Tuple, Union, Optional, Any
+from bisect import bisect_right
+from itertools import accumulate
+import heapq
+import html
+import random
+import re
+from time import monotonic
+
+from MySQLdb.constants import FIELD_TYPE
+
+from dibi import tracing
+from dibi.completion import CompletionIndex, SchemaNames
 from dibi.configuration import ConnectionInfo
 from dibi.highlighter import Highlighter
-from dibi.db import DbThread
+from dibi.db import DbThread, MetaThread, QueryKiller
+from dibi.export import ExportThread, WRITERS
+from dibi.results import EditBuffer, ResultSet, RowView
+from dibi.schema import ForeignKeys, TableInfo
+from dibi.script import Checkpoints
+from dibi.timing import QueryTiming, Timings
 
 
 _translate = QtCore.QCoreApplication.translate
@@ -309,34 +324,96 @@ class ConnectionListLabel(QtWidgets.QWidget):
 
 
 class StringList(QtCore.QAbstractListModel):
+    """Names shown by a list view, which only asks for the rows it paints.
+
+    `set_filter` keeps the names containing a text, found by searching
+    all lowercase names joined into one string, built on the first filter.
+    """
+
     def __init__(self, data: List[str], parent: QtCore.QObject = None):
         super().__init__(parent=parent)
         self.list = data
-        self.parent = parent
+        self.filter = ''
+        self.rows: Optional[List[int]] = None
+        self.lowered = ''
+        self.starts: List[int] = []
+
+    def rowCount(self, parent: QtCore.QModelIndex = QtCore.QModelIndex()):
+        return len(self.list) if self.rows is None else len(self.rows)
 
-    def rowCount(self, parent: QtCore.QModelIndex):
-        return len(self.list)
+    def data(self, index: QtCore.QModelIndex, role: int = QtCore.Qt.DisplayRole):
+        if role not in (QtCore.Qt.DisplayRole, QtCore.Qt.EditRole):
+            return None
+        return self.name(index.row())
 
-    def data(self, index: QtCore.QModelIndex, role: int):
-        return self.list[index.row()]
+    def name(self, row: int) -> str:
+        return self.list[row if self.rows is None else self.rows[row]]
+
+    def set_list(self, data: List[str]):
+        """Show other names in the same model, filtered by the current filter."""
+        self.beginResetModel()
+        self.list = data
+        self.lowered = ''
+        self.starts = []
+        self.rows = self._matching(self.filter) if self.filter else None
+        self.endResetModel()
+
+    def set_filter(self, text: str):
+        text = text.lower()
+        if text == self.filter:
+            return
+        self.beginResetModel()
+        self.filter = text
+        self.rows = self._matching(text) if text else None
+        self.endResetModel()
+
+    def _matching(self, text: str) -> List[int]:
+        if not self.starts and self.list:
+            self.lowered = '\n'.join(self.list).lower()
+            self.starts = [0] + list(accumulate(len(name) + 1 for name in self.list))
+        rows: List[int] = []
+        for m in re.finditer(re.escape(text), self.lowered):
+            row = bisect_right(self.starts, m.start()) - 1
+            if not rows or rows[-1] != row:
+                rows.append(row)
+        return rows
 
 
 class ConnectionTab(QtWidgets.QWidget):
     _dbs: List[str] = []
-    editing_record: Optional[Dict[str, str]] = None
+    editing_record: Optional[RowView] = None
     editing_column: Optional[str] = None
+    session: Optional[Tuple[int, str, int]] = None
+    export_session: Optional[int] = None
+    exporting = False
+    current_db: Optional[str] = None
+    schemas: Dict[str, Dict[str, TableInfo]] = {}
+    table_models: Dict[str, StringList] = {}
 
     def close(self):
         print('closing')
         self.t.job.emit('disconnect', '', '', {})
-        self.thread.quit()
-        self.thread.wait()
+        self.exporter.cancel()
+        for thread in (self.thread, self.meta_thread, self.killer_thread, self.export_thread):
+            thread.quit()
+            thread.wait()
 
     def on_dbs_list(self, dbs: List[str]):
-        self.comboBox.clear()
         self._dbs = dbs
-        for db in dbs:
-            self.comboBox.addItem(db, db)
+        # Refilling the model selects the first database, the session only
+        # switches databases when the user picks one.
+        self.comboBox.blockSignals(True)
+        try:
+            model = self.comboBox.model()
+            if isinstance(model, StringList):
+                model.set_list(dbs)
+            else:
+                self.comboBox.setModel(StringList(dbs, self.comboBox))
+            self.comboBox.setCurrentIndex(dbs.index(self.current_db) if self.current_db in dbs else -1)
+        finally:
+            self.comboBox.blockSignals(False)
+        if self.current_db is None and dbs:
+            self.comboBox.setCurrentIndex(0)
         self.textEdit.setDbList(dbs)
 
     def on_db_selected(self, index: int):
@@ -346,12 +423,48 @@ class ConnectionTab(QtWidgets.QWidget):
             db = self._dbs[index]
         except KeyError:
             return
-        self.t.job.emit('table_list', db, '', {})
-
-    def on_query_result(self, results):
-        self.tableWidget.set_data(results)
+        if db != self.current_db:
+            self.current_db = db
+            self.t.job.emit('use', db, '', {})
+            if db in self.table_models:
+                self.show_tables(db)
+        self.meta.job.emit(MetaThread.PRIORITY_BROWSE, 'table_list', db, {})
+
+    @tracing.traced('ConnectionTab.on_query_result')
+    def on_query_result(self, result: ResultSet):
+        start = monotonic()
+        if result.timing is not None:
+            tracing.flow('query', result.timing.trace, 'f')
+        self.tableWidget.set_data(result)
+        if result.timing is not None:
+            result.timing.deliver = start - result.timing.emitted
+            result.timing.render += monotonic() - start
+
+    @tracing.traced('ConnectionTab.on_query_result_batch')
+    def on_query_result_batch(self, result: ResultSet, row_count: int):
+        start = monotonic()
+        self.tableWidget.append_data(result, row_count)
+        if result.timing is not None:
+            result.timing.render += monotonic() - start
+
+    def on_timed(self, timing: QueryTiming):
+        self.timings.add(timing)
+        self.textBrowser.append(f'<span style="color: gray">{timing}</span>')
+
+    def show_timings(self):
+        self.textBrowser.append(f'Last {len(self.timings)} queries, p50 / p95 total ms per query shape:')
+        for shape, count, p50, p95 in self.timings.summary()[:20]:
+            self.textBrowser.append('<pre>{:>9.1f} {:>9.1f} {:>5}x  {}</pre>'.format(
+                p50 * 1000, p95 * 1000, count, html.escape(shape)))
+
+    def on_has_more(self, result: ResultSet, more_available: bool):
+        self.tableWidget.set_more(result, more_available)
+
+    def on_need_more(self, result: ResultSet):
+        self.t.job.emit('next_page', str(id(result)), '', {})
 
     def on_use_db(self, db: str):
+        self.current_db = db
         try:
             self.comboBox.setCurrentIndex(self._dbs.index(db))
         except ValueError:
@@ -364,48 +477,151 @@ class ConnectionTab(QtWidgets.QWidget):
         self.textBrowser.append(info)
 
     def on_query_op(self, isRunning: bool):
-        pass
+        self.cancel_button.setEnabled(isRunning)
+
+    def on_connected(self, thread_id: int, host: str, port: int):
+        self.session = (thread_id, host, port)
+        self.meta.job.emit(MetaThread.PRIORITY_INTERACTIVE, 'connect', '', {'host': host, 'port': port})
+
+    def on_cancel(self):
+        if self.session is None:
+            return
+        self.t.stop_script.set()
+        self.killer.kill.emit(*self.session)
+
+    def on_script_click(self):
+        script, _ = QtWidgets.QFileDialog.getOpenFileName(
+            self, 'Run script', '', 'SQL scripts (*.sql);;All files (*)')
+        if not script:
+            return
+        resume = False
+        checkpoint = Checkpoints().get(script)
+        if checkpoint is not None:
+            resume = QtWidgets.QMessageBox.question(
+                self, 'Run script',
+                f'A previous run stopped before statement {checkpoint.statement + 1}. Resume from there?'
+            ) == QtWidgets.QMessageBox.Yes
+        self.t.job.emit('run_script', script, '', {'resume': resume})
+
+    def on_export_click(self):
+        if self.exporting:
+            self.exporter.cancel()
+            if self.export_session is not None and self.session is not None:
+                _, host, port = self.session
+                self.killer.kill.emit(self.export_session, host, port)
+            return
+
+        if self.session is None:
+            self.on_error('No active connection')
+            return
+        query = self.textEdit.toPlainText().strip()
+        if not query:
+            return
+        filters = {
+            '.csv': 'CSV (*.csv)',
+            '.jsonl': 'JSON Lines (*.jsonl)',
+            '.arrow': 'Arrow IPC (*.arrow)',
+        }
+        filepath, selected = QtWidgets.QFileDialog.getSaveFileName(
+            self, 'Export results', '', ';;'.join(filters[ext] for ext in WRITERS))
+        if not filepath:
+            return
+        if not any(filepath.lower().endswith(ext) for ext in WRITERS):
+            filepath += next((ext for ext in WRITERS if filters[ext] == selected), '.csv')
+
+        _, host, port = self.session
+        self.exporting = True
+        self.export_button.setText('Cancel export')
+        self.exporter.job.emit(query, filepath, {'host': host, 'port': port, 'db': self.current_db or ''})
+
+    def on_export_connected(self, thread_id: int):
+        self.export_session = thread_id
+
+    def on_export_progress(self, rows: int, written: int):
+        self.export_button.setText(f'Cancel export ({rows} rows)')
+        self.export_button.setToolTip(f'{rows} rows, {written / 1e6:.1f} MB written')
+
+    def on_export_finished(self, filepath: str, rows: int):
+        self.exporting = False
+        self.export_session = None
+        self.export_button.setText('Export')
+        self.export_button.setToolTip('')
 
     def on_query(self, query):
         self.textBrowser.append(query)
 
-    def on_tables_list(self, tables: List[str]):
-        self.listView.clear()
-        self.tables_list = tables
-        for table in tables:
-            self.listView.addItem(table)
-        self.textEdit.setTables(tables)
+    def on_tables_list(self, db: str, tables: List[str]):
+        self.textEdit.setDbTables(db, tables)
+        model = self.table_models.get(db)
+        if model is None:
+            self.table_models = {**self.table_models, db: StringList(tables, self)}
+        elif model.list != tables:
+            model.set_list(tables)
+            if self.listView.model() is model:
+                self.textEdit.setTables(db, tables)
+        if db == self.current_db:
+            self.show_tables(db)
+
+    def show_tables(self, db: str):
+        """Swap in the cached table list of a database, filtered by the current filter text."""
+        model = self.table_models[db]
+        model.set_filter(self.table_filter.text())
+        if self.listView.model() is not model:
+            self.listView.setModel(model)
+            self.textEdit.setTables(db, model.list)
+
+    def on_table_filter(self, text: str):
+        model = self.listView.model()
+        if model is not None:
+            model.set_filter(text)
+
+    def on_schema_loaded(self, db: str, schema: Dict[str, TableInfo]):
+        self.schemas = {**self.schemas, db: schema}
+        self.foreign_keys.add_schema(db, schema)
+        if db == self.current_db:
+            self.textEdit.setColumns(column for info in schema.values() for column in info.columns)
+
+    def on_schema_changed(self, db: str, table: str):
+        if not table:
+            self.meta.job.emit(MetaThread.PRIORITY_BACKGROUND, 'db_list', '', {})
+            return
+        self.meta.job.emit(MetaThread.PRIORITY_BACKGROUND, 'invalidate', db, {'table': table})
 
+    @tracing.traced('ConnectionTab.on_table_dblclick')
     def on_table_dblclick(self, item: QtCore.QModelIndex):
-        try:
-            table = self.tables_list[item.row()]
-        except KeyError:
+        table = item.data()
+        if table is None:
             return
-        self.t.job.emit('table_data', table, '', {})
+        self._query_job('table_data', table)
 
     def on_table_click(self, item: QtCore.QModelIndex):
         modifiers = QtGui.QGuiApplication.queryKeyboardModifiers()
         if modifiers != QtCore.Qt.AltModifier:
             return
-        try:
-            table = self.tables_list[item.row()]
-        except KeyError:
+        table = item.data()
+        if table is None:
             return
-        self.t.job.emit('table_contents', table, '', {})
+        self.meta.job.emit(MetaThread.PRIORITY_INTERACTIVE, 'table_contents', table, {'db': self.current_db})
 
     def open_connection(self, connection: ConnectionInfo):
         self.connection = connection
+        self.timings = Timings()
+        self.foreign_keys = ForeignKeys()
 
         self.t = DbThread()
         self.t.ready_to_connect.connect(self.on_ready_to_connect)
-        self.t.db_list_updated.connect(self.on_dbs_list)
         self.t.query_result.connect(self.on_query_result)
+        self.t.query_result_batch.connect(self.on_query_result_batch)
         self.t.use_db.connect(self.on_use_db)
         self.t.error.connect(self.on_error)
         self.t.info.connect(self.on_info)
         self.t.execute.connect(self.on_query)
-        self.t.table_list_updated.connect(self.on_tables_list)
         self.t.running_query.connect(self.on_query_op)
+        self.t.connected.connect(self.on_connected)
+        self.t.schema_changed.connect(self.on_schema_changed)
+        self.t.committed.connect(self.on_committed)
+        self.t.has_more.connect(self.on_has_more)
+        self.t.timed.connect(self.on_timed)
         t = QtCore.QThread()
         t.setObjectName(f'Connection thread: {connection}')
         self.t.moveToThread(t)
@@ -414,49 +630,130 @@ class ConnectionTab(QtWidgets.QWidget):
         # t.destroyed.connect(self.destroyed)
         t.start()
         self.thread = t
+
+        self.meta = MetaThread(connection)
+        self.meta.db_list_updated.connect(self.on_dbs_list)
+        self.meta.table_list_updated.connect(self.on_tables_list)
+        self.meta.schema_loaded.connect(self.on_schema_loaded)
+        self.meta.names_loaded.connect(self.textEdit.setSchemaNames)
+        self.meta.query_result.connect(self.on_query_result)
+        self.meta.error.connect(self.on_error)
+        self.meta.info.connect(self.on_info)
+        self.meta_thread = self._start_worker(self.meta, f'Metadata thread: {connection}')
+
+        self.killer = QueryKiller(connection)
+        self.killer.error.connect(self.on_error)
+        self.killer.info.connect(self.on_info)
+        self.killer_thread = self._start_worker(self.killer, f'Cancel thread: {connection}')
+
+        self.exporter = ExportThread(connection)
+        self.exporter.error.connect(self.on_error)
+        self.exporter.info.connect(self.on_info)
+        self.exporter.connected.connect(self.on_export_connected)
+        self.exporter.progress.connect(self.on_export_progress)
+        self.exporter.finished.connect(self.on_export_finished)
+        self.export_thread = self._start_worker(self.exporter, f'Export thread: {connection}')
         self.destroyed.connect(self.close)
 
+    def _start_worker(self, worker: QtCore.QObject, name: str) -> QtCore.QThread:
+        thread = QtCore.QThread()
+        thread.setObjectName(name)
+        worker.moveToThread(thread)
+        thread.finished.connect(worker.deleteLater)
+        thread.start()
+        return thread
+
     def on_ready_to_connect(self):
         self.t.job.emit('connect', '', '', self.connection.toDict())
 
+    def _is_loaded(self, db: Optional[str], table: Optional[str]) -> bool:
+        if db is None or table is None:
+            return False
+        info = self.schemas.get(db, {}).get(table)
+        return info is not None and info.loaded
+
     def on_goto_reference(self, column_name: str, value: Union[str, int]):
-        self.t.job.emit('get_reference', column_name, value, {})
+        result = self.tableWidget.result_model.result
+        if not self._is_loaded(result.db, result.table):
+            self.t.job.emit('get_reference', column_name, value, {})
+            return
+
+        target = self.foreign_keys.reference(result.db, result.table, column_name)
+        if target is None:
+            self.on_error(f'{result.table}.{column_name} does not reference another table')
+            return
+        schema, table, column = target
+        self.t.job.emit('get_reference', column_name, value, {'schema': schema, 'table': table, 'column': column})
+
+    def on_find_referencing(self, column_name: str, value: str):
+        result = self.tableWidget.result_model.result
+        if not self._is_loaded(result.db, result.table):
+            self.on_error('Schema of the result is not loaded yet')
+            return
+
+        refs = self.foreign_keys.referencing(result.db, result.table, column_name)
+        if not refs:
+            self.on_error(f'No tables reference {result.table}.{column_name}')
+            return
+        self.meta.job.emit(MetaThread.PRIORITY_INTERACTIVE, 'referencing_rows', '', {
+            'refs': [list(ref) for ref in refs],
+            'value': value,
+        })
 
-    def on_edit_cell(self, column_name: str, record: Dict[str, str]):
+    def on_edit_cell(self, column_name: str, record: RowView):
         self.stackedWidget.setCurrentIndex(1)
         self.editpage.set_text(str(record[column_name]))
         self.editing_record = record
         self.editing_column = column_name
 
     def on_edit_cell_save(self, value: str):
-        if self.editing_column is None or self.editing_column is None:
-            return
-        self.t.job.emit('update', self.editing_column, json.dumps(value), dict(self.editing_record))
-        self.stackedWidget.setCurrentIndex(0)
-        self.tableWidget.updateRecord(self.editing_record, value)
+        self._edit_cell(value)
 
     def on_edit_cell_null(self):
-        if self.editing_column is None or self.editing_column is None:
+        self._edit_cell(None)
+
+    def _edit_cell(self, value: Optional[str]):
+        if self.editing_record is None or self.editing_column is None:
+            return
+        try:
+            self.edits.add(self.editing_record.result, self.editing_record.idx, self.editing_column, value)
+        except RuntimeError as err:
+            self.on_error(str(err))
             return
-        self.t.job.emit('update', self.editing_column, json.dumps(None), dict(self.editing_record))
         self.stackedWidget.setCurrentIndex(0)
+        self.tableWidget.result_model.refresh_row(self.editing_record.idx)
 
     def on_edit_cell_cancel(self):
         self.stackedWidget.setCurrentIndex(0)
 
     def on_commit(self):
-        self.t.job.emit('commit', '', '', {})
-        self.textBrowser.append('Commited')
+        self.t.job.emit('commit', '', '', {'edits': self.edits.pending()})
+
+    def on_committed(self):
+        self.textBrowser.append(f'Commited {len(self.edits)} edited rows' if self.edits else 'Commited')
+        self.edits.clear()
+        self.tableWidget.result_model.refresh()
 
     def on_rollback(self):
         self.t.job.emit('rollback', '', '', {})
+        self.edits.revert()
+        self.tableWidget.result_model.refresh()
         self.textBrowser.append('Rolled back')
 
     def request_tables(self, db_name: str):
-        self.t.job.emit('table_list', db_name, '', {})
+        self.meta.job.emit(MetaThread.PRIORITY_INTERACTIVE, 'table_list', db_name, {})
 
+    @tracing.traced('ConnectionTab.run_query')
     def run_query(self, query: str):
-        self.t.job.emit('query', query, '', {})
+        if query.strip() == '\\timings':
+            self.show_timings()
+            return
+        self._query_job('query', query)
+
+    def _query_job(self, request_type: str, params: str):
+        trace = tracing.new_flow()
+        tracing.flow('query', trace, 's')
+        self.t.job.emit(request_type, params, '', {'queued': monotonic(), 'trace': trace})
 
     def render(self):
         self.setStyleSheet("#connection_tab {\n"
@@ -510,9 +807,29 @@ class ConnectionTab(QtWidgets.QWidget):
                                     "")
         self.comboBox.setFrame(False)
         self.comboBox.setObjectName("comboBox")
+        # typing filters the databases in a popup
+        self.comboBox.setEditable(True)
+        self.comboBox.setInsertPolicy(QtWidgets.QComboBox.NoInsert)
+        self.comboBox.completer().setFilterMode(QtCore.Qt.MatchContains)
+        self.comboBox.completer().setCompletionMode(QtWidgets.QCompleter.PopupCompletion)
+        self.comboBox.view().setUniformItemSizes(True)
+        self.comboBox.view().setLayoutMode(QtWidgets.QListView.Batched)
+        self.comboBox.view().setBatchSize(1000)
         self.comboBox.currentIndexChanged.connect(self.on_db_selected)
         self.dataviews.addWidget(self.comboBox)
-        self.listView = QtWidgets.QListWidget(self.tables_and_buttons)
+        self.table_filter = QtWidgets.QLineEdit(self.tables_and_buttons)
+        self.table_filter.setStyleSheet("QLineEdit {\n"
+                                        "background: #fff;\n"
+                                        "border: 1px solid #ddd;\n"
+                                        "border-top: none;\n"
+                                        "padding: 3px;\n"
+                                        "}")
+        self.table_filter.setPlaceholderText('Filter tables')
+        self.table_filter.setClearButtonEnabled(True)
+        self.table_filter.setObjectName("table_filter")
+        self.table_filter.textChanged.connect(self.on_table_filter)
+        self.dataviews.addWidget(self.table_filter)
+        self.listView = QtWidgets.QListView(self.tables_and_buttons)
         self.listView.setMinimumSize(QtCore.QSize(100, 0))
         self.listView.setMaximumSize(QtCore.QSize(150, 16777215))
         self.listView.setStyleSheet("QListView {\n"
@@ -526,6 +843,10 @@ class ConnectionTab(QtWidgets.QWidget):
         self.listView.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
         self.listView.setSelectionMode(QtWidgets.QAbstractItemView.SingleSelection)
         self.listView.setSelectionRectVisible(True)
+        # rows are laid out a batch at a time between events, only the visible ones are painted
+        self.listView.setUniformItemSizes(True)
+        self.listView.setLayoutMode(QtWidgets.QListView.Batched)
+        self.listView.setBatchSize(1000)
         self.listView.setObjectName("listView")
         self.listView.doubleClicked.connect(self.on_table_dblclick)
         self.listView.clicked.connect(self.on_table_click)
@@ -547,6 +868,25 @@ class ConnectionTab(QtWidgets.QWidget):
         self.pushButton_3.setObjectName("pushButton_3")
         self.pushButton_3.clicked.connect(self.on_rollback)
         self.dataviews.addWidget(self.pushButton_3)
+        self.cancel_button = QtWidgets.QPushButton(self.tables_and_buttons)
+        self.cancel_button.setIcon(self.style().standardIcon(QtWidgets.QStyle.SP_BrowserStop))
+        self.cancel_button.setStyleSheet('font-weight: bold')
+        self.cancel_button.setObjectName("cancel_button")
+        self.cancel_button.setEnabled(False)
+        self.cancel_button.clicked.connect(self.on_cancel)
+        self.dataviews.addWidget(self.cancel_button)
+        self.export_button = QtWidgets.QPushButton(self.tables_and_buttons)
+        self.export_button.setIcon(self.style().standardIcon(QtWidgets.QStyle.SP_DialogSaveButton))
+        self.export_button.setStyleSheet('font-weight: bold')
+        self.export_button.setObjectName("export_button")
+        self.export_button.clicked.connect(self.on_export_click)
+        self.dataviews.addWidget(self.export_button)
+        self.script_button = QtWidgets.QPushButton(self.tables_and_buttons)
+        self.script_button.setIcon(self.style().standardIcon(QtWidgets.QStyle.SP_DialogOpenButton))
+        self.script_button.setStyleSheet('font-weight: bold')
+        self.script_button.setObjectName("script_button")
+        self.script_button.clicked.connect(self.on_script_click)
+        self.dataviews.addWidget(self.script_button)
         self.tables.addWidget(self.tables_and_buttons)
         self.stackedWidget = QtWidgets.QStackedWidget(self.layoutWidget)
         self.stackedWidget.setObjectName("stackedWidget")
@@ -555,9 +895,13 @@ class ConnectionTab(QtWidgets.QWidget):
         self.horizontalLayout_3 = QtWidgets.QHBoxLayout(self.tablepage)
         self.horizontalLayout_3.setContentsMargins(0, 0, 0, 0)
         self.horizontalLayout_3.setObjectName("horizontalLayout_3")
+        self.edits = EditBuffer()
         self.tableWidget = TableWidget(self.tablepage)
         self.tableWidget.render()
+        self.tableWidget.result_model.edits = self.edits
         self.tableWidget.goto_reference.connect(self.on_goto_reference)
+        self.tableWidget.result_model.need_more.connect(self.on_need_more)
+        self.tableWidget.find_referencing.connect(self.on_find_referencing)
         self.tableWidget.edit_cell.connect(self.on_edit_cell)
         self.horizontalLayout_3.addWidget(self.tableWidget)
         self.stackedWidget.addWidget(self.tablepage)
@@ -595,6 +939,9 @@ class ConnectionTab(QtWidgets.QWidget):
 
         self.pushButton_2.setText('Commit changes')
         self.pushButton_3.setText('Rollback')
+        self.cancel_button.setText('Cancel query')
+        self.export_button.setText('Export')
+        self.script_button.setText('Run script')
         self.textBrowser.setHtml('')
         self.textEdit.setPlainText('')
 
@@ -632,31 +979,34 @@ class InputBox(QtWidgets.QPlainTextEdit):
         self.setObjectName("textEdit")
         self.installEventFilter(self)
         self.autocomplete_state: List[Any] = []
-        self.tables_list: List[str] = []
-        self.db_list: List[str] = []
+        self.completion = CompletionIndex()
+        self.current_db: Optional[str] = None
         self.history_cursor: int = 0
         self.history: List[str] = []
         self.highlighter = Highlighter(self.document())
+        self.updateRequest.connect(self.on_update_request)
+
+    def on_update_request(self, rect: QtCore.QRect, dy: int):
+        first = self.firstVisibleBlock().blockNumber()
+        last = first + self.viewport().height() // max(1, self.fontMetrics().height())
+        if (first, last) != (self.highlighter.first_visible, self.highlighter.last_visible):
+            self.highlighter.set_visible(first, last)
+
+    def setTables(self, db: str, tables: List[str]):
+        self.current_db = db
+        self.highlighter.set_highlight_rules_gdb_items(tables, 'Table')
+
+    def setColumns(self, columns: Iterable[str]):
+        self.highlighter.set_highlight_rules_gdb_items(columns, 'Column')
 
-    def setTables(self, tables: List[str]):
-        self.tables_list = tables
+    def setDbTables(self, db: str, tables: List[str]):
+        self.completion.set_tables(db, tables)
+
+    def setSchemaNames(self, db: str, names: SchemaNames):
+        self.completion.set_schema(db, names)
 
     def setDbList(self, dbs: List[str]):
-        self.db_list = dbs
-
-    SQL = [
-        'USE',
-        'SELECT',
-        'FROM',
-        'IN',
-        'WHERE',
-        'GROUP',
-        'BY',
-        'INSERT',
-        'UPDATE',
-        'TABLE',
-        'VALUES',
-    ]
+        self.completion.set_databases(dbs)
 
     def prev_command(self, inc: int = -1) -> None:
         self.history_cursor += inc
@@ -681,7 +1031,8 @@ class InputBox(QtWidgets.QPlainTextEdit):
                     text = self.toPlainText()
                     self.history.append(text)
                     self.history_cursor = 0
-                    self.query.emit(text)
+                    with tracing.span('InputBox.query'):
+                        self.query.emit(text)
                     self.setPlainText('')
                     return True
 
@@ -704,59 +1055,24 @@ class InputBox(QtWidgets.QPlainTextEdit):
 
         return QtWidgets.QMainWindow.eventFilter(self, source, event)
 
-    def autocomplete(self, forward):
+    def autocomplete(self, forward: bool):
+        """Replace the word before the cursor with its best completion, pressing Tab again cycles."""
+        cursor = self.textCursor()
         if self.autocomplete_state:
-            [words, after_cursor, word, matches, matches, idx] = self.autocomplete_state
-
-            len_matches = len(matches)
-            if forward:
-                idx += 1
-            if not forward:
-                idx += len_matches - 1
-
-            idx = idx % len_matches
-
-            self.autocomplete_state = [list(words), after_cursor, word, matches, matches, idx]
-
-            words.append(matches[idx])
-            match = matches[idx]
-            before_cursor = ' '.join(words)
-            self.setPlainText(before_cursor + after_cursor)
-            cursor = self.textCursor()
-            cursor.setPosition(len(before_cursor))
-            self.setTextCursor(cursor)
-            return
-
-        pos = self.textCursor().position()
-        text = self.toPlainText()
-        before_cursor, after_cursor = text[:pos], text[pos:]
-        words = before_cursor.split(' ')
-        word = words.pop().lower()
-        wl = len(word)
-        candidates = [s + ' ' for s in self.SQL] + [db for db in self.db_list]
-        if '.' in word:
-            db_name = word.split('.')[0]
-            self.need_tables.emit(db_name)
-            tables = self.tables_list
-            candidates += [db_name + '.' + table + ' ' for table in tables]
+            start, matches, idx = self.autocomplete_state
+            idx = (idx + (1 if forward else -1)) % len(matches)
         else:
-            candidates += [table + ' ' for table in self.tables_list]
-
-        matches = [w for w in candidates if w[:wl % len(w)].lower() == word]
-        if len(matches) == 0:
-            return
-
-        match = matches[0]
-        if len(matches) != 1:
-            match = matches[0]
-            self.autocomplete_state = [list(words), after_cursor, word, matches, matches, 0]
+            completions = self.completion.complete(self.toPlainText(), cursor.position(), self.current_db)
+            if completions.missing_db is not None:
+                self.need_tables.emit(completions.missing_db)
+            if not completions.matches:
+                return
+            start, matches, idx = completions.start, completions.matches, 0
 
-        words.append(match)
-        before_cursor = ' '.join(words)
-        self.setPlainText(before_cursor + after_cursor)
-        cursor = self.textCursor()
-        cursor.setPosition(len(before_cursor))
+        cursor.setPosition(start, QtGui.QTextCursor.KeepAnchor)
+        cursor.insertText(matches[idx])
         self.setTextCursor(cursor)
+        self.autocomplete_state = [start, matches, idx] if len(matches) > 1 else []
 
 
 class EditPage(QtWidgets.QWidget):
@@ -829,12 +1145,201 @@ class EditPage(QtWidgets.QWidget):
         self.nulled.emit()
 
 
-class TableWidget(QtWidgets.QTableWidget):
+class ResultModel(QtCore.QAbstractTableModel):
+    need_more = QtCore.pyqtSignal(object)
+
+    DIRTY = QtGui.QFont()
+    DIRTY.setItalic(True)
+    DIRTY.setBold(True)
+
+    def __init__(self, parent: QtCore.QObject = None):
+        super().__init__(parent)
+        self.result = ResultSet()
+        self.edits: Optional[EditBuffer] = None
+        self.column_count = 0
+        self.row_count = 0
+        self.more_available = False
+
+    def rowCount(self, parent: QtCore.QModelIndex = QtCore.QModelIndex()) -> int:
+        if parent.isValid():
+            return 0
+        return self.row_count
+
+    def columnCount(self, parent: QtCore.QModelIndex = QtCore.QModelIndex()) -> int:
+        if parent.isValid():
+            return 0
+        return self.column_count
+
+    def data(self, index: QtCore.QModelIndex, role: int = QtCore.Qt.DisplayRole):
+        if role == QtCore.Qt.FontRole:
+            if self.edits and self.edits.is_dirty(self.result, index.row(), self.column_name(index.column())):
+                return self.DIRTY
+            return None
+        if role != QtCore.Qt.DisplayRole:
+            return None
+        value = self.result.value(index.row(), index.column())
+        if value is None:
+            return ''
+        return str(value)
+
+    def headerData(self, section: int, orientation: QtCore.Qt.Orientation, role: int = QtCore.Qt.DisplayRole):
+        if role != QtCore.Qt.DisplayRole:
+            return None
+        if orientation == QtCore.Qt.Horizontal:
+            return self.result.columns[section]
+        return section + 1
+
+    def flags(self, index: QtCore.QModelIndex) -> QtCore.Qt.ItemFlags:
+        return QtCore.Qt.ItemIsEnabled | QtCore.Qt.ItemIsSelectable
+
+    def canFetchMore(self, parent: QtCore.QModelIndex) -> bool:
+        return not parent.isValid() and self.more_available
+
+    def fetchMore(self, parent: QtCore.QModelIndex) -> None:
+        if not self.canFetchMore(parent):
+            return
+        self.more_available = False
+        self.need_more.emit(self.result)
+
+    def set_more(self, result: ResultSet, more_available: bool) -> None:
+        if result is self.result:
+            self.more_available = more_available
+
+    def set_data(self, result: ResultSet) -> None:
+        self.beginResetModel()
+        self.result = result
+        self.more_available = False
+        self.column_count = len(result.columns)
+        self.row_count = len(result)
+        self.endResetModel()
+
+    def append(self, result: ResultSet, row_count: int) -> None:
+        if result is not self.result:
+            return
+
+        column_count = len(result.columns)
+        if column_count > self.column_count:
+            self.beginInsertColumns(QtCore.QModelIndex(), self.column_count, column_count - 1)
+            self.column_count = column_count
+            self.endInsertColumns()
+
+        if row_count <= self.row_count:
+            return
+        self.beginInsertRows(QtCore.QModelIndex(), self.row_count, row_count - 1)
+        self.row_count = row_count
+        self.endInsertRows()
+
+    def column_name(self, col: int) -> str:
+        return self.result.columns[col]
+
+    def record(self, row: int) -> RowView:
+        return RowView(self.result, row)
+
+    def refresh_row(self, row: int) -> None:
+        self.dataChanged.emit(self.index(row, 0), self.index(row, self.column_count - 1))
+
+    def refresh(self) -> None:
+        if self.row_count and self.column_count:
+            self.dataChanged.emit(self.index(0, 0), self.index(self.row_count - 1, self.column_count - 1))
+
+
+def sample_rows(start: int, end: int, size: int) -> List[int]:
+    """The first and last `size` rows of a range and `size` random rows in between."""
+    if end - start <= 3 * size:
+        return list(range(start, end))
+    return (list(range(start, start + size)) + random.sample(range(start + size, end - size), size)
+            + list(range(end - size, end)))
+
+
+class CharWidths(dict):
+    """Advance of each character in a font, measured on first use."""
+
+    def __init__(self, metrics: QtGui.QFontMetrics):
+        super().__init__()
+        self.metrics = metrics
+
+    def __missing__(self, char: str) -> int:
+        width = self[char] = self.metrics.horizontalAdvance(char)
+        return width
+
+
+class ColumnWidths():
+    """Column widths estimated from sampled rows, instead of measuring every cell.
+
+    Numbers are measured by their length in digits, dates and times by
+    their longest value, and are at least as wide as their format. Only the
+    widest other values are laid out with the font. Widths only grow as
+    more rows are measured and stop at `max_width`.
+    """
+
+    max_width = 400
+    candidates = 8
+
+    FORMATS = {
+        FIELD_TYPE.DATE: '0000-00-00',
+        FIELD_TYPE.NEWDATE: '0000-00-00',
+        FIELD_TYPE.DATETIME: '0000-00-00 00:00:00',
+        FIELD_TYPE.TIMESTAMP: '0000-00-00 00:00:00',
+        FIELD_TYPE.TIME: '-000:00:00',
+        FIELD_TYPE.YEAR: '0000',
+    }
+    NUMERIC = {
+        FIELD_TYPE.TINY, FIELD_TYPE.SHORT, FIELD_TYPE.LONG, FIELD_TYPE.INT24, FIELD_TYPE.LONGLONG,
+        FIELD_TYPE.FLOAT, FIELD_TYPE.DOUBLE, FIELD_TYPE.DECIMAL, FIELD_TYPE.NEWDECIMAL,
+    }
+
+    def __init__(self, result: ResultSet, metrics: QtGui.QFontMetrics, padding: int, minimum: List[int]):
+        self.result = result
+        self.metrics = metrics
+        self.padding = padding
+        self.digit = metrics.horizontalAdvance('0')
+        self.char_widths = CharWidths(metrics)
+        self.widths = list(minimum)
+        for col, field_type in enumerate(result.columns.types):
+            if field_type in self.FORMATS:
+                self._grow(col, metrics.horizontalAdvance(self.FORMATS[field_type]))
+
+    def _grow(self, col: int, text_width: int):
+        width = min(text_width + self.padding, self.max_width)
+        if width > self.widths[col]:
+            self.widths[col] = width
+
+    def measure(self, rows: Sequence[int]) -> None:
+        """Widen the columns to fit the values of these rows.
+
+        Text values are ranked by the widths of their characters, only the
+        `candidates` widest are laid out with the font.
+        """
+        types = self.result.columns.types
+        value = self.result.value
+        for col, field_type in enumerate(types):
+            texts = [str(cell) for cell in (value(row, col) for row in rows) if cell is not None]
+            if not texts:
+                continue
+            if field_type in self.NUMERIC:
+                self._grow(col, max(map(len, texts)) * self.digit)
+            elif field_type in self.FORMATS:
+                self._grow(col, self.metrics.horizontalAdvance(max(texts, key=len)))
+            else:
+                self._grow(col, self._widest(texts))
+
+    def _widest(self, texts: List[str]) -> int:
+        """Width of the widest text, ranked by the sum of its character widths and measured exactly."""
+        shortest = max(map(len, texts)) * 3 // 4
+        advance = self.char_widths.__getitem__
+        candidates = heapq.nlargest(
+            self.candidates, (text for text in texts if len(text) >= shortest),
+            key=lambda text: sum(map(advance, text)))
+        return max(map(self.metrics.horizontalAdvance, candidates))
+
+
+class TableWidget(QtWidgets.QTableView):
     goto_reference = QtCore.pyqtSignal(str, str)
-    edit_cell = QtCore.pyqtSignal(str, dict)
+    find_referencing = QtCore.pyqtSignal(str, str)
+    edit_cell = QtCore.pyqtSignal(str, object)
 
-    def update_record(self, record: Dict[str, str]):
-        self.dataChanged
+    SAMPLE_ROWS = 100  # rows measured from each of the head, the tail and the middle of a result
+    PAGE_ROWS = 64
 
     def render(self):
         sizePolicy = QtWidgets.QSizePolicy(QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Expanding)
@@ -846,7 +1351,7 @@ class TableWidget(QtWidgets.QTableWidget):
         font = QtGui.QFont()
         font.setPointSize(10)
         self.setFont(font)
-        self.setStyleSheet("QTableWidget {\n"
+        self.setStyleSheet("QTableView {\n"
                            "    background: rgba(255,255,255,1);\n"
                            "    color: #272343;\n"
                            "border: 1px solid #ddd;\n"
@@ -855,9 +1360,9 @@ class TableWidget(QtWidgets.QTableWidget):
                            "font-size: 8pt;\n"
                            "}\n"
                            "\n"
-                           "QTableWidget QTableCornerButton::section,\n"
-                           "QTableWidget QHeaderView,\n"
-                           "QTableWidget QHeaderView::section\n"
+                           "QTableView QTableCornerButton::section,\n"
+                           "QTableView QHeaderView,\n"
+                           "QTableView QHeaderView::section\n"
                            "{\n"
                            "    color: #131C26;\n"
                            "font-size: 8pt;\n"
@@ -869,31 +1374,31 @@ class TableWidget(QtWidgets.QTableWidget):
                            "\n"
                            "}\n"
                            "\n"
-                           "QTableWidget QTableCornerButton::section {\n"
+                           "QTableView QTableCornerButton::section {\n"
                            "    /* background: #272343; */\n"
                            "    border-style: none;\n"
                            "    border-bottom: 1px solid #ddd;\n"
                            "    border-right: 1px solid #ddd;\n"
                            "}\n"
                            "\n"
-                           "QTableWidget QHeaderView {\n"
+                           "QTableView QHeaderView {\n"
                            "    font-weight: bold;\n"
                            "border-radius: 10px;\n"
                            "}\n"
                            "\n"
-                           "QTableWidget QHeaderView::section:selected {\n"
+                           "QTableView QHeaderView::section:selected {\n"
                            "    background: #fff;\n"
                            "}\n"
                            "\n"
-                           "QTableWidget QHeaderView::section:checked {\n"
+                           "QTableView QHeaderView::section:checked {\n"
                            "    background: transparent;\n"
                            "}\n"
                            "\n"
-                           "QTableWidget QHeaderView::section:hover:!selected {\n"
+                           "QTableView QHeaderView::section:hover:!selected {\n"
                            "    background: #fff;\n"
                            "}\n"
                            "\n"
-                           "QTableWidget QHeaderView::section::item {\n"
+                           "QTableView QHeaderView::section::item {\n"
                            "    padding: 0 4px;\n"
                            "}\n"
                            "\n"
@@ -905,57 +1410,57 @@ class TableWidget(QtWidgets.QTableWidget):
                             "    border-right: 1px solid #ddd;\n"
                             "}\n"
                             "\n"
-                            "QTableWidget QHeaderView::item {\n"
+                            "QTableView QHeaderView::item {\n"
                             "    color: #131C26;\n"
                             "    font-weight: bold;\n"
                             "    text-align: right;\n"
                             "    padding: 0 4px;\n"
                             "}\n"
                             "\n"
-                            "QTableWidget QHeaderView::item:hover:!selected {\n"
+                            "QTableView QHeaderView::item:hover:!selected {\n"
                             "    background: rgba(250,250,250,0.8);\n"
                             "}\n"
                             "\n"
-                            "QTableWidget QHeaderView::item:active {\n"
+                            "QTableView QHeaderView::item:active {\n"
                             "    background: rgba(250,250,250,0.8);\n"
                             "}\n"
                             "\n"
-                            "QTableWidget QHeaderView::item:active {\n"
+                            "QTableView QHeaderView::item:active {\n"
                             "    background: rgba(250,250,250,0.8);\n"
                             "}\n"
                             "\n"
-                            "QTableWidget::item {\n"
+                            "QTableView::item {\n"
                             "    border-right: 1px solid #ddd;\n"
                             "    border-bottom: 1px solid #ddd;\n"
                             "    color: #272343;\n"
                             "    background: rgba(250,250,250,0.9);\n"
                             "}\n"
                             "\n"
-                            "QTableWidget::item:hover {\n"
+                            "QTableView::item:hover {\n"
                             "    background: rgba(250,250,250,1);\n"
                             "}\n"
                             "\n"
-                            "QTableWidget::item:selected:!active {\n"
+                            "QTableView::item:selected:!active {\n"
                             "    color: #fff;\n"
                             "    background: rgba(250,250,250,1);\n"
                             "}\n"
                             "\n"
-                            "QTableWidget::item:focus {\n"
+                            "QTableView::item:focus {\n"
                             "    color: #1B4060;\n"
                             "    background-color: #fff;\n"
                             "}\n"
                             "\n"
-                            "QTableWidget::item:active {\n"
+                            "QTableView::item:active {\n"
                             "    color: #1B4060;\n"
                             "    background-color: #fff;\n"
                             "}\n"
                             "\n"
-                            "QTableWidget::item:selected:active {\n"
+                            "QTableView::item:selected:active {\n"
                             "    color: #fff;\n"
                             "    background-color: #1B4060;\n"
                             "}\n"
                             "\n"
-                            "QTableWidget::item:selected {\n"
+                            "QTableView::item:selected {\n"
                             "    color: #fff;\n"
                             "    background-color: #1B4060;\n"
                             "}\n"
@@ -965,66 +1470,118 @@ class TableWidget(QtWidgets.QTableWidget):
         self.setFrameShadow(QtWidgets.QFrame.Raised)
         self.setShowGrid(False)
         self.setObjectName("tableWidget")
-        self.cellClicked.connect(self.on_click)
-        self.cellDoubleClicked.connect(self.on_dbl_click)
-
-    def set_data(self, data: List[Tuple]) -> None:
-        self.clear()
-        row_count = len(data)
-
-        if row_count == 0:
-            self.setRowCount(0)
-            self.setColumnCount(0)
+        self.setWordWrap(False)
+        self.verticalHeader().setSectionResizeMode(QtWidgets.QHeaderView.Fixed)
+        self.result_model = ResultModel(self)
+        self.setModel(self.result_model)
+        self.column_widths: Optional[ColumnWidths] = None
+        self.user_sized: Set[int] = set()
+        self.measured_pages: Set[int] = set()
+        self.resizing = False
+        # rows scrolled into view are measured once scrolling pauses, not in every frame
+        self.measure_timer = QtCore.QTimer(self)
+        self.measure_timer.setSingleShot(True)
+        self.measure_timer.setInterval(100)
+        self.measure_timer.timeout.connect(self._measure_visible)
+        self.horizontalHeader().sectionResized.connect(self.on_section_resized)
+        self.verticalScrollBar().valueChanged.connect(self.on_scroll)
+        self.clicked.connect(self.on_click)
+        self.doubleClicked.connect(self.on_dbl_click)
+
+    @tracing.traced('TableWidget.set_data')
+    def set_data(self, result: ResultSet) -> None:
+        self.result_model.set_data(result)
+        self.column_widths = None
+        self.user_sized = set()
+        self.measured_pages = set()
+        if result.columns:
+            with tracing.span('estimate column widths'):
+                self.column_widths = ColumnWidths(
+                    result, self.fontMetrics(), self._cell_padding(),
+                    [self.horizontalHeader().sectionSizeHint(col) for col in range(len(result.columns))])
+                self._measure(sample_rows(0, len(result), self.SAMPLE_ROWS))
+
+    def append_data(self, result: ResultSet, row_count: int) -> None:
+        start = self.result_model.row_count
+        self.result_model.append(result, row_count)
+        if self.column_widths is not None and self.column_widths.result is result and row_count > start:
+            if len(result.columns) != len(self.column_widths.widths):
+                self.set_data(result)
+                return
+            self._measure(sample_rows(start, row_count, self.SAMPLE_ROWS // 2))
+
+    def _cell_padding(self) -> int:
+        """Width a cell adds around its text, with the margins and borders of the style sheet.
+
+        Taken from the cells of the first row, plus a pixel for the delegate
+        rounding fractional text widths up, so measured text is not elided.
+        """
+        padding = 2 * self.style().pixelMetric(QtWidgets.QStyle.PM_FocusFrameHMargin) + 2
+        delegate, option, metrics = self.itemDelegate(), self.viewOptions(), self.fontMetrics()
+        for col in range(self.result_model.column_count if self.result_model.row_count else 0):
+            index = self.result_model.index(0, col)
+            padding = max(padding, delegate.sizeHint(option, index).width() - metrics.horizontalAdvance(index.data()))
+        return padding + 1
+
+    def _measure(self, rows: List[int]) -> None:
+        """Measure more rows and widen the columns they do not fit, except those resized by hand."""
+        widths = self.column_widths
+        widths.measure(rows)
+        self.resizing = True
+        try:
+            for col, width in enumerate(widths.widths):
+                if col not in self.user_sized and width != self.columnWidth(col):
+                    self.setColumnWidth(col, width)
+        finally:
+            self.resizing = False
+
+    def _measure_visible(self) -> None:
+        """Measure the rows scrolled into view, a page at a time, each page once."""
+        if self.column_widths is None:
             return
-
-        self.setRowCount(row_count - 1)
-
-        i = iter(data)
-        header = next(i)
-
-        self.setColumnCount(len(header))
-        self.setHorizontalHeaderLabels(header)
-
-        for row, item in enumerate(i):
-            for col, val in enumerate(item):
-                record = dict(zip(header, item))
-                self.setItem(row, col, TableItem(header[col], col, record))
-        self.resizeColumnsToContents()
-
-    def on_click(self):
+        first = max(0, self.rowAt(0))
+        last = self.rowAt(self.viewport().height())
+        if last < 0:
+            last = self.result_model.row_count - 1
+        pages = set(range(first // self.PAGE_ROWS, last // self.PAGE_ROWS + 1)) - self.measured_pages
+        if not pages:
+            return
+        self.measured_pages |= pages
+        row_count = self.result_model.row_count
+        self._measure([
+            row
+            for page in sorted(pages)
+            for row in range(page * self.PAGE_ROWS, min(row_count, (page + 1) * self.PAGE_ROWS))])
+
+    def on_section_resized(self, col: int, old_size: int, new_size: int):
+        if not self.resizing:
+            self.user_sized.add(col)
+
+    def set_more(self, result: ResultSet, more_available: bool) -> None:
+        self.result_model.set_more(result, more_available)
+        self.on_scroll(self.verticalScrollBar().value())
+
+    def on_scroll(self, value: int):
+        scrollbar = self.verticalScrollBar()
+        if value >= scrollbar.maximum() - 2 * scrollbar.pageStep():
+            self.result_model.fetchMore(QtCore.QModelIndex())
+        if self.column_widths is not None:
+            self.measure_timer.start()
+
+    def on_click(self, index: QtCore.QModelIndex):
         modifiers = QtGui.QGuiApplication.queryKeyboardModifiers()
         if modifiers == QtCore.Qt.AltModifier:
-            selected = self.selectedItems()
-            for item in selected:
-                self.goto_reference.emit(item.column_name, str(item.record[item.column_name]))
-                return
-
-    def on_dbl_click(self):
-        selected = self.selectedItems()
-        for item in selected:
-            self.edit_cell.emit(item.column_name, item.record)
-            return
-
-    def updateRecord(self, record, newValue: str):
-        selected = self.selectedItems()
-        for item in selected:
-            item.record[item.column_name] = newValue
-            item.setText(item.text())
-
-
-class TableItem(QtWidgets.QTableWidgetItem):
-    def __init__(self, column_name: str, idx: int, record: Dict['str', 'str']):
-        self.column_name = column_name
-        self.record = record
-        text = self.text()
-        super().__init__(text)
-
-        self.setFlags(QtCore.Qt.ItemIsEnabled | QtCore.Qt.ItemIsSelectable)
-
-    def text(self) -> str:
-        if self.record[self.column_name] is None:
-            return ''
-        return str(self.record[self.column_name])
+            column_name = self.result_model.column_name(index.column())
+            value = self.result_model.record(index.row())[column_name]
+            self.goto_reference.emit(column_name, str(value))
+        elif modifiers == QtCore.Qt.AltModifier | QtCore.Qt.ShiftModifier:
+            column_name = self.result_model.column_name(index.column())
+            value = self.result_model.record(index.row())[column_name]
+            self.find_referencing.emit(column_name, str(value))
+
+    def on_dbl_click(self, index: QtCore.QModelIndex):
+        column_name = self.result_model.column_name(index.column())
+        self.edit_cell.emit(column_name, self.result_model.record(index.row()))
 
 
 class ConnectionEdit(QtWidgets.QFrame):
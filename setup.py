@@ -18,6 +18,7 @@ setup(
     ],
     extras_require={
         'myloginpath': ['myloginpath'],
+        'arrow': ['pyarrow'],
     },
     entry_points={
         'console_scripts': [